@@ -1,50 +1,117 @@
 import streamlit as st
-import yfinance as yf
 from datetime import datetime, timedelta
 import pytz
-import plotly.graph_objects as go
 import pandas as pd
-import gspread
-from gspread.exceptions import WorksheetNotFound
-from google.oauth2.service_account import Credentials
-import FinanceDataReader as fdr
+import numpy as np
+import atexit
+import bisect
+import logging
+import copy
+import importlib
+import importlib.util
 import sys
+import os
+import random
+import re
+import sqlite3
+import time
+import zlib
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait as futures_wait
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
-# 트레이딩뷰 데이터피드 선택적 import
+# 무거운 모듈(yfinance, FDR, gspread, google-auth, plotly, tvdatafeed)은 처음 사용할 때 import
+# 서버 기동과 첫 화면 출력이 데이터 소스/구글 시트 라이브러리 로딩을 기다리지 않도록 함
+@st.cache_resource
+def get_lazy_load_timings():
+    """지연 로딩한 모듈/클라이언트별 첫 로딩 소요 시간 (프로세스 전체 공유, 이름 → 초)"""
+    return {}
+
+def _import_timed(module_name):
+    """모듈을 import하고 처음 로드된 경우 소요 시간을 기록"""
+    if module_name in sys.modules:
+        return importlib.import_module(module_name)
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    get_lazy_load_timings()[module_name] = time.perf_counter() - start
+    return module
+
+class _LazyModule:
+    """속성에 처음 접근할 때 실제 모듈을 import하는 대리 객체"""
+
+    def __init__(self, module_name):
+        self._module_name = module_name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = _import_timed(self._module_name)
+        return getattr(self._module, attr)
+
+yf = _LazyModule('yfinance')
+fdr = _LazyModule('FinanceDataReader')
+gspread = _LazyModule('gspread')
+service_account = _LazyModule('google.oauth2.service_account')
+go = _LazyModule('plotly.graph_objects')
+plotly_subplots = _LazyModule('plotly.subplots')
+
+# 트레이딩뷰 데이터피드 선택적 import (처음 트레이딩뷰 심볼을 조회할 때 한 번만 시도)
 # Windows에서 패키지 이름이 tvDatafeed(대소문자 구분)일 수 있으므로 두 가지 모두 시도
-try:
+@st.cache_resource(show_spinner=False)
+def get_tvdatafeed():
+    """tvdatafeed 모듈 반환 (설치되어 있지 않으면 None)"""
     try:
-        from tvdatafeed import TvDatafeed, Interval
-    except ImportError:
-        # tvDatafeed (대소문자 구분)로 재시도
-        from tvDatafeed import TvDatafeed, Interval
-    TV_AVAILABLE = True
-    print(f"[Success] tvdatafeed import 성공! Python: {sys.executable}")
-except ImportError as e:
-    TV_AVAILABLE = False
-    print(f"[Warning] tvdatafeed 모듈을 찾을 수 없습니다: {type(e).__name__}: {e}")
-    print(f"[Debug] Python 실행 경로: {sys.executable}")
-    print(f"[Debug] Python 경로 목록: {sys.path[:3]}...")  # 처음 3개만 표시
-    print("[Info] 설치 방법: pip install git+https://github.com/rongardF/tvdatafeed.git")
-    # 더미 클래스 정의 (에러 방지)
-    class Interval:
-        in_daily = None
-except Exception as e:
-    TV_AVAILABLE = False
-    print(f"[Error] tvdatafeed import 중 예상치 못한 오류: {type(e).__name__}: {e}")
-    print(f"[Debug] Python 실행 경로: {sys.executable}")
-    # 더미 클래스 정의 (에러 방지)
-    class Interval:
-        in_daily = None
-
-# 트레이딩뷰 데이터피드 초기화 (한 번만 실행)
-tv = None
-if TV_AVAILABLE:
-    try:
-        tv = TvDatafeed()
+        try:
+            module = _import_timed('tvdatafeed')
+        except ImportError:
+            # tvDatafeed (대소문자 구분)로 재시도
+            module = _import_timed('tvDatafeed')
+        print(f"[Success] tvdatafeed import 성공! Python: {sys.executable}")
+        return module
+    except ImportError as e:
+        print(f"[Warning] tvdatafeed 모듈을 찾을 수 없습니다: {type(e).__name__}: {e}")
+        print(f"[Debug] Python 실행 경로: {sys.executable}")
+        print(f"[Debug] Python 경로 목록: {sys.path[:3]}...")  # 처음 3개만 표시
+        print("[Info] 설치 방법: pip install git+https://github.com/rongardF/tvdatafeed.git")
     except Exception as e:
-        print(f"[TradingView Init Error] {str(e)}")
-        tv = None
+        print(f"[Error] tvdatafeed import 중 예상치 못한 오류: {type(e).__name__}: {e}")
+        print(f"[Debug] Python 실행 경로: {sys.executable}")
+    return None
+
+TV_INIT_RETRY_SECONDS = 5 * 60  # 클라이언트 생성에 실패하면 이 시간이 지난 뒤 다시 시도
+
+@st.cache_resource(show_spinner=False)
+def _tv_client_state():
+    """트레이딩뷰 클라이언트와 마지막 생성 실패 시각 (모든 세션 공유)"""
+    return {'client': None, 'failed_at': None, 'lock': threading.Lock()}
+
+def get_tv_client():
+    """트레이딩뷰 데이터피드 클라이언트 (처음 사용할 때 한 번만 생성, 모든 세션 공유)
+
+    초기화 실패는 캐시하지 않고 TV_INIT_RETRY_SECONDS 후 다시 시도
+    반환값: TvDatafeed 인스턴스 (모듈이 없거나 초기화에 실패하면 None)
+    """
+    state = _tv_client_state()
+    if state['client'] is not None:
+        return state['client']
+    tvdatafeed = get_tvdatafeed()
+    if tvdatafeed is None:
+        return None
+    with state['lock']:
+        if state['client'] is not None:
+            return state['client']
+        if state['failed_at'] is not None and time.time() - state['failed_at'] < TV_INIT_RETRY_SECONDS:
+            return None
+        try:
+            start = time.perf_counter()
+            state['client'] = tvdatafeed.TvDatafeed()
+            get_lazy_load_timings()['TvDatafeed()'] = time.perf_counter() - start
+            state['failed_at'] = None
+        except Exception as e:
+            print(f"[TradingView Init Error] {str(e)} ({TV_INIT_RETRY_SECONDS}초 후 재시도)")
+            state['failed_at'] = time.time()
+        return state['client']
 
 # 구글 시트 연결 설정
 # 방법 1: 서비스 계정 사용 (권장)
@@ -67,38 +134,53 @@ if TV_AVAILABLE:
 SPREADSHEET_ID = "1vlnPKjMiPaaYRLV18BS4D_pTPkAWXUP7_zdh14DZsiM"
 SHEET_NAME = "Sheet1"
 
-def get_gsheets_client():
-    """구글 시트 클라이언트 반환"""
+@st.cache_resource(show_spinner=False)
+def _authorize_gsheets():
+    """서비스 계정으로 구글 시트 클라이언트 생성 (처음 사용할 때 한 번만, 모든 세션 공유)
+
+    실패하면 예외를 그대로 올려 캐시하지 않음 (다음 호출에서 다시 시도)
+    """
+    # secrets.toml에서 서비스 계정 정보 읽기
+    if 'gsheets' not in st.secrets:
+        raise KeyError("secrets에 [gsheets] 섹션이 없습니다.")
+
+    # 디버깅: 비밀 키 값은 제외하고 어떤 키들이 있는지 확인
+    creds_info = dict(st.secrets['gsheets'])
+    # st.write(f"Debug: Found keys in secrets: {list(creds_info.keys())}")
+    
+    # private_key 형식 보정 (줄바꿈 문자가 제대로 처리되지 않았을 경우 대비)
+    if 'private_key' in creds_info:
+        pk = creds_info['private_key']
+        # 만약 문자열에 실제 줄바꿈이 없고 \n 문자만 있다면 치환 (일반적인 실수 방지)
+        if "\\n" in pk and "\n" not in pk:
+            creds_info['private_key'] = pk.replace("\\n", "\n")
+
+    scope = ['https://spreadsheets.google.com/feeds',
+            'https://www.googleapis.com/auth/drive']
+    start = time.perf_counter()
+    creds = service_account.Credentials.from_service_account_info(creds_info, scopes=scope)
+    client = gspread.authorize(creds)
+    get_lazy_load_timings()['gspread.authorize()'] = time.perf_counter() - start
+    return client
+
+def get_gsheets_client(show_error=False):
+    """구글 시트 클라이언트 반환 (연결할 수 없으면 None)
+
+    show_error: 연결 실패 원인을 화면에 표시할지 여부
+    """
     try:
-        # secrets.toml에서 서비스 계정 정보 읽기
-        if 'gsheets' in st.secrets:
-            # 디버깅: 비밀 키 값은 제외하고 어떤 키들이 있는지 확인
-            creds_info = dict(st.secrets['gsheets'])
-            # st.write(f"Debug: Found keys in secrets: {list(creds_info.keys())}")
-            
-            # private_key 형식 보정 (줄바꿈 문자가 제대로 처리되지 않았을 경우 대비)
-            if 'private_key' in creds_info:
-                pk = creds_info['private_key']
-                # 만약 문자열에 실제 줄바꿈이 없고 \n 문자만 있다면 치환 (일반적인 실수 방지)
-                if "\\n" in pk and "\n" not in pk:
-                    creds_info['private_key'] = pk.replace("\\n", "\n")
-
-            scope = ['https://spreadsheets.google.com/feeds',
-                    'https://www.googleapis.com/auth/drive']
-            creds = Credentials.from_service_account_info(creds_info, scopes=scope)
-            client = gspread.authorize(creds)
-            return client
-        else:
-            st.error("secrets에 [gsheets] 섹션이 없습니다.")
-            return None
+        return _authorize_gsheets()
+    except KeyError as e:
+        if show_error:
+            st.error(e.args[0])
+        return None
     except Exception as e:
-        import traceback
-        st.error(f"구글 시트 연결 오류 상세: {str(e)}")
-        st.code(traceback.format_exc())
+        if show_error:
+            import traceback
+            st.error(f"구글 시트 연결 오류 상세: {str(e)}")
+            st.code(traceback.format_exc())
         return None
 
-gsheets_client = get_gsheets_client()
-
 # 페이지 설정
 st.set_page_config(
     page_title="실시간 시황 대시보드",
@@ -137,116 +219,223 @@ st.markdown("""
     </style>
     """, unsafe_allow_html=True)
 
+# 관심 종목 설정 캐시 (구글 시트, 프로세스 전체 공유)
+# 새 세션마다 시트를 통째로 읽지 않고, 스프레드시트 수정 시각만 확인해 바뀐 경우에만 다시 읽음
+WATCHLIST_POLL_SECONDS = 30  # 이 시간 안에는 수정 시각도 확인하지 않고 캐시된 설정 사용
+WATCHLIST_COLUMNS = ['Category', 'TickerName', 'Symbol', 'Order', 'CategoryOrder']
+
+def parse_watchlist_values(all_values):
+    """시트 값(헤더 포함 2차원 리스트)을 관심 종목 설정으로 변환
+
+    반환값: {'market_data', 'category_order', 'ticker_order'} (유효한 행이 없으면 None)
+    """
+    if len(all_values) < 2:  # 헤더만 있거나 비어있음
+        return None
+    
+    # 첫 번째 행을 헤더로 사용
+    headers = all_values[0]
+    data_rows = all_values[1:]
+    
+    # DataFrame 생성
+    df = pd.DataFrame(data_rows, columns=headers)
+    
+    # 필요한 컬럼 확인
+    required_cols = WATCHLIST_COLUMNS
+    if not all(col in df.columns for col in required_cols):
+        # 컬럼이 없으면 첫 5개 컬럼을 사용 (CategoryOrder가 없으면 추가)
+        if len(df.columns) >= 4:
+            if len(df.columns) < 5:
+                # CategoryOrder 컬럼이 없으면 추가 (기본값 0)
+                df['CategoryOrder'] = 0
+            # 컬럼명 설정
+            col_names = required_cols[:len(df.columns)]
+            if len(df.columns) == 4:
+                col_names = required_cols[:4] + ['CategoryOrder']
+            df.columns = col_names[:len(df.columns)]
+        else:
+            return None
+    
+    # 빈 행 제거 (앞뒤 공백 제거 후 비어 있으면 제외)
+    df = df.dropna(subset=['Category', 'TickerName', 'Symbol'])
+    for col in ['Category', 'TickerName', 'Symbol']:
+        df[col] = df[col].astype(str).str.strip()
+    df = df[(df['Category'] != '') & (df['TickerName'] != '') & (df['Symbol'] != '')]
+    
+    if df.empty:
+        return None
+    
+    # Order/CategoryOrder를 숫자로 변환 (CategoryOrder가 없으면 맨 뒤로)
+    df['Order'] = pd.to_numeric(df['Order'], errors='coerce').fillna(0)
+    df['CategoryOrder'] = pd.to_numeric(df['CategoryOrder'], errors='coerce').fillna(999)
+    
+    # CategoryOrder와 Order로 정렬 (카테고리 순서 우선, 그 다음 티커 순서)
+    df = df.sort_values(by=['CategoryOrder', 'Order'], kind='stable')
+    
+    # 카테고리별로 묶어 설정 구성 (정렬된 순서 유지)
+    grouped = df.groupby('Category', sort=False)
+    names = grouped['TickerName'].agg(list)
+    symbols = grouped['Symbol'].agg(list)
+    return {
+        'market_data': {category: dict(zip(names[category], symbols[category])) for category in names.index},
+        'category_order': list(names.index),
+        'ticker_order': {category: list(dict.fromkeys(names[category])) for category in names.index}
+    }
+
+class _WatchlistConfigCache:
+    """구글 시트 관심 종목 설정을 모든 세션이 공유하는 캐시
+
+    WATCHLIST_POLL_SECONDS마다 스프레드시트 수정 시각(Drive modifiedTime)만 확인하고,
+    바뀌었을 때만 시트 전체를 읽어 다시 구성
+    마지막으로 읽거나 쓴 시트 값도 보관해 저장 시 바뀐 행만 보내는 기준으로 사용
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._config = None
+        self._values = None
+        self._revision = None
+        self._checked_at = 0.0
+        self._spreadsheet = None
+
+    def spreadsheet(self, gsheets_client):
+        """스프레드시트 핸들 (한 번 열면 재사용, 저장할 때도 사용)"""
+        if self._spreadsheet is None:
+            self._spreadsheet = _instrumented('gsheets', 'open', None,
+                                              lambda: gsheets_client.open_by_key(SPREADSHEET_ID))
+        return self._spreadsheet
+
+    def _refresh(self, gsheets_client, force=False):
+        """필요하면 수정 시각을 확인하고 바뀐 경우에만 시트를 다시 읽기 (lock 안에서 호출)
+
+        force: 확인 주기와 무관하게 지금 수정 시각을 확인 (확인할 수 없으면 시트를 다시 읽음)
+        """
+        metrics = get_provider_metrics()
+        if not force and self._values is not None and time.time() - self._checked_at < WATCHLIST_POLL_SECONDS:
+            metrics.record_cache('watchlist', 'hit')
+            return
+
+        spreadsheet = self.spreadsheet(gsheets_client)
+        try:
+            revision = _instrumented('gsheets', 'revision', None, spreadsheet.get_lastUpdateTime)
+        except Exception as e:
+            # 수정 시각을 확인할 수 없으면 캐시된 설정을 계속 사용 (없으면 바로 읽기)
+            print(f"[Watchlist] 수정 시각 확인 실패: {str(e)}")
+            revision = None
+            if self._values is not None and not force:
+                self._checked_at = time.time()
+                metrics.record_cache('watchlist', 'stale')
+                return
+
+        if self._values is not None and revision is not None and revision == self._revision:
+            self._checked_at = time.time()
+            metrics.record_cache('watchlist', 'hit')
+            return
+
+        metrics.record_cache('watchlist', 'miss')
+        all_values = _instrumented('gsheets', 'read', None, _find_worksheet(spreadsheet).get_all_values)
+        self._values = all_values
+        self._config = parse_watchlist_values(all_values)
+        self._revision = revision
+        self._checked_at = time.time()
+
+    def get(self, gsheets_client):
+        """최신 설정 반환 (세션에서 수정해도 되도록 사본, 시트가 비어 있으면 None)"""
+        with self._lock:
+            self._refresh(gsheets_client)
+            return copy.deepcopy(self._config)
+
+    def synced_values(self, gsheets_client):
+        """지금 시트에 있는 값 (헤더 포함 2차원 리스트 사본) - 저장할 때 변경분 계산 기준
+
+        확인 주기와 무관하게 수정 시각을 확인하고, 캐시 이후 바뀌었으면 시트를 다시 읽음
+        """
+        with self._lock:
+            self._refresh(gsheets_client, force=True)
+            return [list(row) for row in self._values]
+
+    def store(self, values, revision=None):
+        """이 프로세스에서 저장한 값을 바로 반영 (revision을 모르면 다음 확인 때 다시 읽음)
+
+        저장 직후의 수정 시각에는 그 사이 다른 곳에서 한 수정이 섞여 있을 수 있으므로,
+        저장 경로에서는 revision 없이 호출해 다음 확인 때 시트를 다시 읽게 함
+        """
+        with self._lock:
+            self._values = [list(row) for row in values]
+            self._config = parse_watchlist_values(values)
+            self._revision = revision
+            self._checked_at = time.time()
+
+@st.cache_resource
+def get_watchlist_config_cache():
+    """모든 세션이 공유하는 관심 종목 설정 캐시"""
+    return _WatchlistConfigCache()
+
+def _find_worksheet(spreadsheet):
+    """시트 찾기 (시트 이름으로 찾거나 첫 번째 시트 사용)"""
+    try:
+        return spreadsheet.worksheet(SHEET_NAME)
+    except gspread.exceptions.WorksheetNotFound:
+        # 시트가 없으면 첫 번째 시트 사용
+        return spreadsheet.sheet1
+    except Exception:
+        # 다른 오류면 첫 번째 시트 사용
+        return spreadsheet.sheet1
+
+def _diff_sheet_rows(old_values, new_values):
+    """이전 시트 값과 새 값을 행 단위로 비교해 batch_update용 변경 구간 목록 생성
+
+    연속으로 바뀐 행은 한 구간으로 묶고, 새 값보다 긴 이전 행은 빈 값으로 덮어씀
+    반환값: [{'range': 'A2:E3', 'values': [...]}] (바뀐 행이 없으면 빈 리스트)
+    """
+    num_cols = max([len(WATCHLIST_COLUMNS)] + [len(row) for row in old_values] + [len(row) for row in new_values])
+    
+    def _pad(row):
+        return list(row) + [''] * (num_cols - len(row))
+    
+    def _normalize(row):
+        # 시트에서 읽은 값은 문자열이므로 문자열로 맞춰 비교
+        return ['' if value is None else str(value) for value in row]
+    
+    blank_row = [''] * num_cols
+    changed = []
+    for idx in range(max(len(old_values), len(new_values))):
+        new_row = _pad(new_values[idx]) if idx < len(new_values) else blank_row
+        old_row = _pad(old_values[idx]) if idx < len(old_values) else blank_row
+        if _normalize(new_row) != _normalize(old_row):
+            # 숫자는 숫자 그대로 보내 시트의 셀 형식 유지
+            changed.append((idx, new_row))
+    
+    updates = []
+    for idx, row in changed:
+        if updates and updates[-1]['end'] == idx - 1:
+            updates[-1]['end'] = idx
+            updates[-1]['values'].append(row)
+        else:
+            updates.append({'start': idx, 'end': idx, 'values': [row]})
+    
+    return [
+        {
+            'range': (f"{gspread.utils.rowcol_to_a1(update['start'] + 1, 1)}:"
+                      f"{gspread.utils.rowcol_to_a1(update['end'] + 1, num_cols)}"),
+            'values': update['values']
+        }
+        for update in updates
+    ]
+
 def load_data():
-    """구글 시트에서 데이터를 읽어와서 session_state에 로드"""
+    """관심 종목 설정을 공유 캐시(구글 시트)에서 읽어와서 session_state에 로드"""
+    gsheets_client = get_gsheets_client()
     if gsheets_client is None:
         return False
     
     try:
-        # 스프레드시트 열기
-        spreadsheet = gsheets_client.open_by_key(SPREADSHEET_ID)
-        
-        # 시트 찾기 (시트 이름으로 찾거나 첫 번째 시트 사용)
-        try:
-            worksheet = spreadsheet.worksheet(SHEET_NAME)
-        except WorksheetNotFound:
-            # 시트가 없으면 첫 번째 시트 사용
-            worksheet = spreadsheet.sheet1
-        except Exception:
-            # 다른 오류면 첫 번째 시트 사용
-            worksheet = spreadsheet.sheet1
-        
-        # 모든 데이터 읽기
-        all_values = worksheet.get_all_values()
-        
-        if len(all_values) < 2:  # 헤더만 있거나 비어있음
-            return False
-        
-        # 첫 번째 행을 헤더로 사용
-        headers = all_values[0]
-        data_rows = all_values[1:]
-        
-        # DataFrame 생성
-        df = pd.DataFrame(data_rows, columns=headers)
-        
-        # 필요한 컬럼 확인
-        required_cols = ['Category', 'TickerName', 'Symbol', 'Order', 'CategoryOrder']
-        if not all(col in df.columns for col in required_cols):
-            # 컬럼이 없으면 첫 5개 컬럼을 사용 (CategoryOrder가 없으면 추가)
-            if len(df.columns) >= 4:
-                if len(df.columns) < 5:
-                    # CategoryOrder 컬럼이 없으면 추가 (기본값 0)
-                    df['CategoryOrder'] = 0
-                # 컬럼명 설정
-                col_names = required_cols[:len(df.columns)]
-                if len(df.columns) == 4:
-                    col_names = required_cols[:4] + ['CategoryOrder']
-                df.columns = col_names[:len(df.columns)]
-            else:
-                return False
-        
-        # 빈 행 제거
-        df = df.dropna(subset=['Category', 'TickerName', 'Symbol'])
-        df = df[df['Category'].astype(str).str.strip() != '']
-        df = df[df['TickerName'].astype(str).str.strip() != '']
-        df = df[df['Symbol'].astype(str).str.strip() != '']
-        
-        if df.empty:
+        config = get_watchlist_config_cache().get(gsheets_client)
+        if config is None:
             return False
         
-        # Order 컬럼을 숫자로 변환 (실패 시 인덱스 사용)
-        try:
-            df['Order'] = pd.to_numeric(df['Order'], errors='coerce')
-            df = df.fillna({'Order': 0})
-        except:
-            df['Order'] = range(len(df))
-        
-        # CategoryOrder와 Order로 정렬 (카테고리 순서 우선, 그 다음 티커 순서)
-        if 'CategoryOrder' in df.columns:
-            try:
-                df['CategoryOrder'] = pd.to_numeric(df['CategoryOrder'], errors='coerce')
-                df = df.fillna({'CategoryOrder': 999})  # CategoryOrder가 없으면 맨 뒤로
-            except:
-                df['CategoryOrder'] = 999
-        else:
-            df['CategoryOrder'] = 999
-        
-        df = df.sort_values(by=['CategoryOrder', 'Order'])
-        
-        # session_state 재구성
-        market_data = {}
-        category_order = []
-        ticker_order = {}
-        category_order_map = {}  # 카테고리별 CategoryOrder 값 저장
-        
-        for _, row in df.iterrows():
-            category = str(row['Category']).strip()
-            ticker_name = str(row['TickerName']).strip()
-            symbol = str(row['Symbol']).strip()
-            category_order_val = row.get('CategoryOrder', 999)
-            
-            if not category or not ticker_name or not symbol:
-                continue
-            
-            # 카테고리 순서 정보 저장
-            if category not in category_order_map:
-                category_order_map[category] = category_order_val
-            
-            if category not in market_data:
-                market_data[category] = {}
-                if category not in category_order:
-                    category_order.append(category)
-                ticker_order[category] = []
-            
-            market_data[category][ticker_name] = symbol
-            ticker_order[category].append(ticker_name)
-        
-        # 카테고리 순서를 CategoryOrder 값에 따라 정렬
-        category_order = sorted(category_order, key=lambda x: category_order_map.get(x, 999))
-        
-        st.session_state.market_data = market_data
-        st.session_state.category_order = category_order
-        st.session_state.ticker_order = ticker_order
+        st.session_state.market_data = config['market_data']
+        st.session_state.category_order = config['category_order']
+        st.session_state.ticker_order = config['ticker_order']
         
         return True
     except Exception as e:
@@ -262,89 +451,251 @@ def load_data():
         st.error(f"데이터 로드 오류: {error_msg}")
         return False
 
+def build_watchlist_values(market_data, category_order, ticker_order):
+    """관심 종목 설정을 시트에 쓸 값(헤더 포함 2차원 리스트)으로 변환 (티커가 없으면 None)"""
+    rows = []
+    
+    # 카테고리 순서에 따라 처리 (카테고리 순서도 함께 저장)
+    for category_idx, category in enumerate(category_order):
+        if category in market_data:
+            tickers = market_data[category]
+            ticker_list = list(ticker_order.get(category, list(tickers.keys())))
+            
+            # 순서에 없는 티커 추가
+            for ticker_name in tickers.keys():
+                if ticker_name not in ticker_list:
+                    ticker_list.append(ticker_name)
+            
+            # 순서대로 행 추가 (카테고리 순서 포함)
+            for order, ticker_name in enumerate(ticker_list):
+                if ticker_name in tickers:
+                    rows.append([
+                        category,
+                        ticker_name,
+                        tickers[ticker_name],
+                        order,  # 티커 순서
+                        category_idx  # 카테고리 순서
+                    ])
+    
+    # 순서에 없는 카테고리도 추가 (맨 뒤에 추가)
+    max_category_idx = len(category_order)
+    for category in market_data.keys():
+        if category not in category_order:
+            tickers = market_data[category]
+            ticker_list = ticker_order.get(category, list(tickers.keys()))
+            for order, ticker_name in enumerate(ticker_list):
+                if ticker_name in tickers:
+                    rows.append([
+                        category,
+                        ticker_name,
+                        tickers[ticker_name],
+                        order,  # 티커 순서
+                        max_category_idx  # 카테고리 순서 (맨 뒤)
+                    ])
+            max_category_idx += 1
+    
+    if not rows:
+        return None
+    
+    # 헤더와 데이터 준비 (CategoryOrder 컬럼 추가)
+    return [WATCHLIST_COLUMNS] + rows
+
+def _session_watchlist_values():
+    """현재 session_state의 관심 종목 설정을 시트 값으로 변환"""
+    return build_watchlist_values(
+        st.session_state.get('market_data', {}),
+        st.session_state.get('category_order', []),
+        st.session_state.get('ticker_order', {})
+    )
+
+def write_watchlist_values(gsheets_client, all_data):
+    """시트 값을 구글 시트에 쓰기 (실패 시 예외, 화면 출력 없음 - 백그라운드 저장에서도 사용)"""
+    # 스프레드시트 열기 (설정 캐시가 연 핸들 재사용)
+    spreadsheet = get_watchlist_config_cache().spreadsheet(gsheets_client)
+    
+    # 시트 찾기 또는 생성 (다른 오류는 그대로 전달해 저장 큐가 재시도하게 함 - 다른 시트에 쓰지 않도록)
+    try:
+        worksheet = spreadsheet.worksheet(SHEET_NAME)
+    except gspread.exceptions.WorksheetNotFound:
+        worksheet = spreadsheet.add_worksheet(title=SHEET_NAME, rows=1000, cols=10)
+        synced_values = []
+    else:
+        # 변경분 계산 기준: 지금 시트 값 (수정 시각이 캐시와 다르면 다시 읽음)
+        synced_values = get_watchlist_config_cache().synced_values(gsheets_client)
+    
+    # 바뀐 행 구간만 한 번의 batch_update로 쓰기 (남는 아래쪽 행은 빈 값으로 덮어씀)
+    # 시트를 비웠다가 다시 쓰지 않으므로 다른 세션이 빈 시트를 읽는 순간이 없음
+    updates = _diff_sheet_rows(synced_values, all_data)
+    if not updates:
+        return
+    _instrumented('gsheets', 'write', None,
+                  lambda: worksheet.batch_update(updates, value_input_option='RAW'))
+    
+    # 다른 세션도 다음 로드부터 저장한 설정을 받도록 공유 캐시 갱신
+    # 저장 직후 수정 시각을 기록하면 그 사이 외부 수정까지 본 것으로 처리되므로 기록하지 않음 (다음 확인 때 다시 읽음)
+    get_watchlist_config_cache().store(all_data)
+
 def save_data():
-    """현재 session_state 데이터를 구글 시트에 저장"""
+    """현재 session_state 데이터를 구글 시트에 저장 (저장이 끝날 때까지 대기)"""
+    gsheets_client = get_gsheets_client()
     if gsheets_client is None:
         st.error("구글 시트 연결이 없습니다.")
         return False
     
+    all_data = _session_watchlist_values()
+    if all_data is None:
+        return False
+    
     try:
-        # session_state 데이터를 리스트로 변환
-        rows = []
-        category_order = st.session_state.get('category_order', [])
-        ticker_order = st.session_state.get('ticker_order', {})
-        market_data = st.session_state.get('market_data', {})
-        
-        # 카테고리 순서에 따라 처리 (카테고리 순서도 함께 저장)
-        for category_idx, category in enumerate(category_order):
-            if category in market_data:
-                tickers = market_data[category]
-                ticker_list = ticker_order.get(category, list(tickers.keys()))
-                
-                # 순서에 없는 티커 추가
-                for ticker_name in tickers.keys():
-                    if ticker_name not in ticker_list:
-                        ticker_list.append(ticker_name)
-                
-                # 순서대로 행 추가 (카테고리 순서 포함)
-                for order, ticker_name in enumerate(ticker_list):
-                    if ticker_name in tickers:
-                        rows.append([
-                            category,
-                            ticker_name,
-                            tickers[ticker_name],
-                            order,  # 티커 순서
-                            category_idx  # 카테고리 순서
-                        ])
-        
-        # 순서에 없는 카테고리도 추가 (맨 뒤에 추가)
-        max_category_idx = len(category_order)
-        for category in market_data.keys():
-            if category not in category_order:
-                tickers = market_data[category]
-                ticker_list = ticker_order.get(category, list(tickers.keys()))
-                for order, ticker_name in enumerate(ticker_list):
-                    if ticker_name in tickers:
-                        rows.append([
-                            category,
-                            ticker_name,
-                            tickers[ticker_name],
-                            order,  # 티커 순서
-                            max_category_idx  # 카테고리 순서 (맨 뒤)
-                        ])
-                max_category_idx += 1
-        
-        if not rows:
-            return False
-        
-        # 스프레드시트 열기
-        spreadsheet = gsheets_client.open_by_key(SPREADSHEET_ID)
-        
-        # 시트 찾기 또는 생성
-        try:
-            worksheet = spreadsheet.worksheet(SHEET_NAME)
-        except WorksheetNotFound:
-            # 시트가 없으면 생성
-            worksheet = spreadsheet.add_worksheet(title=SHEET_NAME, rows=1000, cols=10)
-        except Exception:
-            # 다른 오류면 첫 번째 시트 사용
-            worksheet = spreadsheet.sheet1
-        
-        # 헤더와 데이터 준비 (CategoryOrder 컬럼 추가)
-        headers = [['Category', 'TickerName', 'Symbol', 'Order', 'CategoryOrder']]
-        all_data = headers + rows
-        
-        # 시트 전체 지우기
-        worksheet.clear()
-        
-        # 새 데이터 쓰기
-        worksheet.update('A1', all_data, value_input_option='RAW')
-        
+        write_watchlist_values(gsheets_client, all_data)
         return True
     except Exception as e:
         st.error(f"데이터 저장 오류: {str(e)}")
         return False
 
+# 관심 종목 저장 대기열 (write-behind)
+# 편집은 session_state에 바로 반영하고, 짧은 시간 안에 이어진 편집은 마지막 상태 하나로 합쳐 백그라운드에서 저장
+WATCHLIST_SAVE_DEBOUNCE = 1.5  # 마지막 편집 후 이 시간(초) 동안 추가 편집이 없으면 저장
+WATCHLIST_SAVE_RETRY_BASE = 2.0  # 저장 실패 시 재시도 대기 시작값 (초, 실패할 때마다 2배)
+WATCHLIST_SAVE_RETRY_MAX = 60.0
+
+WATCHLIST_SAVE_SESSIONS_MAX = 256  # 저장 상태를 기억할 세션 수 (끝난 세션부터 정리)
+
+class _WatchlistSaveQueue:
+    """관심 종목 저장을 모아서 백그라운드 스레드에서 구글 시트에 쓰는 대기열 (프로세스 공용)
+
+    시트 하나에 설정 전체를 쓰므로 대기 중인 값은 항상 최신 하나만 유지 (마지막 저장이 이김)
+    다른 세션이 나중에 저장하면 앞선 세션의 저장 안 된 값은 버려지고, 그 세션에는 'superseded'로 표시
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._pending = None  # (gsheets_client, all_data, session_id)
+        self._in_flight = False  # 시트에 쓰는 중인지 (한 번에 하나만 씀)
+        self._due_at = 0.0
+        self._attempts = 0
+        self._last_error = None
+        self._sessions = {}  # session_id -> {'state': pending/saved/superseded, 'saved_at'}
+        self._thread = None
+        atexit.register(self.flush)
+
+    def submit(self, gsheets_client, all_data, session_id=None):
+        """저장할 값을 대기열에 넣고 디바운스 시간 뒤 저장 예약 (즉시 반환)"""
+        with self._cond:
+            if self._pending is not None and self._pending[2] != session_id:
+                self._set_state(self._pending[2], 'superseded')
+            self._pending = (gsheets_client, all_data, session_id)
+            self._set_state(session_id, 'pending')
+            self._due_at = time.time() + WATCHLIST_SAVE_DEBOUNCE
+            self._attempts = 0
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='watchlist-save', daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def _set_state(self, session_id, state, saved_at=None):
+        entry = self._sessions.pop(session_id, {'saved_at': None})
+        entry['state'] = state
+        if saved_at is not None:
+            entry['saved_at'] = saved_at
+        self._sessions[session_id] = entry  # 최근에 바뀐 세션이 뒤로 가도록 다시 넣음
+        if len(self._sessions) > WATCHLIST_SAVE_SESSIONS_MAX:
+            for old_id in [sid for sid, e in self._sessions.items() if e['state'] != 'pending']:
+                if len(self._sessions) <= WATCHLIST_SAVE_SESSIONS_MAX:
+                    break
+                del self._sessions[old_id]
+
+    def status(self, session_id=None):
+        """세션 기준 저장 상태 (pending: 이 세션의 값이 저장 대기 중, superseded: 다른 세션의 저장에 덮임,
+        due_in: 다음 시도까지 남은 초, attempts, last_error, saved_at)"""
+        with self._cond:
+            entry = self._sessions.get(session_id, {'state': None, 'saved_at': None})
+            pending = entry['state'] == 'pending'
+            return {
+                'pending': pending,
+                'superseded': entry['state'] == 'superseded',
+                'due_in': max(0.0, self._due_at - time.time()) if pending else 0.0,
+                'attempts': self._attempts if pending else 0,
+                'last_error': self._last_error if pending else None,
+                'saved_at': entry['saved_at']
+            }
+
+    def flush(self):
+        """대기 중인 값을 바로 저장 (프로세스 종료 시 호출, 쓰는 중인 저장이 있으면 끝날 때까지 기다림)"""
+        with self._cond:
+            while self._in_flight:
+                self._cond.wait()
+            if self._pending is None:
+                return
+            self._due_at = 0.0
+            self._in_flight = True
+            pending = self._pending
+        self._write(pending)
+
+    def _run(self):
+        """예약 시각이 되면 대기 중인 값을 저장하고 실패하면 지수 백오프로 재시도"""
+        while True:
+            with self._cond:
+                while self._pending is None or self._in_flight or time.time() < self._due_at:
+                    if self._pending is None or self._in_flight:
+                        self._cond.wait()
+                    else:
+                        self._cond.wait(timeout=self._due_at - time.time())
+                self._in_flight = True
+                pending = self._pending
+            self._write(pending)
+
+    def _write(self, pending):
+        """pending을 시트에 씀 (호출 전에 _cond 안에서 _in_flight를 잡아 두어야 함)"""
+        gsheets_client, all_data, session_id = pending
+        try:
+            write_watchlist_values(gsheets_client, all_data)
+            error = None
+        except Exception as e:
+            error = str(e)
+            print(f"[Watchlist Save Error] {error}")
+
+        with self._cond:
+            self._in_flight = False
+            if error is None:
+                self._last_error = None
+                # 저장하는 동안 새 편집이 들어왔으면 그 값은 남겨 둠
+                if self._pending is pending:
+                    self._pending = None
+                    self._set_state(session_id, 'saved', saved_at=time.time())
+                elif self._pending[2] != session_id:
+                    self._set_state(session_id, 'superseded', saved_at=time.time())
+            elif self._pending is pending:
+                self._attempts += 1
+                self._last_error = error
+                delay = min(WATCHLIST_SAVE_RETRY_MAX, WATCHLIST_SAVE_RETRY_BASE * 2 ** (self._attempts - 1))
+                self._due_at = time.time() + delay
+            self._cond.notify_all()
+
+@st.cache_resource
+def get_watchlist_save_queue():
+    """모든 세션이 공유하는 관심 종목 저장 대기열"""
+    return _WatchlistSaveQueue()
+
+def _current_session_id():
+    """현재 스크립트 실행의 세션 ID (세션 밖에서 호출되면 None)"""
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else None
+
+def queue_save():
+    """현재 session_state 데이터를 백그라운드 저장 대기열에 넣기 (UI는 저장을 기다리지 않음)"""
+    gsheets_client = get_gsheets_client()
+    if gsheets_client is None:
+        st.error("구글 시트 연결이 없습니다.")
+        return False
+    
+    all_data = _session_watchlist_values()
+    if all_data is None:
+        return False
+    
+    get_watchlist_save_queue().submit(gsheets_client, all_data, _current_session_id())
+    return True
+
 def get_default_data():
     """기본 데이터 반환"""
     return {
@@ -372,8 +723,8 @@ def get_default_data():
 def init_market_data():
     """세션 상태 초기화 - 구글 시트에서 로드하거나 기본값 설정"""
     if 'market_data' not in st.session_state:
-        # 구글 시트에서 데이터 로드 시도
-        if gsheets_client is not None:
+        # 구글 시트에서 데이터 로드 시도 (세션 첫 실행에서 연결 실패 원인 표시)
+        if get_gsheets_client(show_error=True) is not None:
             if load_data():
                 return  # 성공적으로 로드됨
         
@@ -386,8 +737,8 @@ def init_market_data():
             st.session_state.ticker_order[category] = list(tickers.keys())
         
         # 기본 데이터를 시트에 저장
-        if gsheets_client is not None:
-            save_data()
+        if get_gsheets_client() is not None:
+            queue_save()
     
     # 카테고리 순서 초기화 (없는 경우)
     if 'category_order' not in st.session_state:
@@ -399,475 +750,2315 @@ def init_market_data():
         for category, tickers in st.session_state.market_data.items():
             st.session_state.ticker_order[category] = list(tickers.keys())
 
-def _period_to_dates(period):
-    """period 문자열을 시작일과 종료일로 변환"""
-    end_date = datetime.now()
-    
-    if period == "1mo":
-        start_date = end_date - timedelta(days=30)
-    elif period == "6mo":
-        start_date = end_date - timedelta(days=180)
-    elif period == "1y":
-        start_date = end_date - timedelta(days=365)
-    elif period == "2y":
-        start_date = end_date - timedelta(days=730)
-    elif period == "5y":
-        start_date = end_date - timedelta(days=1825)
-    elif period == "10y":
-        start_date = end_date - timedelta(days=3650)
-    elif period == "15y":
-        start_date = end_date - timedelta(days=5475)
-    elif period == "20y":
-        start_date = end_date - timedelta(days=7300)
-    else:
-        start_date = end_date - timedelta(days=365)  # 기본값: 1년
-    
-    return start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')
+# 조회 기간 옵션 (표시 이름 -> period 코드)
+PERIOD_OPTIONS = {
+    "1개월": "1mo",
+    "6개월": "6mo",
+    "1년": "1y",
+    "2년": "2y",
+    "5년": "5y",
+    "10년": "10y",
+    "15년": "15y",
+    "20년": "20y"
+}
+
+# period 코드별 조회 일수
+PERIOD_DAYS = {
+    "1mo": 30,
+    "6mo": 180,
+    "1y": 365,
+    "2y": 730,
+    "5y": 1825,
+    "10y": 3650,
+    "15y": 5475,
+    "20y": 7300
+}
+
+# 심볼별로 한 번만 받아두는 최장 히스토리 (짧은 기간은 여기서 잘라서 사용)
+HISTORY_MAX_PERIOD = "20y"
+
+def _period_start(period):
+    """period 문자열을 조회 시작일로 변환 (기본값: 1년)"""
+    days = PERIOD_DAYS.get(period, 365)
+    return pd.Timestamp(datetime.now().date()) - pd.Timedelta(days=days)
+
+# 트레이딩뷰 요청 봉 수 계획
+TV_MAX_BARS = 5000  # tvdatafeed 한 번 요청의 최대 봉 수
+TV_BAR_MARGIN = 3  # 휴일/시차 대비 여유 봉 수
+TV_24H_EXCHANGES = {'BINANCE', 'BITSTAMP', 'COINBASE', 'BYBIT', 'UPBIT', 'BITHUMB'}  # 주말에도 봉이 생기는 거래소
+
+def _plan_tv_bars(exchange, fetch_start):
+    """fetch_start부터 오늘까지 필요한 최소 트레이딩뷰 봉 수와 Interval 계산
+
+    반환값: (interval, n_bars) - 트레이딩뷰를 사용할 수 없으면 (None, 0)
+    """
+    tvdatafeed = get_tvdatafeed()
+    if tvdatafeed is None:
+        return None, 0
+
+    today = pd.Timestamp(datetime.now().date())
+    if exchange in TV_24H_EXCHANGES:
+        expected_bars = (today - fetch_start).days + 1
+    else:
+        # 평일 수 = 일봉 수의 상한 (휴일은 빠지므로 과소 요청되지 않음)
+        expected_bars = len(pd.bdate_range(fetch_start, today))
+
+    # 저장소가 일봉 기준이고 이평선도 일 단위 창이므로 항상 일봉으로 요청
+    # (fetch_start는 _tv_earliest_start 이후로 맞춰 들어오므로 TV_MAX_BARS에 잘리지 않음)
+    n_bars = min(TV_MAX_BARS, expected_bars + TV_BAR_MARGIN)
+    return tvdatafeed.Interval.in_daily, n_bars
+
+def _tv_earliest_start(exchange):
+    """트레이딩뷰 한 번 요청(TV_MAX_BARS)으로 받을 수 있는 가장 이른 일봉 날짜
+
+    tvdatafeed는 종료일 지정(페이지 요청)을 지원하지 않으므로 이보다 앞선 구간은 받을 수 없음
+    """
+    today = pd.Timestamp(datetime.now().date())
+    reachable_bars = TV_MAX_BARS - TV_BAR_MARGIN - 1
+    if exchange in TV_24H_EXCHANGES:
+        return today - pd.Timedelta(days=reachable_bars)
+    return today - pd.offsets.BDay(reachable_bars)
+
+# 티커 검색 카탈로그 (yfinance / 트레이딩뷰: (이름, 심볼, 설명))
+YFINANCE_CATALOG = [
+    # 주식 지수
+    ("코스피", "^KS11", "KOSPI 종합주가지수"),
+    ("코스닥", "^KQ11", "KOSDAQ 종합주가지수"),
+    ("S&P500", "^GSPC", "S&P 500 지수"),
+    ("나스닥", "^IXIC", "NASDAQ 종합지수"),
+    ("다우", "^DJI", "다우 존스 산업평균지수"),
+    ("니케이", "^N225", "닛케이 225 지수"),
+    ("상해종합", "000001.SS", "상하이 종합 지수"),
+    ("CSI300", "000300.SS", "CSI 300 지수"),
+    ("항셍", "^HSI", "항셍 지수"),
+    
+    # 환율
+    ("원달러", "KRW=X", "원/달러 환율"),
+    ("원위안", "CNYKRW=X", "원/위안 환율"),
+    ("원엔", "JPYKRW=X", "원/엔 환율"),
+    ("달러인덱스", "DX-Y.NYB", "달러 인덱스"),
+    ("유로달러", "EURUSD=X", "유로/달러 환율"),
+    ("엔달러", "JPY=X", "엔/달러 환율"),
+    
+    # 원자재
+    ("유가", "CL=F", "WTI 원유 선물"),
+    ("원유", "CL=F", "WTI 원유 선물"),
+    ("브렌트", "BZ=F", "브렌트 원유 선물"),
+    ("금", "GC=F", "금 선물"),
+    ("은", "SI=F", "은 선물"),
+    ("구리", "HG=F", "구리 선물"),
+    ("팔라듐", "PA=F", "팔라듐 선물"),
+    ("백금", "PL=F", "백금 선물"),
+    ("천연가스", "NG=F", "천연가스 선물"),
+    ("가솔린", "RB=F", "가솔린 선물"),
+    ("난방유", "HO=F", "난방유 선물"),
+    ("밀", "ZW=F", "밀 선물"),
+    ("옥수수", "ZC=F", "옥수수 선물"),
+    ("대두", "ZS=F", "대두 선물"),
+    ("원당", "SB=F", "원당 선물"),
+    ("코코아", "CC=F", "코코아 선물"),
+    ("커피", "KC=F", "커피 선물"),
+    ("면화", "CT=F", "면화 선물"),
+    ("원목", "LBS=F", "원목 선물"),
+    
+    # 채권
+    ("미국10년물", "^TNX", "미국 10년 국채금리"),
+    ("미국30년물", "^TYX", "미국 30년 국채금리"),
+    ("미국2년물", "^IRX", "미국 2년 국채금리"),
+    
+    # 주요 주식 (삼성, 애플 등)
+    ("삼성전자", "005930.KS", "삼성전자 (KOSPI)"),
+    ("SK하이닉스", "000660.KS", "SK하이닉스 (KOSPI)"),
+    ("NAVER", "035420.KS", "NAVER (KOSPI)"),
+    ("카카오", "035720.KS", "카카오 (KOSPI)"),
+    ("애플", "AAPL", "Apple Inc."),
+    ("마이크로소프트", "MSFT", "Microsoft Corporation"),
+    ("구글", "GOOGL", "Alphabet Inc."),
+    ("아마존", "AMZN", "Amazon.com Inc."),
+    ("테슬라", "TSLA", "Tesla Inc."),
+    ("엔비디아", "NVDA", "NVIDIA Corporation"),
+    ("메타", "META", "Meta Platforms Inc."),
+]
+
+# 트레이딩뷰는 직접 검색 API가 없으므로 자주 쓰는 심볼 목록 제공
+TRADINGVIEW_CATALOG = [
+    ("한국 10년 국채", "TVC:KR10Y", "TradingView 한국 10년 국채"),
+    ("한국 3년 국채", "TVC:KR3Y", "TradingView 한국 3년 국채"),
+    ("한국 30년 국채", "TVC:KR30Y", "TradingView 한국 30년 국채"),
+    ("WTI 원유", "TVC:USOIL", "TradingView WTI 원유"),
+    ("브렌트 원유", "TVC:UKOIL", "TradingView 브렌트 원유"),
+    ("금", "TVC:GOLD", "TradingView 금"),
+    ("은", "TVC:SILVER", "TradingView 은"),
+    ("구리", "TVC:COPPER", "TradingView 구리"),
+    ("S&P500", "SPX:SPX", "TradingView S&P500"),
+    ("나스닥", "NASDAQ:NDX", "TradingView 나스닥"),
+    ("다우", "DJI:DJI", "TradingView 다우존스"),
+]
+
+# search_tickers의 데이터 소스 이름 → 검색 결과의 source (SEARCH_SOURCE_ALL이면 모든 데이터 소스)
+SEARCH_SOURCE_ALL = "전체"
+SEARCH_SOURCES = {
+    "yfinance": 'yfinance',
+    "FinanceDataReader (한국)": 'FinanceDataReader',
+    "TradingView": 'TradingView',
+}
+SEARCH_LIMIT = 50
+SEARCH_FUZZY_MIN_SCORE = 0.6  # 오타 허용 검색: 검색어 2-gram 중 이 비율 이상이 겹치면 후보
+KRX_LISTING_TTL = 24 * 60 * 60  # KRX 종목 목록 갱신 주기 (만료 후에는 이전 목록으로 검색하며 백그라운드에서 갱신)
+KRX_LISTING_RETRY = 5 * 60  # KRX 종목 목록을 받지 못했을 때 다시 시도하기까지 대기 (초)
+KRX_SEARCH_MIN_QUERY = 2  # '전체' 검색에서 KRX 목록을 처음 받기 시작하는 검색어 길이
+HANGUL_CHOSUNG = "ㄱㄲㄴㄷㄸㄹㅁㅂㅃㅅㅆㅇㅈㅉㅊㅋㅌㅍㅎ"
+
+def hangul_chosung(text):
+    """한글 음절을 초성으로 바꾼 문자열 (한글이 아닌 문자는 그대로, 예: 삼성전자 → ㅅㅅㅈㅈ)"""
+    chars = []
+    for ch in text:
+        code = ord(ch) - 0xAC00
+        chars.append(HANGUL_CHOSUNG[code // 588] if 0 <= code < 11172 else ch)
+    return ''.join(chars)
+
+def _normalize_search_text(text):
+    """검색용 정규화 (소문자, 공백 제거)"""
+    return ''.join(str(text).lower().split())
+
+def _ngrams(text, n=2):
+    """문자 n-gram 집합 (n보다 짧으면 문자열 자체)"""
+    if len(text) <= n:
+        return {text} if text else set()
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+class _SymbolSearchIndex:
+    """데이터 소스 하나의 종목 검색 인덱스
+
+    이름/심볼/설명의 2-gram 역색인과 이름/심볼 접두어용 정렬 목록, 이름 초성 역색인을 미리 만들어
+    검색어마다 전체 목록을 훑지 않고 후보만 확인
+    entries: [{'name', 'symbol', 'description', 'source'}]
+    """
+
+    def __init__(self, entries):
+        self.entries = []
+        self._grams = {}  # n-gram → 종목 번호 집합 (이름/심볼/설명)
+        self._chosung_grams = {}  # 초성 n-gram → 종목 번호 집합
+        prefixes = []
+        for idx, entry in enumerate(entries):
+            keys = (_normalize_search_text(entry['name']), entry['symbol'].lower(),
+                    _normalize_search_text(entry['description']))
+            chosung = hangul_chosung(keys[0])
+            self.entries.append({**entry, '_keys': keys, '_chosung': chosung})
+            for key in keys:
+                for gram in _ngrams(key) | set(key):
+                    self._grams.setdefault(gram, set()).add(idx)
+            for gram in _ngrams(chosung) | set(chosung):
+                self._chosung_grams.setdefault(gram, set()).add(idx)
+            prefixes.append((keys[0], idx))
+            prefixes.append((keys[1], idx))
+        prefixes.sort()
+        self._prefix_keys = [key for key, _ in prefixes]
+        self._prefix_ids = [idx for _, idx in prefixes]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _candidates(self, grams_index, query):
+        """검색어의 모든 n-gram을 포함하는 종목 번호 집합"""
+        grams = _ngrams(query) if len(query) > 1 else {query}
+        candidates = None
+        for gram in sorted(grams, key=lambda g: len(grams_index.get(g, ()))):
+            posting = grams_index.get(gram)
+            if not posting:
+                return set()
+            candidates = set(posting) if candidates is None else candidates & posting
+            if not candidates:
+                break
+        return candidates or set()
+
+    def _prefix_matches(self, query):
+        """이름 또는 심볼이 검색어로 시작하는 종목 번호 집합"""
+        start = bisect.bisect_left(self._prefix_keys, query)
+        matches = set()
+        for pos in range(start, len(self._prefix_keys)):
+            if not self._prefix_keys[pos].startswith(query):
+                break
+            matches.add(self._prefix_ids[pos])
+        return matches
+
+    def _fuzzy_matches(self, query):
+        """오타를 허용한 후보 (검색어 2-gram과 겹치는 비율 → 종목 번호)"""
+        grams = _ngrams(query)
+        if len(grams) < 2:
+            return {}
+        overlaps = {}
+        for gram in grams:
+            for idx in self._grams.get(gram, ()):
+                overlaps[idx] = overlaps.get(idx, 0) + 1
+        return {idx: count / len(grams) for idx, count in overlaps.items()
+                if count / len(grams) >= SEARCH_FUZZY_MIN_SCORE}
+
+    def ranked(self, query, limit=SEARCH_LIMIT):
+        """검색어와 맞는 종목 상위 limit개와 정렬 키 [(정렬 키, 종목)] (여러 인덱스 결과를 합칠 때 사용)
+
+        순위: 정확히 일치 → 접두어 → 이름/심볼 포함 → 초성 → 설명 포함 → 오타 허용(겹침 비율순)
+        같은 순위는 짧은 이름 먼저
+        """
+        query = _normalize_search_text(query)
+        if not query:
+            return []
+
+        ranked = {}
+        for idx in self._prefix_matches(query):
+            name_key, symbol_key, _ = self.entries[idx]['_keys']
+            ranked[idx] = (0,) if query in (name_key, symbol_key) else (1,)
+        for idx in self._candidates(self._grams, query):
+            if idx in ranked:
+                continue
+            name_key, symbol_key, description_key = self.entries[idx]['_keys']
+            if query in name_key or query in symbol_key:
+                ranked[idx] = (2,)
+            elif query in description_key:
+                ranked[idx] = (4,)
+        # 초성으로만 된 검색어는 이름 초성과 비교 (예: ㅅㅅㅈㅈ → 삼성전자)
+        if all(ch in HANGUL_CHOSUNG for ch in query):
+            for idx in self._candidates(self._chosung_grams, query):
+                if idx not in ranked and query in self.entries[idx]['_chosung']:
+                    ranked[idx] = (3,)
+        if len(ranked) < limit:
+            for idx, score in self._fuzzy_matches(query).items():
+                if idx not in ranked:
+                    ranked[idx] = (5, -score)
+
+        order = sorted(
+            ((rank, len(self.entries[idx]['name']), self.entries[idx]['name']), idx) for idx, rank in ranked.items()
+        )
+        return [
+            (sort_key, {key: value for key, value in self.entries[idx].items() if not key.startswith('_')})
+            for sort_key, idx in order[:limit]
+        ]
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        """검색어와 맞는 종목 상위 limit개"""
+        return [entry for _, entry in self.ranked(query, limit)]
+
+def _catalog_entries(catalog, source):
+    """(이름, 심볼, 설명) 카탈로그를 검색 인덱스 항목으로 변환"""
+    return [{'name': name, 'symbol': symbol, 'description': desc, 'source': source}
+            for name, symbol, desc in catalog]
+
+def _load_krx_entries():
+    """KRX 종목 목록을 받아 검색 인덱스 항목으로 변환"""
+    listing = _instrumented('fdr', 'listing', 'KRX', lambda: fdr.StockListing('KRX'))
+    if listing is None or listing.empty:
+        raise ValueError("FinanceDataReader: KRX 종목 목록이 비어 있습니다")
+
+    symbol_col = 'Symbol' if 'Symbol' in listing.columns else 'Code'
+    sectors = listing['Sector'].fillna('').astype(str) if 'Sector' in listing.columns else [''] * len(listing)
+    markets = listing['Market'].fillna('').astype(str) if 'Market' in listing.columns else [''] * len(listing)
+    return [
+        {
+            'name': name,
+            'symbol': symbol,
+            'description': f"업종: {sector or 'N/A'} | 시장: {market or 'N/A'}",
+            'source': 'FinanceDataReader'
+        }
+        for name, symbol, sector, market in zip(
+            listing['Name'].astype(str), listing[symbol_col].astype(str), sectors, markets
+        )
+    ]
+
+@st.cache_resource
+def get_krx_listing_cache():
+    """KRX 종목 목록 캐시 (모든 세션 공유, 하루 한 번 갱신)"""
+    return _StaleWhileRevalidateCache(ttl=KRX_LISTING_TTL, max_workers=1)
+
+@st.cache_resource
+def _krx_listing_state():
+    """KRX 종목 목록 다운로드 실패 시각 (실패 직후 검색마다 다시 받지 않도록)"""
+    return {'failed_at': 0.0}
+
+def get_krx_entries(load=True):
+    """KRX 종목 검색 항목 반환 (받지 못했으면 빈 튜플, KRX_LISTING_RETRY 후 다시 시도)
+
+    load: False면 이미 받아 둔 목록만 사용 (아직 없으면 다운로드하지 않고 빈 목록)
+    반환값: (목록을 받은 시각, 항목 리스트) - 받은 시각은 KRX 인덱스의 캐시 키로 사용
+    """
+    state = _krx_listing_state()
+    if time.time() - state['failed_at'] < KRX_LISTING_RETRY:
+        return None, []
+    if not load and ('krx_listing',) not in get_krx_listing_cache():
+        return None, []
+    try:
+        loaded, _ = get_krx_listing_cache().get(('krx_listing',), lambda: (time.time(), _load_krx_entries()))
+        return loaded
+    except Exception as e:
+        state['failed_at'] = time.time()
+        print(f"[FDR Search Error] {str(e)}")
+        return None, []
+
+@st.cache_resource(show_spinner=False)
+def get_catalog_search_indexes():
+    """yfinance/트레이딩뷰 카탈로그 검색 인덱스 (데이터 소스별, 프로세스당 한 번 구성)"""
+    return {
+        'yfinance': _SymbolSearchIndex(_catalog_entries(YFINANCE_CATALOG, 'yfinance')),
+        'TradingView': _SymbolSearchIndex(_catalog_entries(TRADINGVIEW_CATALOG, 'TradingView')),
+    }
+
+@st.cache_resource(max_entries=2, show_spinner=False)
+def _build_krx_search_index(krx_loaded_at, _krx_entries):
+    """KRX 목록 검색 인덱스 구성 (KRX 목록이 바뀔 때만 다시 구성)"""
+    return _SymbolSearchIndex(_krx_entries)
+
+def _query_needs_krx(query):
+    """'전체' 검색에서 KRX 목록을 받아서라도 찾아볼 검색어인지 (한글/초성/숫자가 들어간 2글자 이상)"""
+    query = _normalize_search_text(query)
+    return len(query) >= KRX_SEARCH_MIN_QUERY and any(
+        ch.isdigit() or '가' <= ch <= '힣' or ch in HANGUL_CHOSUNG for ch in query
+    )
+
+def get_search_indexes(source=None, query=''):
+    """검색할 데이터 소스의 인덱스 목록 (source가 None이면 전체)
+
+    KRX 목록은 FinanceDataReader를 고르거나 한국 종목을 찾는 검색어일 때만 받고,
+    그 밖의 '전체' 검색은 이미 받아 둔 목록이 있을 때만 포함
+    """
+    indexes = [index for name, index in get_catalog_search_indexes().items() if source in (None, name)]
+    if source in (None, 'FinanceDataReader'):
+        krx_loaded_at, krx_entries = get_krx_entries(load=source is not None or _query_needs_krx(query))
+        if krx_entries:
+            indexes.append(_build_krx_search_index(krx_loaded_at, krx_entries))
+    return indexes
+
+def search_tickers(query, source=SEARCH_SOURCE_ALL, limit=SEARCH_LIMIT):
+    """티커 검색 함수 (고른 데이터 소스의 인덱스만 검색해 순위대로 합침)
+
+    source: SEARCH_SOURCES 키 (검색 모달의 데이터 소스 선택값과 같음), SEARCH_SOURCE_ALL이면 모든 데이터 소스
+    반환값: [{'name', 'symbol', 'description', 'source'}] 상위 limit개
+    """
+    ranked = []
+    for index in get_search_indexes(None if source == SEARCH_SOURCE_ALL else SEARCH_SOURCES[source], query):
+        ranked.extend(index.ranked(query, limit))
+    ranked.sort(key=lambda item: item[0])
+    return [entry for _, entry in ranked[:limit]]
+
+def generate_ticker_search_prompt(search_query, data_source):
+    """티커 검색을 위한 AI 프롬프트 생성"""
+    if data_source == "yfinance":
+        prompt = f"""다음 검색어에 해당하는 yfinance 티커 심볼을 찾아주세요: "{search_query}"
+
+요구사항:
+1. 검색어와 관련된 모든 주요 티커 심볼을 찾아주세요
+2. 각 티커에 대해 다음 형식으로 제공해주세요:
+   - 티커 이름 (한글)
+   - 티커 심볼 (yfinance 형식)
+   - 설명 (간단히)
+
+예시:
+- 유가 또는 원유 검색 시:
+  • WTI 원유 선물: CL=F
+  • 브렌트 원유 선물: BZ=F
+  
+- 금 검색 시:
+  • 금 선물: GC=F
+
+중요: 티커 심볼만 정확하게 제공해주세요. yfinance에서 사용 가능한 형식이어야 합니다."""
+    
+    elif data_source == "FinanceDataReader (한국)":
+        prompt = f"""다음 검색어에 해당하는 한국 주식/채권 티커 심볼을 찾아주세요: "{search_query}"
+
+요구사항:
+1. 검색어와 관련된 모든 한국 주식/채권 티커를 찾아주세요
+2. FinanceDataReader에서 사용 가능한 형식이어야 합니다
+3. 각 티커에 대해 다음 형식으로 제공해주세요:
+   - 티커 이름 (종목명)
+   - 티커 심볼 (6자리 종목코드 또는 KR10Y, KR3Y 같은 국채 코드)
+   - 설명 (간단히)
+
+예시:
+- 삼성 검색 시:
+  • 삼성전자: 005930
+  • 삼성SDI: 006400
+  
+- 국채 검색 시:
+  • 한국 10년 국채: KR10Y
+  • 한국 3년 국채: KR3Y
+
+중요: 티커 심볼만 정확하게 제공해주세요. FinanceDataReader에서 사용 가능한 형식이어야 합니다."""
+    
+    elif data_source == "TradingView":
+        prompt = f"""다음 검색어에 해당하는 TradingView 티커 심볼을 찾아주세요: "{search_query}"
+
+요구사항:
+1. TradingView에서 사용 가능한 심볼을 찾아주세요
+2. TradingView 심볼 형식: EXCHANGE:SYMBOL (예: TVC:KR10Y, SPX:SPX)
+3. 각 티커에 대해 다음 형식으로 제공해주세요:
+   - 티커 이름 (한글)
+   - 티커 심볼 (EXCHANGE:SYMBOL 형식)
+   - 설명 (간단히)
+
+예시:
+- 한국 국채 검색 시:
+  • 한국 10년 국채: TVC:KR10Y
+  • 한국 3년 국채: TVC:KR3Y
+  
+- 원유 검색 시:
+  • WTI 원유: TVC:USOIL
+  • 브렌트 원유: TVC:UKOIL
+
+중요: 
+- 티커 심볼은 반드시 EXCHANGE:SYMBOL 형식이어야 합니다
+- TradingView에서 실제로 사용 가능한 심볼이어야 합니다
+- 거래소 코드와 심볼을 정확하게 구분해서 제공해주세요"""
+    
+    return prompt
+
+# 데이터 소스 호출 계측 (호출 수, 지연 분포, 오류율, 캐시 적중률, 받은 행/사용한 행)
+# 디버깅 패널에 표시하고 Prometheus 텍스트 형식 파일로도 기록
+METRICS_FILE_PATH = os.environ.get(
+    'MACRO_METRICS_FILE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'metrics.prom')
+)
+METRICS_WRITE_INTERVAL = 15  # 메트릭 파일 최소 기록 간격(초)
+METRICS_LATENCY_SAMPLES = 1000  # 데이터 소스별로 보관하는 최근 지연 샘플 수
+METRICS_QUANTILES = (0.5, 0.95, 0.99)
+
+class _ProviderMetrics:
+    """데이터 소스별 호출 통계를 모으는 프로세스 공용 저장소"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}  # (provider, op) -> {'calls', 'errors', 'latency_sum', 'latencies'}
+        self._rows = {}  # provider -> [받은 행, 사용한 행]
+        self._cache = {}  # (cache, result) -> 횟수
+        self._symbol_latency = {}  # (provider, symbol) -> 누적 지연(초)
+        self._last_written = 0
+
+    def record_call(self, provider, op, symbol, seconds, ok):
+        """데이터 소스 호출 1회 기록"""
+        with self._lock:
+            stats = self._calls.setdefault((provider, op), {
+                'calls': 0,
+                'errors': 0,
+                'latency_sum': 0.0,
+                'latencies': deque(maxlen=METRICS_LATENCY_SAMPLES)
+            })
+            stats['calls'] += 1
+            stats['errors'] += 0 if ok else 1
+            stats['latency_sum'] += seconds
+            stats['latencies'].append(seconds)
+            if symbol is not None:
+                key = (provider, symbol)
+                self._symbol_latency[key] = self._symbol_latency.get(key, 0.0) + seconds
+
+    def record_rows(self, provider, fetched, kept):
+        """데이터 소스가 돌려준 행 수와 실제로 사용한 행 수 기록"""
+        with self._lock:
+            rows = self._rows.setdefault(provider, [0, 0])
+            rows[0] += int(fetched)
+            rows[1] += int(kept)
+
+    def record_cache(self, cache, result):
+        """캐시 조회 결과 기록 (result: hit / stale / miss)"""
+        with self._lock:
+            self._cache[(cache, result)] = self._cache.get((cache, result), 0) + 1
+
+    def provider_table(self):
+        """데이터 소스별 요약 표 (디버깅 패널용)"""
+        with self._lock:
+            rows = []
+            for (provider, op), stats in sorted(self._calls.items()):
+                latencies = np.array(stats['latencies']) * 1000
+                fetched, kept = self._rows.get(provider, [0, 0]) if op != 'quote' else [0, 0]
+                rows.append({
+                    '데이터 소스': provider,
+                    '작업': op,
+                    '호출': stats['calls'],
+                    '오류율(%)': round(stats['errors'] / stats['calls'] * 100, 1) if stats['calls'] else 0,
+                    'p50(ms)': round(float(np.percentile(latencies, 50)), 1) if len(latencies) else 0,
+                    'p95(ms)': round(float(np.percentile(latencies, 95)), 1) if len(latencies) else 0,
+                    'p99(ms)': round(float(np.percentile(latencies, 99)), 1) if len(latencies) else 0,
+                    '받은 행': fetched,
+                    '사용한 행': kept
+                })
+            return rows
+
+    def cache_table(self):
+        """캐시별 적중/만료/미스 횟수와 적중률"""
+        with self._lock:
+            caches = sorted({cache for cache, _ in self._cache})
+            rows = []
+            for cache in caches:
+                hit = self._cache.get((cache, 'hit'), 0)
+                stale = self._cache.get((cache, 'stale'), 0)
+                miss = self._cache.get((cache, 'miss'), 0)
+                total = hit + stale + miss
+                rows.append({
+                    '캐시': cache,
+                    '적중': hit,
+                    '만료(백그라운드 갱신)': stale,
+                    '미스': miss,
+                    '적중률(%)': round((hit + stale) / total * 100, 1) if total else 0
+                })
+            return rows
+
+    def top_symbols(self, limit=10):
+        """누적 지연이 가장 큰 심볼 목록"""
+        with self._lock:
+            items = sorted(self._symbol_latency.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [
+            {'데이터 소스': provider, '심볼': symbol, '누적 지연(s)': round(seconds, 2)}
+            for (provider, symbol), seconds in items
+        ]
+
+    def to_prometheus(self):
+        """Prometheus 텍스트 형식으로 변환"""
+        lines = []
+        with self._lock:
+            lines.append("# HELP macro_provider_calls_total 데이터 소스 호출 수")
+            lines.append("# TYPE macro_provider_calls_total counter")
+            for (provider, op), stats in sorted(self._calls.items()):
+                lines.append(f'macro_provider_calls_total{{provider="{provider}",op="{op}"}} {stats["calls"]}')
+
+            lines.append("# HELP macro_provider_errors_total 데이터 소스 호출 오류 수")
+            lines.append("# TYPE macro_provider_errors_total counter")
+            for (provider, op), stats in sorted(self._calls.items()):
+                lines.append(f'macro_provider_errors_total{{provider="{provider}",op="{op}"}} {stats["errors"]}')
+
+            lines.append("# HELP macro_provider_latency_seconds 데이터 소스 호출 지연")
+            lines.append("# TYPE macro_provider_latency_seconds summary")
+            for (provider, op), stats in sorted(self._calls.items()):
+                labels = f'provider="{provider}",op="{op}"'
+                if stats['latencies']:
+                    for q in METRICS_QUANTILES:
+                        value = float(np.percentile(np.array(stats['latencies']), q * 100))
+                        lines.append(f'macro_provider_latency_seconds{{{labels},quantile="{q}"}} {value:.6f}')
+                lines.append(f'macro_provider_latency_seconds_sum{{{labels}}} {stats["latency_sum"]:.6f}')
+                lines.append(f'macro_provider_latency_seconds_count{{{labels}}} {stats["calls"]}')
+
+            lines.append("# HELP macro_provider_rows_fetched_total 데이터 소스가 돌려준 행 수")
+            lines.append("# TYPE macro_provider_rows_fetched_total counter")
+            for provider, (fetched, _) in sorted(self._rows.items()):
+                lines.append(f'macro_provider_rows_fetched_total{{provider="{provider}"}} {fetched}')
+
+            lines.append("# HELP macro_provider_rows_kept_total 실제로 사용한 행 수")
+            lines.append("# TYPE macro_provider_rows_kept_total counter")
+            for provider, (_, kept) in sorted(self._rows.items()):
+                lines.append(f'macro_provider_rows_kept_total{{provider="{provider}"}} {kept}')
+
+            lines.append("# HELP macro_cache_requests_total 캐시 조회 수")
+            lines.append("# TYPE macro_cache_requests_total counter")
+            for (cache, result), count in sorted(self._cache.items()):
+                lines.append(f'macro_cache_requests_total{{cache="{cache}",result="{result}"}} {count}')
+
+            lines.append("# HELP macro_symbol_latency_seconds_total 심볼별 누적 호출 지연")
+            lines.append("# TYPE macro_symbol_latency_seconds_total counter")
+            for (provider, symbol), seconds in sorted(self._symbol_latency.items()):
+                escaped = symbol.replace('\\', '\\\\').replace('"', '\\"')
+                lines.append(f'macro_symbol_latency_seconds_total{{provider="{provider}",symbol="{escaped}"}} {seconds:.6f}')
+        return "\n".join(lines) + "\n"
+
+    def write_file(self, path=None, force=False):
+        """메트릭 파일 기록 (METRICS_WRITE_INTERVAL 안에 다시 호출되면 건너뜀)"""
+        now = time.time()
+        if not force and now - self._last_written < METRICS_WRITE_INTERVAL:
+            return False
+        self._last_written = now
+        path = path or METRICS_FILE_PATH
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(self.to_prometheus())
+            os.replace(tmp_path, path)
+            return True
+        except OSError as e:
+            print(f"[Metrics Error] 메트릭 파일 기록 실패: {str(e)}")
+            return False
+
+@st.cache_resource
+def get_provider_metrics():
+    """모든 세션이 공유하는 데이터 소스 계측 저장소"""
+    return _ProviderMetrics()
+
+def _instrumented(provider, op, symbol, fn):
+    """데이터 소스 호출을 계측하면서 실행 (예외는 기록 후 그대로 전달)"""
+    start = time.perf_counter()
+    ok = False
+    try:
+        result = fn()
+        ok = True
+        return result
+    finally:
+        get_provider_metrics().record_call(provider, op, symbol, time.perf_counter() - start, ok)
+
+# 한 번의 렌더링이 모든 티커 데이터를 기다리는 최대 시간(초) - 벤치마크처럼 끝까지 기다려야 하면 MACRO_FETCH_TIMEOUT으로 늘림
+TICKER_FETCH_TIMEOUT = float(os.environ.get('MACRO_FETCH_TIMEOUT', '20'))
+# 시세(현재가/전일 종가)와 일봉 히스토리는 갱신 주기를 따로 두고 화면에 그릴 때 합침
+# 시세는 최근 며칠 봉만 받으므로 자주 갱신해도 가볍고, 히스토리는 증분만 받아 가끔 갱신
+TICKER_DATA_TTL = 60  # 시세 캐시: 이 시간이 지나면 stale로 보고 백그라운드에서 갱신
+TICKER_HISTORY_TTL = 6 * 60 * 60  # 히스토리 캐시: 그 사이 새로 생긴 봉은 시세 계층이 마지막 봉으로 덧붙임
+LIVE_QUOTE_TTL = 5  # 시세 캐시 유지 시간 (초) - 같은 주기 안의 여러 세션/카테고리가 요청을 공유
+QUOTE_LOOKBACK_DAYS = 10  # 시세 계산에 쓰는 최근 기간 (주말/연휴를 넘어 전일 종가를 찾을 수 있는 길이)
+
+class _SingleFlight:
+    """같은 키의 요청이 진행 중이면 새로 요청하지 않고 그 결과를 함께 기다리는 프로세스 공용 장치"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}  # key -> Future
+
+    def do(self, key, fn):
+        """key에 대해 fn을 한 번만 실행하고 모든 호출자에게 같은 결과(또는 예외) 반환"""
+        with self._lock:
+            future = self._calls.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = Future()
+                self._calls[key] = future
+
+        if not is_leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+@st.cache_resource
+def get_single_flight():
+    """모든 세션이 공유하는 single-flight 인스턴스 (키: 심볼과 요청 구간)"""
+    return _SingleFlight()
+
+# 로컬 가격 히스토리 저장소 (SQLite, 심볼별 일봉 종가와 이동평균)
+# 서버 재시작 후에도 디스크에서 바로 읽고, 새로고침 시에는 마지막 저장일 이후 봉만 요청
+# 환경변수 MACRO_HISTORY_DB로 경로 변경 가능 (벤치마크 등에서 격리된 저장소 사용)
+# 가짜 데이터 모드에서는 실제 심볼에도 합성 시세가 들어가므로 실제 저장소와 섞이지 않게 별도 파일 사용
+FAKE_DATA_ENABLED = os.environ.get('MACRO_FAKE_DATA', '') == '1'
+HISTORY_DB_PATH = os.environ.get(
+    'MACRO_HISTORY_DB',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache',
+                 'price_history.fake.sqlite' if FAKE_DATA_ENABLED else 'price_history.sqlite')
+)
+# 이 시간 안에 갱신된 심볼은 네트워크 요청 없이 저장소에서 읽기 (재시작 직후 등)
+# 캐시 워머는 히스토리 캐시 유지 시간의 CACHE_WARM_AHEAD(0.8) 시점에 미리 갱신하므로, 그때는 저장소도 만료돼 있어야
+# 실제로 새 봉을 받음 (같거나 길면 워머의 갱신이 저장소만 다시 읽고 끝남)
+HISTORY_STORE_FRESH_SECONDS = TICKER_HISTORY_TTL // 2
+
+# 저장소에 미리 계산해 두는 이동평균 (컬럼명: 기간 봉 수) - 20주 = 100일, 80주 = 400일
+MA_WINDOWS = {'ma100': 100, 'ma400': 400}
+
+_history_db_local = threading.local()
+
+def _history_db_connect():
+    """히스토리 저장소 연결 (스레드별로 재사용, 테이블이 없으면 생성)
+
+    WAL 모드에서는 마지막 연결을 닫을 때마다 체크포인트가 돌아 호출당 수십 ms가 들기 때문에
+    연결을 닫지 않고 스레드마다 하나씩 유지 (파일이 지워지거나 바뀌면 새로 연결)
+    """
+    os.makedirs(os.path.dirname(HISTORY_DB_PATH), exist_ok=True)
+    try:
+        file_id = os.stat(HISTORY_DB_PATH).st_ino
+    except FileNotFoundError:
+        file_id = None
+
+    cached = getattr(_history_db_local, 'conn', None)
+    if cached is not None and cached[0] == (HISTORY_DB_PATH, file_id) and file_id is not None:
+        return cached[1]
+    if cached is not None:
+        cached[1].close()
+        _history_db_local.conn = None
+
+    conn = sqlite3.connect(HISTORY_DB_PATH, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS price_history (
+            symbol TEXT NOT NULL,
+            date TEXT NOT NULL,
+            close REAL NOT NULL,
+            ma100 REAL,
+            ma400 REAL,
+            PRIMARY KEY (symbol, date)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS history_meta (
+            symbol TEXT PRIMARY KEY,
+            covered_from TEXT NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    """)
+    _migrate_moving_averages(conn)
+    _history_db_local.conn = ((HISTORY_DB_PATH, os.stat(HISTORY_DB_PATH).st_ino), conn)
+    return conn
+
+def _migrate_moving_averages(conn):
+    """이동평균 컬럼이 없는 예전 저장소에 컬럼을 추가하고 전체 구간을 한 번 계산"""
+    def _missing_columns():
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(price_history)")}
+        return [column for column in MA_WINDOWS if column not in columns]
+
+    if not _missing_columns():
+        return
+    with conn:
+        # 여러 스레드가 동시에 예전 저장소를 열 수 있으므로 쓰기 잠금을 잡은 뒤 다시 확인 (먼저 잡은 쪽만 마이그레이션)
+        conn.execute("BEGIN IMMEDIATE")
+        missing = _missing_columns()
+        if not missing:
+            return
+        for column in missing:
+            conn.execute(f"ALTER TABLE price_history ADD COLUMN {column} REAL")
+        for symbol, first_date in conn.execute(
+            "SELECT symbol, MIN(date) FROM price_history GROUP BY symbol"
+        ).fetchall():
+            _update_moving_averages(conn, symbol, first_date)
+
+def _prior_closes(conn, symbol, before_date):
+    """before_date 직전 봉들의 종가 (가장 긴 이동평균 창 크기만큼, 날짜 오름차순)"""
+    rows = conn.execute(
+        "SELECT close FROM price_history WHERE symbol = ? AND date < ? ORDER BY date DESC LIMIT ?",
+        (symbol, before_date, max(MA_WINDOWS.values()))
+    ).fetchall()
+    return [row[0] for row in reversed(rows)]
+
+def _running_moving_averages(prior, closes):
+    """직전 봉(prior)에 이어지는 closes 각 봉의 이동평균을 누적합으로 계산
+
+    앞쪽 봉은 가장 긴 창 크기만큼만 있으면 되므로, 새 봉 k개를 추가하는 비용은
+    전체 히스토리 길이와 무관하게 O(k + 창 크기)
+    반환값: closes 순서대로 MA_WINDOWS 컬럼 값 튜플 목록 (창이 덜 찬 봉은 None)
+    """
+    values = np.concatenate((np.asarray(prior, dtype=float), np.asarray(closes, dtype=float)))
+    # 직전 봉이 창보다 적게 읽혔다면 히스토리 시작부터 읽은 것이므로 위치가 곧 누적 봉 수
+    cumsum = np.concatenate(([0.0], np.cumsum(values)))
+    positions = np.arange(len(prior), len(values))
+
+    columns = []
+    for window in MA_WINDOWS.values():
+        means = (cumsum[positions + 1] - cumsum[np.maximum(positions + 1 - window, 0)]) / window
+        # 봉이 창 크기보다 적게 쌓인 구간은 비워 둠 (rolling().mean()과 동일)
+        columns.append([float(m) if pos + 1 >= window else None for m, pos in zip(means, positions)])
+    return list(zip(*columns))
+
+def _update_moving_averages(conn, symbol, from_date):
+    """from_date 이후 저장된 봉의 이동평균 다시 계산 (과거 구간 보충, 예전 저장소 변환 시)"""
+    rows = conn.execute(
+        "SELECT date, close FROM price_history WHERE symbol = ? AND date >= ? ORDER BY date",
+        (symbol, from_date)
+    ).fetchall()
+    if not rows:
+        return
+    averages = _running_moving_averages(_prior_closes(conn, symbol, from_date), [row[1] for row in rows])
+    conn.executemany(
+        f"UPDATE price_history SET {', '.join(f'{column} = ?' for column in MA_WINDOWS)} "
+        "WHERE symbol = ? AND date = ?",
+        [values + (symbol, row[0]) for row, values in zip(rows, averages)]
+    )
+
+def load_stored_history(symbol, start_dt=None):
+    """저장소에서 심볼의 종가와 이동평균 읽기 (start_dt 이후만)
+
+    반환값: Close/ma100/ma400 컬럼의 DataFrame (이동평균은 start_dt 이전 봉까지 포함해 계산된 값)
+    """
+    columns = ['Close'] + list(MA_WINDOWS)
+    select = f"SELECT date, close, {', '.join(MA_WINDOWS)} FROM price_history WHERE symbol = ?"
+    try:
+        conn = _history_db_connect()
+        if start_dt is None:
+            rows = conn.execute(f"{select} ORDER BY date", (symbol,)).fetchall()
+        else:
+            rows = conn.execute(
+                f"{select} AND date >= ? ORDER BY date",
+                (symbol, start_dt.strftime('%Y-%m-%d'))
+            ).fetchall()
+    except sqlite3.Error as e:
+        print(f"[History Store Error] {symbol} 읽기 실패: {str(e)}")
+        return pd.DataFrame(columns=columns, dtype=float)
+
+    if not rows:
+        return pd.DataFrame(columns=columns, dtype=float)
+
+    dates = [row[0] for row in rows]
+    return pd.DataFrame([row[1:] for row in rows], index=pd.to_datetime(dates), columns=columns, dtype=float)
+
+def save_stored_history(symbol, close, covered_from=None):
+    """종가 시리즈를 저장소에 추가 (같은 날짜는 덮어쓰기) 후 바뀐 구간의 이동평균 갱신
+
+    covered_from: 전체 구간을 받아온 경우 그 시작일 (이후 요청은 증분만 받음)
+    """
+    try:
+        conn = _history_db_connect()
+        with conn:
+            if not close.empty:
+                # 새 봉의 이동평균은 직전 봉에 이어 누적합으로 계산해 종가와 함께 기록
+                dates = [idx.strftime('%Y-%m-%d') for idx in close.index]
+                averages = _running_moving_averages(_prior_closes(conn, symbol, dates[0]), close.values)
+                conn.executemany(
+                    f"INSERT OR REPLACE INTO price_history (symbol, date, close, {', '.join(MA_WINDOWS)}) "
+                    f"VALUES (?, ?, ?{', ?' * len(MA_WINDOWS)})",
+                    [(symbol, date, float(value)) + values
+                     for date, value, values in zip(dates, close.values, averages)]
+                )
+                # 받아온 구간 뒤나 사이에 이미 저장된 봉이 있으면(과거 구간 보충) 그 뒤를 다시 계산
+                stored_after = conn.execute(
+                    "SELECT COUNT(*) FROM price_history WHERE symbol = ? AND date >= ?", (symbol, dates[0])
+                ).fetchone()[0]
+                if stored_after != len(dates):
+                    _update_moving_averages(conn, symbol, dates[0])
+            row = conn.execute(
+                "SELECT covered_from FROM history_meta WHERE symbol = ?", (symbol,)
+            ).fetchone()
+            if covered_from is not None:
+                new_covered = covered_from.strftime('%Y-%m-%d')
+                if row is not None and row[0] < new_covered:
+                    new_covered = row[0]
+            elif row is not None:
+                new_covered = row[0]
+            else:
+                return
+            conn.execute(
+                "INSERT OR REPLACE INTO history_meta (symbol, covered_from, updated_at) VALUES (?, ?, ?)",
+                (symbol, new_covered, time.time())
+            )
+    except sqlite3.Error as e:
+        print(f"[History Store Error] {symbol} 저장 실패: {str(e)}")
+
+def _plan_store_fetch(symbol, start_dt):
+    """저장소 상태를 보고 네트워크에서 받아올 시작일 결정
+
+    반환값: 받아올 시작일 (None이면 저장소 데이터가 최신이라 요청 불필요)
+    """
+    try:
+        conn = _history_db_connect()
+        meta = conn.execute(
+            "SELECT covered_from, updated_at FROM history_meta WHERE symbol = ?", (symbol,)
+        ).fetchone()
+        last = conn.execute(
+            "SELECT MAX(date) FROM price_history WHERE symbol = ?", (symbol,)
+        ).fetchone()
+    except sqlite3.Error as e:
+        print(f"[History Store Error] {symbol} 상태 확인 실패: {str(e)}")
+        return start_dt
+
+    # 요청 구간을 아직 받아온 적이 없으면 전체 구간 요청
+    if meta is None or last is None or last[0] is None or pd.to_datetime(meta[0]) > start_dt:
+        return start_dt
+
+    if time.time() - meta[1] < HISTORY_STORE_FRESH_SECONDS:
+        return None
+
+    # 마지막 봉은 장중에 계속 바뀌므로 마지막 저장일부터 다시 받기
+    return pd.to_datetime(last[0])
+
+def expire_stored_history(symbols):
+    """저장소의 심볼들을 오래된 것으로 표시해 다음 조회 때 마지막 봉부터 다시 받게 함 (장 마감 후 봉 확정용)"""
+    if not symbols:
+        return
+    try:
+        conn = _history_db_connect()
+        with conn:
+            conn.executemany("UPDATE history_meta SET updated_at = 0 WHERE symbol = ?", [(symbol,) for symbol in symbols])
+    except sqlite3.Error as e:
+        print(f"[History Store Error] 갱신 표시 실패: {str(e)}")
+
+def _get_stored_history(symbol, start_dt, fetch_close):
+    """저장소를 우선 사용하고 부족한 봉만 fetch_close(symbol, fetch_start)로 받아와 추가
+
+    반환값: load_stored_history와 같은 종가/이동평균 DataFrame
+    """
+    fetch_start = _plan_store_fetch(symbol, start_dt)
+    if fetch_start is not None:
+        def _fetch_and_save():
+            close = fetch_close(symbol, fetch_start)
+            save_stored_history(symbol, close, covered_from=start_dt if fetch_start <= start_dt else None)
+
+        try:
+            # 다른 세션이 같은 구간을 받아오는 중이면 그 결과(저장소 갱신)를 기다림
+            get_single_flight().do(('history', symbol, fetch_start.strftime('%Y-%m-%d')), _fetch_and_save)
+        except Exception as e:
+            stored = load_stored_history(symbol, start_dt)
+            if stored.empty:
+                raise
+            print(f"[History Store] {symbol}: 갱신 실패, 저장된 데이터 사용 ({str(e)})")
+            return stored
+    return load_stored_history(symbol, start_dt)
+
+def _normalize_close(df, source_label, ticker_symbol):
+    """데이터 소스별 DataFrame을 일봉 종가 Series로 표준화"""
+    if 'Date' in df.columns:
+        df = df.set_index('Date')
+
+    # 인덱스가 DatetimeIndex가 아니면 변환
+    if not isinstance(df.index, pd.DatetimeIndex):
+        df.index = pd.to_datetime(df.index)
+
+    # Close 컬럼 확인 (없으면 첫 번째 숫자 컬럼 사용)
+    if 'Close' in df.columns:
+        close = df['Close']
+    elif 'close' in df.columns:
+        close = df['close']
+    else:
+        numeric_cols = df.select_dtypes(include=[float, int]).columns
+        if len(numeric_cols) > 0:
+            close = df[numeric_cols[0]]
+        else:
+            raise ValueError(f"{source_label}: {ticker_symbol}에 Close 컬럼이 없습니다")
+
+    # 저장소 키와 맞추기 위해 시간대/시각 정보 제거 (일봉 기준)
+    if close.index.tz is not None:
+        close = close.tz_localize(None)
+    close = close.copy()
+    close.index = close.index.normalize()
+    close = close[~close.index.duplicated(keep='last')].sort_index().dropna()
+    close.name = 'Close'
+    return close
+
+def _empty_ticker_data():
+    """데이터를 가져오지 못했을 때 사용하는 빈 결과"""
+    return {
+        'current': 0,
+        'change_pct': 0,
+        'history': pd.Series()
+    }
+
+def _close_to_ticker_data(close, moving_averages=None):
+    """종가 시리즈로 현재가/등락율/히스토리 결과 구성
+
+    moving_averages: 저장소에서 미리 계산된 이동평균 DataFrame (MA_WINDOWS 컬럼, close와 같은 인덱스)
+    """
+    if len(close) >= 2:
+        current_price = close.iloc[-1]
+        prev_price = close.iloc[-2]
+    elif len(close) == 1:
+        current_price = close.iloc[-1]
+        prev_price = current_price
+    else:
+        current_price = 0
+        prev_price = 0
+
+    change_pct = ((current_price - prev_price) / prev_price) * 100 if prev_price != 0 else 0
+
+    return {
+        'current': current_price,
+        'change_pct': change_pct,
+        'history': close,
+        'moving_averages': moving_averages
+    }
+
+def _close_to_quote(close):
+    """종가 시리즈의 마지막 두 봉으로 시세 구성 (봉이 하나면 전일 종가 = 현재가)"""
+    return {
+        'price': float(close.iloc[-1]),
+        'prev_close': float(close.iloc[-2]) if len(close) >= 2 else float(close.iloc[-1]),
+        'as_of': close.index[-1]
+    }
+
+def _stored_to_ticker_data(stored):
+    """저장소 DataFrame(종가 + 이동평균)으로 티커 데이터 구성"""
+    return _close_to_ticker_data(stored['Close'], stored[list(MA_WINDOWS)])
+
+@st.cache_data(ttl=60, show_spinner=False)
+def get_yfinance_batch(symbols, start, _op='batch'):
+    """여러 yfinance 심볼을 한 번의 다운로드로 가져와 심볼별 종가 시리즈로 분리
+
+    symbols: 정렬된 심볼 튜플 (캐시 키로 사용)
+    start: 시작일 문자열 (YYYY-MM-DD)
+    _op: 계측에 기록할 작업 이름 (캐시 키에서 제외)
+    반환값: {symbol: 종가 Series} (데이터가 없는 심볼은 제외)
+    """
+    return download_yfinance_closes(symbols, start, _op)
+
+# yf.download는 심볼별 실패를 예외 대신 'yfinance' 로거의 ERROR 로그로만 남김
+YFINANCE_NO_DATA_MARKERS = ('possibly delisted', 'no price data found', 'no timezone found')
+
+class _YFinanceErrorLog(logging.Handler):
+    """현재 스레드에서 진행 중인 yf.download의 오류 로그를 모으는 핸들러"""
+
+    def __init__(self):
+        super().__init__(level=logging.ERROR)
+        self._local = threading.local()
+
+    def emit(self, record):
+        messages = getattr(self._local, 'messages', None)
+        if messages is not None:
+            messages.append(record.getMessage())
+
+    def run(self, fn):
+        """fn 실행 중 이 스레드에서 남은 오류 로그와 함께 결과 반환 (반환값: (결과, 로그 목록))"""
+        self._local.messages = messages = []
+        try:
+            return fn(), messages
+        finally:
+            self._local.messages = None
+
+@st.cache_resource
+def get_yfinance_error_log():
+    """yfinance 로거에 한 번만 붙이는 오류 로그 핸들러"""
+    handler = _YFinanceErrorLog()
+    logging.getLogger('yfinance').addHandler(handler)
+    return handler
+
+def _raise_empty_yfinance_download(symbols, messages):
+    """빈 다운로드 결과를 예외로 변환
+
+    모든 오류가 '데이터 없음'(상장폐지/오타 등)이면 NoDataError, 그 밖(네트워크, 요청 한도, 오류 로그 없음)은
+    데이터 소스 장애로 보고 RuntimeError를 올려 재시도/서킷 브레이커가 판단하도록 함
+    """
+    errors = [message for message in messages if message.startswith('[')]
+    if errors and all(any(marker in error for marker in YFINANCE_NO_DATA_MARKERS) for error in errors):
+        raise NoDataError(f"yfinance: {', '.join(symbols)}에 대한 데이터가 없습니다")
+    raise RuntimeError(f"yfinance: {', '.join(symbols)} 다운로드 결과가 비어 있습니다 ({errors[-1] if errors else '응답 없음'})")
+
+def download_yfinance_closes(symbols, start, op='batch'):
+    """get_yfinance_batch의 캐시 없는 버전 (실시간 시세처럼 더 짧은 주기로 받을 때 사용)
+
+    계측은 실제로 다운로드할 때만 기록 (get_yfinance_batch 캐시 적중은 호출로 세지 않음)
+    """
+    closes = {}
+    if not symbols:
+        return closes
+
+    def _download():
+        df, messages = get_yfinance_error_log().run(lambda: yf.download(
+            list(symbols),
+            start=start,
+            group_by='column',
+            progress=False,
+            threads=True,
+            timeout=TICKER_FETCH_TIMEOUT
+        ))
+        # yf.download는 요청이 모두 실패해도 예외 없이 빈 DataFrame을 돌려줌
+        if df is None or df.empty:
+            _raise_empty_yfinance_download(symbols, messages)
+        return df
+
+    # 다운로드 오류는 그대로 전달해 재시도/서킷 브레이커가 판단하도록 함
+    df = _instrumented('yfinance', op, symbols[0] if len(symbols) == 1 else None, _download)
+
+    # 다중 심볼 다운로드는 (Price, Ticker) 2단 컬럼을 반환
+    if isinstance(df.columns, pd.MultiIndex):
+        if 'Close' not in df.columns.get_level_values(0):
+            return closes
+        close_df = df['Close']
+    elif 'Close' in df.columns and len(symbols) == 1:
+        close_df = df[['Close']].rename(columns={'Close': symbols[0]})
+    else:
+        return closes
+
+    for symbol in symbols:
+        if symbol in close_df.columns:
+            close = _normalize_close(close_df[[symbol]].rename(columns={symbol: 'Close'}), "yfinance", symbol)
+            get_provider_metrics().record_rows('yfinance', len(close_df), len(close))
+            if not close.empty:
+                closes[symbol] = close
+
+    return closes
+
+# 데이터 소스(provider) 공통 인터페이스
+# 새 데이터 소스는 DataProvider를 상속해 DATA_PROVIDERS와 PROVIDER_ROUTING에 등록하면 됨
+class DataProvider:
+    """데이터 소스 공통 인터페이스"""
+    name = ''
+    label = ''
+    concurrency = 1  # 동시 요청 수 제한
+    supports_batch = False  # fetch_history_batch 지원 여부
+    batch_quotes = False  # fetch_quotes가 요청 한 번으로 여러 심볼을 받는지 (아니면 심볼마다 따로 요청)
+    quote_fallback = False  # 히스토리가 없을 때 fetch_quote로 최소 데이터 구성 여부
+    rate_limit = None  # 초당 요청 수 제한 (None이면 제한 없음)
+    self_instrumented = False  # True면 메서드가 자체 캐시를 거치므로 계측은 실제 요청하는 곳에서 직접 기록
+    rate_burst = 1  # 한꺼번에 보낼 수 있는 요청 수
+
+    def is_available(self):
+        """라이브러리/클라이언트를 사용할 수 있는지 여부"""
+        return True
+
+    def supports(self, ticker_symbol):
+        """이 데이터 소스가 처리하는 심볼인지 여부"""
+        raise NotImplementedError
+
+    def fetch_history(self, ticker_symbol, fetch_start):
+        """fetch_start 이후 일봉 종가 Series 반환"""
+        raise NotImplementedError
+
+    def fetch_history_batch(self, ticker_symbols, fetch_start):
+        """여러 심볼의 종가를 한 번에 가져오기 (반환값: {symbol: 종가 Series})"""
+        return {symbol: self.fetch_history(symbol, fetch_start) for symbol in ticker_symbols}
+
+    def fetch_quote(self, ticker_symbol):
+        """(현재가, 전일 종가) 반환 - 기본 구현은 fetch_recent_quote 사용"""
+        quote = self.fetch_recent_quote(ticker_symbol)
+        return quote['price'], quote['prev_close']
+
+    def fetch_quotes(self, ticker_symbols):
+        """여러 심볼의 최신 시세를 요청 한 번으로 가져오기 (batch_quotes 데이터 소스만 구현)
+
+        나머지 데이터 소스는 _load_provider_quotes가 심볼마다 fetch_recent_quote를 따로 요청함
+        반환값: {symbol: {'price': 현재가, 'prev_close': 전일 종가, 'as_of': 봉 날짜}} (데이터가 없는 심볼은 제외)
+        """
+        raise NotImplementedError
+
+    def fetch_recent_quote(self, ticker_symbol):
+        """심볼 하나의 최신 시세 (최근 QUOTE_LOOKBACK_DAYS일 봉으로 구성, 봉이 없으면 NoDataError)"""
+        start = pd.Timestamp(datetime.now().date()) - pd.Timedelta(days=QUOTE_LOOKBACK_DAYS)
+        close = self.fetch_history(ticker_symbol, start)
+        if close.empty:
+            raise NoDataError(f"{self.label}: {ticker_symbol}에 대한 시세가 없습니다")
+        return _close_to_quote(close)
+
+    def fallback_symbol(self, ticker_symbol):
+        """이 데이터 소스를 쓸 수 없거나 실패했을 때 대신 시도할 심볼 (없으면 None)"""
+        return None
+
+    def history_start(self, ticker_symbol, start_dt):
+        """start_dt부터 요청했을 때 실제로 받을 수 있는 시작일 (저장소의 covered_from으로 기록됨)"""
+        return start_dt
+
+class TradingViewProvider(DataProvider):
+    """트레이딩뷰 (EXCHANGE:SYMBOL 형식, 예: TVC:KR10Y)"""
+    name = 'tradingview'
+    label = 'TradingView'
+    concurrency = 1  # 웹소켓 하나를 공유하므로 1개
+    rate_limit = 1
+    rate_burst = 3
+
+    def is_available(self):
+        return get_tv_client() is not None
+
+    def supports(self, ticker_symbol):
+        return ':' in ticker_symbol
+
+    def history_start(self, ticker_symbol, start_dt):
+        # 한 번에 받을 수 있는 봉 수를 넘는 구간은 잘리므로, 받을 수 있는 구간까지만 요청하고 그만큼만 받았다고 기록
+        return max(start_dt, _tv_earliest_start(ticker_symbol.split(':', 1)[0]))
+
+    def fallback_symbol(self, ticker_symbol):
+        # 콜론 뒤 부분이 한국 국채(KR10Y 등)면 FDR로 재시도
+        parts = ticker_symbol.split(':', 1)
+        if len(parts) == 2 and parts[1].startswith('KR'):
+            return parts[1]
+        return None
+
+    def fetch_history(self, ticker_symbol, fetch_start):
+        # exchange와 symbol 분리
+        parts = ticker_symbol.split(':', 1)
+        if len(parts) != 2:
+            raise NoDataError(f"TradingView: 잘못된 심볼 형식 - {ticker_symbol}")
+
+        exchange = parts[0]
+        symbol = parts[1]
+
+        # 필요한 구간만큼만 요청 (증분 갱신이면 몇 개 봉)
+        interval, n_bars = _plan_tv_bars(exchange, fetch_start)
+        if interval is None:
+            raise ValueError("TradingView: Interval을 사용할 수 없습니다")
+
+        df = get_tv_client().get_hist(
+            symbol=symbol,
+            exchange=exchange,
+            interval=interval,
+            n_bars=n_bars
+        )
+
+        if df is None or df.empty:
+            raise NoDataError(f"TradingView: {ticker_symbol}에 대한 데이터가 없습니다")
+
+        close = _normalize_close(df, "TradingView", ticker_symbol)
+        close = close[close.index >= fetch_start]
+        get_provider_metrics().record_rows(self.name, len(df), len(close))
+        return close
+
+class FDRProvider(DataProvider):
+    """FinanceDataReader (한국 국채 KR10Y, KR3Y, KR30Y 등)"""
+    name = 'fdr'
+    label = 'FDR'
+    concurrency = 4
+    rate_limit = 2
+    rate_burst = 4
+
+    def supports(self, ticker_symbol):
+        return ticker_symbol.startswith('KR') and len(ticker_symbol) >= 3
+
+    def fetch_history(self, ticker_symbol, fetch_start):
+        df = fdr.DataReader(ticker_symbol, fetch_start.strftime('%Y-%m-%d'), datetime.now().strftime('%Y-%m-%d'))
+
+        if df is None or df.empty:
+            raise NoDataError(f"FDR: {ticker_symbol}에 대한 데이터가 없습니다")
+
+        close = _normalize_close(df, "FDR", ticker_symbol)
+        get_provider_metrics().record_rows(self.name, len(df), len(close))
+        return close
+
+class YFinanceProvider(DataProvider):
+    """yfinance (그 외 모든 심볼)"""
+    name = 'yfinance'
+    label = 'yfinance'
+    concurrency = 8
+    supports_batch = True
+    batch_quotes = True
+    quote_fallback = True
+    rate_limit = 2
+    rate_burst = 8
+    self_instrumented = True  # get_yfinance_batch(st.cache_data) 적중은 호출로 세지 않음
+
+    def supports(self, ticker_symbol):
+        return True
+
+    def fetch_history(self, ticker_symbol, fetch_start):
+        closes = get_yfinance_batch((ticker_symbol,), start=fetch_start.strftime('%Y-%m-%d'), _op='history')
+        return closes.get(ticker_symbol, pd.Series(dtype=float, name='Close'))
+
+    def fetch_history_batch(self, ticker_symbols, fetch_start):
+        return get_yfinance_batch(tuple(sorted(ticker_symbols)), start=fetch_start.strftime('%Y-%m-%d'))
+
+    def fetch_quotes(self, ticker_symbols):
+        # 히스토리용 60초 캐시를 거치지 않고 최근 며칠 일봉을 한 번에 다운로드 (오늘 봉 = 현재가)
+        start = pd.Timestamp(datetime.now().date()) - pd.Timedelta(days=QUOTE_LOOKBACK_DAYS)
+        closes = download_yfinance_closes(tuple(sorted(ticker_symbols)), start.strftime('%Y-%m-%d'), op='quote')
+        return {symbol: _close_to_quote(close) for symbol, close in closes.items() if not close.empty}
+
+    def fetch_quote(self, ticker_symbol):
+        info = _instrumented(self.name, 'quote', ticker_symbol, lambda: yf.Ticker(ticker_symbol).info)
+        current_price = info.get('regularMarketPrice', info.get('previousClose'))
+        if current_price is None:
+            # 잘못된 심볼/상장폐지 종목은 가격 없는 info를 돌려줌
+            raise NoDataError(f"yfinance: {ticker_symbol}에 대한 시세가 없습니다")
+        prev_price = info.get('previousClose', current_price)
+        return current_price, prev_price
+
+# 오프라인 벤치마크/부하 테스트용 가짜 데이터 소스
+# FAKE:로 시작하는 심볼을 처리하고, 환경변수 MACRO_FAKE_DATA=1(FAKE_DATA_ENABLED)이면 모든 심볼을 처리
+FAKE_LATENCY_SECONDS = float(os.environ.get('MACRO_FAKE_LATENCY_MS', '0')) / 1000  # 네트워크 지연 흉내
+FAKE_HISTORY_ORIGIN = pd.Timestamp('2000-01-03')  # 합성 시리즈 시작일 (고정이라 결과가 항상 같음)
+
+class FakeProvider(DataProvider):
+    """심볼마다 결정적인 합성 시계열을 만들어 주는 로컬 데이터 소스"""
+    name = 'fake'
+    label = 'Fake'
+    concurrency = 8
+    batch_quotes = True
+
+    def supports(self, ticker_symbol):
+        return FAKE_DATA_ENABLED or ticker_symbol.startswith('FAKE:')
+
+    def _series(self, ticker_symbol):
+        """심볼 이름으로 시드를 정해 평일 기준 기하 랜덤워크 생성"""
+        # bdate_range는 긴 구간에서 느리므로 일 단위 범위에서 주말만 제외
+        dates = pd.date_range(FAKE_HISTORY_ORIGIN, pd.Timestamp(datetime.now().date()), freq='D')
+        dates = dates[dates.dayofweek < 5]
+        rng = np.random.default_rng(zlib.crc32(ticker_symbol.encode('utf-8')))
+        start_price = rng.uniform(10, 5000)
+        returns = rng.normal(0.0002, 0.012, len(dates))
+        return pd.Series(start_price * np.exp(np.cumsum(returns)), index=dates, name='Close')
+
+    def fetch_history(self, ticker_symbol, fetch_start):
+        if FAKE_LATENCY_SECONDS > 0:
+            time.sleep(FAKE_LATENCY_SECONDS)
+        full = self._series(ticker_symbol)
+        close = full[full.index >= fetch_start]
+        get_provider_metrics().record_rows(self.name, len(full), len(close))
+        return close
+
+    def fetch_quotes(self, ticker_symbols):
+        # 실시간 모드 확인용: 마지막 봉 가격을 시세 캐시 주기마다 조금씩 흔들어 장중 변동 흉내
+        if FAKE_LATENCY_SECONDS > 0:
+            time.sleep(FAKE_LATENCY_SECONDS)
+        quotes = {}
+        tick = int(time.time() // LIVE_QUOTE_TTL)
+        for symbol in ticker_symbols:
+            quote = _close_to_quote(self._series(symbol).iloc[-QUOTE_LOOKBACK_DAYS:])
+            rng = np.random.default_rng(zlib.crc32(symbol.encode('utf-8')) ^ tick)
+            quote['price'] *= 1 + rng.normal(0, 0.002)
+            quotes[symbol] = quote
+        return quotes
+
+# 데이터 소스 등록 및 라우팅 순서 (앞에서부터 supports()가 True인 첫 데이터 소스 사용)
+DATA_PROVIDERS = {
+    'fake': FakeProvider(),
+    'tradingview': TradingViewProvider(),
+    'fdr': FDRProvider(),
+    'yfinance': YFinanceProvider()
+}
+PROVIDER_ROUTING = ['fake', 'tradingview', 'fdr', 'yfinance']
+
+# 데이터 소스별 장애 대응 (요청 속도 제한 + 지터 재시도 + 서킷 브레이커)
+# 서킷이 열린 동안은 요청 없이 바로 실패시켜, 호출한 쪽이 저장소/캐시의 마지막 정상 데이터를 쓰게 함
+PROVIDER_RETRY_ATTEMPTS = 3  # 첫 시도를 포함한 최대 시도 횟수
+PROVIDER_RETRY_BASE_DELAY = 0.5  # 재시도 대기 기준 (초) - 시도마다 2배, 0~기준 사이에서 무작위
+PROVIDER_RETRY_MAX_DELAY = 4  # 재시도 대기 상한 (초)
+PROVIDER_RATE_WAIT_MAX = 10  # 요청 토큰을 기다리는 최대 시간 (초)
+CIRCUIT_FAILURE_THRESHOLD = 5  # 연속 실패가 이만큼 쌓이면 서킷을 엶
+CIRCUIT_COOLDOWN = 30  # 서킷이 열린 뒤 시험 요청까지 대기 (초) - 시험 요청도 실패하면 2배씩 늘림
+CIRCUIT_COOLDOWN_MAX = 10 * 60
+
+class NoDataError(ValueError):
+    """데이터 소스는 정상 응답했지만 심볼에 데이터가 없음 (재시도하지 않고 서킷 실패로도 세지 않음)"""
+
+class ProviderUnavailableError(RuntimeError):
+    """서킷이 열려 있거나 요청 토큰을 얻지 못해 요청하지 않음"""
+
+class _TokenBucket:
+    """초당 rate개씩 채워지고 최대 burst개까지 쌓이는 요청 토큰"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout):
+        """토큰 하나 사용 (timeout 안에 얻지 못하면 False)"""
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+class _CircuitBreaker:
+    """연속 실패가 쌓이면 열려서 요청을 막고, 대기 후 시험 요청 하나로 복구 여부 확인"""
+
+    def __init__(self, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, cooldown=CIRCUIT_COOLDOWN,
+                 cooldown_max=CIRCUIT_COOLDOWN_MAX):
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.cooldown_max = cooldown_max
+        self._lock = threading.Lock()
+        self.state = 'closed'  # closed / open / half_open
+        self._failures = 0
+        self._cooldown = cooldown
+        self._opened_at = 0.0
+        self._last_error = None
+
+    def allow(self):
+        """요청해도 되는지 여부 (열린 뒤 대기 시간이 지나면 시험 요청 하나만 통과)"""
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            # 시험 요청이 결과 없이 끝났어도(토큰 대기 초과 등) 대기 시간이 지나면 다시 시험
+            if time.time() - self._opened_at >= self._cooldown:
+                self.state = 'half_open'
+                self._opened_at = time.time()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self._failures = 0
+            self._cooldown = self.base_cooldown
+
+    def record_failure(self, error):
+        with self._lock:
+            self._failures += 1
+            self._last_error = str(error)
+            if self.state == 'half_open':
+                self._cooldown = min(self._cooldown * 2, self.cooldown_max)
+            elif self._failures < self.failure_threshold:
+                return
+            self.state = 'open'
+            self._opened_at = time.time()
+
+    def status(self):
+        """디버깅 패널용 상태"""
+        with self._lock:
+            retry_in = max(0.0, self._cooldown - (time.time() - self._opened_at)) if self.state != 'closed' else 0.0
+            return {
+                'state': self.state,
+                'failures': self._failures,
+                'retry_in': retry_in,
+                'last_error': self._last_error
+            }
+
+class _ProviderGuard:
+    """데이터 소스 하나의 요청 토큰과 서킷 브레이커"""
+
+    def __init__(self, provider):
+        self.provider = provider
+        self.bucket = _TokenBucket(provider.rate_limit, provider.rate_burst) if provider.rate_limit else None
+        self.breaker = _CircuitBreaker()
+
+    def call(self, op, symbol, fn):
+        """fn을 속도 제한/재시도/서킷 브레이커를 거쳐 실행 (NoDataError는 그대로 전달)"""
+        provider = self.provider
+        if not self.breaker.allow():
+            raise ProviderUnavailableError(
+                f"{provider.label}: 일시적으로 요청 중단 ({self.breaker.status()['retry_in']:.0f}초 후 재시도)"
+            )
+
+        # 시험 요청은 한 번만 시도
+        attempts = PROVIDER_RETRY_ATTEMPTS if self.breaker.state == 'closed' else 1
+        for attempt in range(attempts):
+            if self.bucket is not None and not self.bucket.acquire(PROVIDER_RATE_WAIT_MAX):
+                raise ProviderUnavailableError(f"{provider.label}: 요청 한도 대기 시간 초과")
+            try:
+                result = fn() if provider.self_instrumented else _instrumented(provider.name, op, symbol, fn)
+            except NoDataError:
+                self.breaker.record_success()
+                raise
+            except Exception as e:
+                if attempt + 1 < attempts:
+                    delay = random.uniform(0, min(PROVIDER_RETRY_MAX_DELAY, PROVIDER_RETRY_BASE_DELAY * 2 ** attempt))
+                    print(f"[{provider.label} Retry] {op} {symbol or ''}: {str(e)} ({delay:.1f}초 후 재시도)")
+                    time.sleep(delay)
+                    continue
+                self.breaker.record_failure(e)
+                raise
+            self.breaker.record_success()
+            return result
+
+@st.cache_resource
+def get_provider_guards():
+    """모든 세션이 공유하는 데이터 소스별 장애 대응 상태"""
+    return {name: _ProviderGuard(provider) for name, provider in DATA_PROVIDERS.items()}
+
+def call_provider(provider, op, symbol, fn):
+    """데이터 소스 호출 (계측 + 속도 제한 + 재시도 + 서킷 브레이커)"""
+    return get_provider_guards()[provider.name].call(op, symbol, fn)
+
+def resolve_provider(ticker_symbol):
+    """심볼을 처리할 데이터 소스와 실제 요청할 심볼 반환
+
+    사용할 수 없는 데이터 소스는 fallback_symbol이 있으면 그 심볼로, 없으면 다음 순서로 넘어감
+    """
+    for name in PROVIDER_ROUTING:
+        provider = DATA_PROVIDERS[name]
+        if not provider.supports(ticker_symbol):
+            continue
+        if provider.is_available():
+            return provider, ticker_symbol
+        fallback = provider.fallback_symbol(ticker_symbol)
+        if fallback is not None:
+            return resolve_provider(fallback)
+    return DATA_PROVIDERS['yfinance'], ticker_symbol
+
+SWR_CACHE_MAX_ENTRIES = 512  # 캐시 항목 수 상한 (넘으면 가장 오래 읽지 않은 항목부터 제거)
+SWR_IDLE_EVICT_TTLS = 3  # 유지 시간의 이 배수만큼 읽히지 않은 항목은 제거 (관심 종목 변경 후 남은 배치 키 등)
+
+class _StaleWhileRevalidateCache:
+    """만료된 값은 즉시 돌려주고 갱신은 백그라운드에서 수행하는 프로세스 공용 캐시
+
+    항목은 최근 읽은 순서로 관리해 max_entries를 넘거나 오래 읽히지 않으면 제거
+    """
+
+    def __init__(self, ttl, max_workers=4, ttl_for=None, max_entries=SWR_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._ttl_for = ttl_for  # (key, value) -> 유지 시간 (값에 따라 유지 시간을 달리할 때)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (갱신 시각, 값), 최근 읽은 항목이 뒤쪽
+        self._last_read = {}  # key -> 마지막으로 읽은 시각
+        self._refreshing = set()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="swr-refresh")
+
+    def reserve(self, n_entries):
+        """항목 수 상한을 최소 n_entries로 늘림 (한 번에 읽는 항목끼리 서로 밀어내지 않도록, 줄이지는 않음)"""
+        with self._lock:
+            self.max_entries = max(self.max_entries, n_entries)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def _entry_ttl(self, key, value):
+        return self._ttl_for(key, value) if self._ttl_for is not None else self.ttl
+
+    def _store(self, key, value):
+        """값 저장 후 오래 읽히지 않은 항목과 상한을 넘는 항목 제거 (lock 안에서 호출)"""
+        now = time.time()
+        self._entries[key] = (now, value)
+        self._entries.move_to_end(key)
+        self._last_read.setdefault(key, now)
+        for old_key in [k for k, (_, v) in self._entries.items()
+                        if now - self._last_read.get(k, now) > self._entry_ttl(k, v) * SWR_IDLE_EVICT_TTLS]:
+            del self._entries[old_key]
+            self._last_read.pop(old_key, None)
+        while len(self._entries) > self.max_entries:
+            old_key, _ = self._entries.popitem(last=False)
+            self._last_read.pop(old_key, None)
+
+    def get(self, key, loader, refresh_ahead=None, wait=True):
+        """캐시 값 반환 (없으면 loader로 바로 로드)
+
+        refresh_ahead: 0~1 사이 값이면 유지 시간의 그 비율만 지나도 백그라운드 갱신 (캐시 워머용, 적중률 계측에서 제외)
+        wait: False면 캐시에 없을 때 기다리지 않고 백그라운드에서 로드한 뒤 (None, True) 반환
+        반환값: (값, 백그라운드 갱신 중 여부)
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._last_read[key] = time.time()
+
+        metrics = get_provider_metrics()
+
+        def _record(result):
+            if refresh_ahead is None:
+                metrics.record_cache(key[0], result)
+
+        if entry is None:
+            _record('miss')
+            if not wait:
+                self._schedule_refresh(key, loader)
+                return None, True
+            # 여러 세션이 동시에 처음 요청해도 로드는 한 번만 수행
+            value = get_single_flight().do(('cache-miss', key), loader)
+            with self._lock:
+                self._last_read[key] = time.time()
+                self._store(key, value)
+            return value, False
+
+        fetched_at, value = entry
+        ttl = self._entry_ttl(key, value)
+        if refresh_ahead is not None:
+            ttl *= refresh_ahead
+        if time.time() - fetched_at < ttl:
+            _record('hit')
+            return value, key in self._refreshing
+
+        _record('stale')
+
+        # 만료된 값은 그대로 돌려주고 갱신은 한 번만 예약
+        self._schedule_refresh(key, loader)
+        return value, True
+
+    def _schedule_refresh(self, key, loader):
+        """키의 백그라운드 로드를 한 번만 예약"""
+        with self._lock:
+            if key not in self._refreshing:
+                self._refreshing.add(key)
+                self._executor.submit(self._refresh, key, loader, get_script_run_ctx())
+
+    def _refresh(self, key, loader, ctx):
+        """백그라운드 갱신 작업"""
+        if ctx is not None:
+            add_script_run_ctx(threading.current_thread(), ctx)
+        try:
+            value = loader()
+            with self._lock:
+                self._store(key, value)
+        except Exception as e:
+            print(f"[Background Refresh Error] {key}: {str(e)}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+# 데이터가 없는 심볼(오타, 상장폐지 등) 음성 캐시
+# 데이터 소스가 정상 응답했는데도 데이터가 없으면 재시도 간격을 2배씩 늘려 그동안 요청하지 않음
+NEGATIVE_CACHE_BASE_TTL = 5 * 60  # 첫 재시도까지 대기 (초)
+NEGATIVE_CACHE_MAX_TTL = 24 * 60 * 60  # 재시도 간격 상한 (초)
+
+class _NegativeCache:
+    """심볼별 연속 '데이터 없음' 횟수와 다음 재시도 시각"""
+
+    def __init__(self, base_ttl=NEGATIVE_CACHE_BASE_TTL, max_ttl=NEGATIVE_CACHE_MAX_TTL):
+        self.base_ttl = base_ttl
+        self.max_ttl = max_ttl
+        self._lock = threading.Lock()
+        self._entries = {}  # symbol -> (연속 횟수, 재시도 시각)
+
+    def retry_at(self, symbol):
+        """재시도 전이면 재시도 시각, 아니면 None"""
+        with self._lock:
+            entry = self._entries.get(symbol)
+        if entry is None or time.time() >= entry[1]:
+            return None
+        return entry[1]
+
+    def record(self, symbol):
+        """'데이터 없음' 기록 후 다음 재시도 시각 반환"""
+        with self._lock:
+            misses = self._entries.get(symbol, (0, 0))[0] + 1
+            retry_at = time.time() + min(self.base_ttl * 2 ** (misses - 1), self.max_ttl)
+            self._entries[symbol] = (misses, retry_at)
+        return retry_at
+
+    def clear(self, symbol):
+        with self._lock:
+            self._entries.pop(symbol, None)
+
+@st.cache_resource
+def get_negative_cache():
+    """모든 세션이 공유하는 음성 캐시"""
+    return _NegativeCache()
+
+def _history_entry_ttl(key, value):
+    """히스토리 캐시 항목별 유지 시간 (데이터 없음은 재시도 시각까지, 장애로 비어 있으면 짧게)"""
+    if key[0] != 'ticker':
+        return TICKER_HISTORY_TTL
+    if value.get('retry_at') is not None:
+        return value['retry_after']
+    if value['history'].empty:
+        return TICKER_DATA_TTL
+    return TICKER_HISTORY_TTL
+
+HISTORY_CACHE_MAX_ENTRIES = 256  # 히스토리는 항목당 최장 20년치라 다른 캐시보다 상한을 낮게
+HISTORY_CACHE_HEADROOM = 2  # 관심 종목 수의 이 배수까지는 상한을 늘려 한 번의 렌더링이 자기 항목을 밀어내지 않도록
+
+@st.cache_resource
+def get_history_cache():
+    """모든 세션이 공유하는 티커 히스토리 캐시"""
+    return _StaleWhileRevalidateCache(ttl=TICKER_HISTORY_TTL, ttl_for=_history_entry_ttl,
+                                      max_entries=HISTORY_CACHE_MAX_ENTRIES)
+
+def get_ticker_history(ticker_symbol, refresh_ahead=None):
+    """티커의 최장 히스토리를 캐시에서 반환 (만료 시 이전 값을 주고 백그라운드에서 갱신)"""
+    value, refreshing = get_history_cache().get(
+        ('ticker', ticker_symbol),
+        lambda: _load_ticker_history(ticker_symbol),
+        refresh_ahead
+    )
+    return {**value, 'refreshing': refreshing}
+
+def _load_ticker_history(ticker_symbol):
+    """티커의 최장 히스토리(HISTORY_MAX_PERIOD)를 가져오는 함수 (조회 기간과 무관)
+
+    모든 데이터 소스가 '데이터 없음'으로 응답하면 음성 캐시에 기록하고, 재시도 시각 전까지는 요청하지 않음
+    반환값의 retry_at: 음성 캐시에 있는 심볼의 다음 재시도 시각 (카드 표시용)
+    """
+    negative = get_negative_cache()
+    retry_at = negative.retry_at(ticker_symbol)
+    if retry_at is not None:
+        get_provider_metrics().record_cache('negative', 'hit')
+        return {**_empty_ticker_data(), 'retry_at': retry_at, 'retry_after': retry_at - time.time()}
+
+    errors = []
+    ticker_data = _fetch_ticker_history(ticker_symbol, errors)
+    if not ticker_data['history'].empty:
+        negative.clear(ticker_symbol)
+        return ticker_data
+
+    # 데이터 소스 장애(타임아웃, 서킷 차단 등)는 음성 캐시에 넣지 않음
+    if errors and all(isinstance(e, NoDataError) for e in errors):
+        retry_at = negative.record(ticker_symbol)
+        print(f"[No Data] {ticker_symbol}: {datetime.fromtimestamp(retry_at).strftime('%H:%M')}까지 요청하지 않음")
+        return {**ticker_data, 'retry_at': retry_at, 'retry_after': retry_at - time.time()}
+    return ticker_data
+
+def _fetch_ticker_history(ticker_symbol, errors):
+    """데이터 소스에서 티커의 최장 히스토리 가져오기 (발생한 예외는 errors에 모음)
+
+    데이터 소스는 PROVIDER_ROUTING 순서로 결정 (예: TVC:KR10Y는 트레이딩뷰, KR10Y는 FDR, 그 외 yfinance)
+    히스토리는 로컬 저장소에 누적되고, 새로고침 시에는 마지막 저장일 이후 봉만 받아옴
+    """
+    provider, symbol = resolve_provider(ticker_symbol)
+    start_dt = provider.history_start(symbol, _period_start(HISTORY_MAX_PERIOD))
+
+    def _fetch_close(fetch_symbol, fetch_start):
+        return call_provider(provider, 'history', fetch_symbol,
+                             lambda: provider.fetch_history(fetch_symbol, fetch_start))
+
+    try:
+        stored = _get_stored_history(symbol, start_dt, _fetch_close)
+        if stored.empty:
+            raise NoDataError(f"{provider.label}: {symbol}에 대한 데이터가 없습니다")
+        return _stored_to_ticker_data(stored)
+    except Exception as e:
+        errors.append(e)
+        print(f"[{provider.label} Error] {symbol}: {str(e)}")
+
+    # 다른 데이터 소스로 재시도 (예: TVC:KR10Y 실패 시 FDR의 KR10Y)
+    fallback = provider.fallback_symbol(symbol)
+    if fallback is not None:
+        print(f"[Fallback] {provider.label} 실패, 다른 데이터 소스로 재시도: {fallback}")
+        return _fetch_ticker_history(fallback, errors)
+
+    # 히스토리가 없으면 시세 정보로 최소 데이터 구성 (저장소에는 기록하지 않음)
+    if provider.quote_fallback:
+        try:
+            current_price, prev_price = call_provider(provider, 'quote', symbol,
+                                                      lambda: provider.fetch_quote(symbol))
+            hist = pd.Series([prev_price, current_price],
+                             index=pd.date_range(end=datetime.now(), periods=2, freq='D'), name='Close')
+            return _close_to_ticker_data(hist)
+        except Exception as e:
+            errors.append(e)
+            print(f"[{provider.label} Quote Error] {symbol}: {str(e)}")
+
+    return _empty_ticker_data()
+
+def _slice_ticker_data(ticker_data, period):
+    """최장 히스토리 결과에서 조회 기간만큼 잘라낸 결과 반환 (현재가/등락율은 그대로)"""
+    history = ticker_data['history']
+    if history.empty:
+        return ticker_data
+    mask = history.index >= _period_start(period)
+    moving_averages = ticker_data.get('moving_averages')
+    return {
+        **ticker_data,
+        'history': history[mask],
+        # 이동평균은 전체 히스토리로 계산된 값을 같은 구간만 잘라 사용 (짧은 기간에도 80주선 유지)
+        'moving_averages': moving_averages[mask] if moving_averages is not None else None
+    }
+
+def get_ticker_data(ticker_symbol, period="1y", cache_key=None):
+    """티커 데이터를 가져오는 함수 (기간별 히스토리 포함)
+
+    네트워크 요청은 get_ticker_history에서 심볼당 한 번만 하고, 기간 변경은 메모리에서 슬라이스
+    """
+    return _slice_ticker_data(get_ticker_history(ticker_symbol), period)
+
+def _fetch_batch_into_store(provider, symbols, start_dt):
+    """배치를 지원하는 데이터 소스의 심볼을 저장소 기준 시작일별로 묶어 받아온 뒤 저장
+
+    반환값: 저장소에서 데이터를 확보한 심볼 집합
+    """
+    # 저장소 상태에 따라 시작일이 같은 심볼끼리 묶기 (대부분 한두 개 그룹)
+    groups = {}
+    ready = set()
+    for symbol in symbols:
+        fetch_start = _plan_store_fetch(symbol, start_dt)
+        if fetch_start is None:
+            ready.add(symbol)
+        else:
+            groups.setdefault(fetch_start.strftime('%Y-%m-%d'), []).append(symbol)
+
+    for fetch_start, group in groups.items():
+        group = tuple(sorted(group))
+        fetch_start_dt = pd.to_datetime(fetch_start)
+        try:
+            closes = get_single_flight().do(
+                ('batch', provider.name, group, fetch_start),
+                lambda: call_provider(provider, 'batch', None,
+                                      lambda: provider.fetch_history_batch(group, fetch_start_dt))
+            )
+        except Exception as e:
+            # 갱신에 실패하면 저장소에 남아 있는 마지막 정상 데이터 사용 (저장소에 없는 심볼은 개별 요청 경로로)
+            print(f"[{provider.label} Batch Error] {len(group)}개 심볼: {str(e)}")
+            ready.update(group)
+            continue
+        for symbol in group:
+            if symbol in closes and not closes[symbol].empty:
+                is_backfill = fetch_start_dt <= start_dt
+                save_stored_history(symbol, closes[symbol], covered_from=start_dt if is_backfill else None)
+                ready.add(symbol)
+
+    return ready
+
+def _load_batch_histories(provider_name, symbols):
+    """데이터 소스의 심볼들을 배치로 저장소에 채운 뒤 최장 히스토리 결과 구성
+
+    반환값: {symbol: 티커 데이터} (배치에서 빠진 심볼은 제외)
+    """
+    start_dt = _period_start(HISTORY_MAX_PERIOD)
+    histories = {}
+    for symbol in _fetch_batch_into_store(DATA_PROVIDERS[provider_name], symbols, start_dt):
+        stored = load_stored_history(symbol, start_dt)
+        if not stored.empty:
+            histories[symbol] = _stored_to_ticker_data(stored)
+    return histories
+
+def get_batch_histories(provider_name, symbols, refresh_ahead=None):
+    """배치 결과를 캐시에서 반환 (만료 시 이전 값을 주고 백그라운드에서 갱신)"""
+    if not symbols:
+        return {}
+    histories, refreshing = get_history_cache().get(
+        ('batch', provider_name, symbols),
+        lambda: _load_batch_histories(provider_name, symbols),
+        refresh_ahead
+    )
+    return {symbol: {**value, 'refreshing': refreshing} for symbol, value in histories.items()}
+
+def _batch_groups(ticker_symbols):
+    """배치를 지원하는 데이터 소스별 심볼 묶음 (배치 캐시 키로 쓰이므로 세션과 캐시 워머가 같은 함수 사용)
+
+    음성 캐시에 있는 심볼은 배치에서 빼고 개별 경로에서 바로 '데이터 없음' 처리
+    반환값: {provider_name: 정렬된 심볼 튜플}
+    """
+    negative = get_negative_cache()
+    batch_symbols = {}
+    for ticker_symbol in ticker_symbols:
+        provider, symbol = resolve_provider(ticker_symbol)
+        if provider.supports_batch and symbol == ticker_symbol and negative.retry_at(ticker_symbol) is None:
+            batch_symbols.setdefault(provider.name, set()).add(ticker_symbol)
+    return {provider_name: tuple(sorted(symbols)) for provider_name, symbols in batch_symbols.items()}
+
+def fetch_all_ticker_data(all_ticker_data, period):
+    """모든 티커 데이터를 데이터 소스별 워커 풀에서 동시에 가져오기
+
+    all_ticker_data: {(category, ticker_name): ticker_symbol}
+    반환값: {(category, ticker_name): get_ticker_data 결과} (현재가/등락율은 렌더링 때 시세로 갱신됨)
+    """
+    # 워커 스레드에서도 st.cache_data가 현재 세션 컨텍스트를 사용하도록 연결
+    ctx = get_script_run_ctx()
+
+    def _attach_ctx():
+        if ctx is not None:
+            add_script_run_ctx(threading.current_thread(), ctx)
+
+    data = {}
+    # 배치와 개별 요청 전체가 함께 쓰는 시간 제한 (대기마다 시간을 새로 주면 느린 심볼 수만큼 늘어남)
+    deadline = time.monotonic() + TICKER_FETCH_TIMEOUT
+    get_history_cache().reserve(HISTORY_CACHE_HEADROOM * len(all_ticker_data))
+
+    def _remaining():
+        return max(0.0, deadline - time.monotonic())
+
+    executors = {}
+    futures = {}
+    try:
+        # 배치를 지원하는 데이터 소스(yfinance)는 심볼을 모아 한 번에 요청
+        batch_groups = _batch_groups(all_ticker_data.values())
+        batch_futures = {}
+        if batch_groups:
+            executors['batch'] = ThreadPoolExecutor(
+                max_workers=len(batch_groups),
+                thread_name_prefix="fetch-batch",
+                initializer=_attach_ctx
+            )
+            batch_futures = {
+                executors['batch'].submit(get_batch_histories, provider_name, symbols): symbols
+                for provider_name, symbols in batch_groups.items()
+            }
+            futures_wait(batch_futures, timeout=_remaining())
+
+        batch_histories = {}
+        timed_out = set()
+        for future, symbols in batch_futures.items():
+            if not future.done():
+                print(f"[Fetch Timeout] 배치 {len(symbols)}개 심볼: {TICKER_FETCH_TIMEOUT:g}초 초과")
+                timed_out.update(symbols)
+            elif future.exception() is None:
+                batch_histories.update(future.result())
+
+        for key, ticker_symbol in all_ticker_data.items():
+            if ticker_symbol in batch_histories:
+                data[key] = _slice_ticker_data(batch_histories[ticker_symbol], period)
+                continue
+            if ticker_symbol in timed_out:
+                data[key] = _slice_ticker_data(_stale_ticker_data(ticker_symbol), period)
+                continue
+
+            # 배치에서 빠진 심볼은 개별 요청으로 재시도 (시세 폴백 포함)
+            provider, _ = resolve_provider(ticker_symbol)
+            if provider.name not in executors:
+                executors[provider.name] = ThreadPoolExecutor(
+                    max_workers=provider.concurrency,
+                    thread_name_prefix=f"fetch-{provider.name}",
+                    initializer=_attach_ctx
+                )
+            futures[key] = executors[provider.name].submit(get_ticker_history, ticker_symbol)
+
+        # 남은 시간 안에 끝나지 않은 요청만 저장소의 마지막 데이터(없으면 빈 카드)로 표시
+        futures_wait(futures.values(), timeout=_remaining())
+        for key, future in futures.items():
+            if not future.done():
+                print(f"[Fetch Timeout] {all_ticker_data[key]}: {TICKER_FETCH_TIMEOUT:g}초 초과")
+                data[key] = _slice_ticker_data(_stale_ticker_data(all_ticker_data[key]), period)
+                continue
+            try:
+                data[key] = _slice_ticker_data(future.result(), period)
+            except Exception as e:
+                print(f"[Fetch Error] {all_ticker_data[key]}: {str(e)}")
+                data[key] = _empty_ticker_data()
+        return data
+    finally:
+        # 시간 초과된 요청은 기다리지 않고 남은 대기 작업은 취소
+        for executor in executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+
+def _stale_ticker_data(ticker_symbol):
+    """시간 안에 받지 못한 티커는 저장소에 남아 있는 마지막 데이터 사용 (없으면 빈 데이터)"""
+    stored = load_stored_history(ticker_symbol, _period_start(HISTORY_MAX_PERIOD))
+    return _stored_to_ticker_data(stored) if not stored.empty else _empty_ticker_data()
+
+# 시세 계층 (히스토리 결과에 화면을 그릴 때 최신 시세를 합쳐 현재가/등락율과 마지막 봉을 갱신)
+# 실시간 모드에서는 카테고리별 fragment가 주기적으로 시세만 다시 받음
+LIVE_REFRESH_OPTIONS = [5, 10, 30, 60]  # 갱신 주기 선택지 (초)
+
+def _load_provider_quotes(provider_name, symbols):
+    """데이터 소스 하나의 심볼들 최신 시세 요청
+
+    한 번에 받는 데이터 소스(batch_quotes)는 요청 한 번, 나머지는 심볼마다 요청 토큰/재시도/서킷 브레이커를 거쳐
+    따로 요청하고 실패한 심볼만 뺌 (모두 실패하면 마지막 오류를 올려 이전 시세를 쓰게 함)
+    """
+    provider = DATA_PROVIDERS[provider_name]
+    if provider.batch_quotes:
+        return call_provider(provider, 'quote', None, lambda: provider.fetch_quotes(symbols))
+
+    quotes = {}
+    error = None
+    for symbol in symbols:
+        try:
+            quotes[symbol] = call_provider(provider, 'quote', symbol,
+                                           lambda symbol=symbol: provider.fetch_recent_quote(symbol))
+        except NoDataError:
+            continue
+        except Exception as e:
+            error = e
+            print(f"[{provider.label} Quote Error] {symbol}: {str(e)}")
+    if error is not None and not quotes:
+        raise error
+    return quotes
+
+@st.cache_data(ttl=LIVE_QUOTE_TTL, show_spinner=False)
+def get_provider_quotes(provider_name, symbols):
+    """실시간 모드용 시세 (symbols: 정렬된 튜플, 캐시 키로 사용)
+
+    실패하면 시세 캐시에 남아 있는 마지막 정상 시세 사용
+    """
+    try:
+        return _load_provider_quotes(provider_name, symbols)
+    except Exception as e:
+        print(f"[{DATA_PROVIDERS[provider_name].label} Quote Error] {len(symbols)}개 심볼: {str(e)}")
+        return get_cached_provider_quotes(provider_name, symbols, wait=False)
+
+@st.cache_resource
+def get_quote_cache():
+    """모든 세션이 공유하는 시세 캐시 (히스토리 캐시보다 짧은 주기로 갱신)"""
+    return _StaleWhileRevalidateCache(ttl=TICKER_DATA_TTL)
+
+def get_cached_provider_quotes(provider_name, symbols, refresh_ahead=None, wait=True):
+    """시세를 캐시에서 반환 (만료 시 이전 값을 주고 백그라운드에서 갱신)
+
+    백그라운드 갱신이 실패하면 이전 시세를 계속 사용하고, 처음부터 실패하면 빈 결과
+    wait: False면 캐시에 없을 때 기다리지 않고 빈 결과 (로드는 백그라운드에서 진행)
+    """
+    try:
+        quotes, _ = get_quote_cache().get(
+            ('quote', provider_name, symbols),
+            lambda: _load_provider_quotes(provider_name, symbols),
+            refresh_ahead,
+            wait
+        )
+    except Exception as e:
+        print(f"[{DATA_PROVIDERS[provider_name].label} Quote Error] {len(symbols)}개 심볼: {str(e)}")
+        return {}
+    return quotes if quotes is not None else {}
+
+def _collect_quotes(ticker_symbols, load_quotes):
+    """티커 심볼들을 데이터 소스별로 묶어 load_quotes(provider_name, symbols)로 시세 요청
+
+    반환값: {원래 심볼: 시세} (폴백 심볼로 라우팅된 경우도 원래 심볼 기준, 음성 캐시에 있는 심볼은 제외)
+    """
+    negative = get_negative_cache()
+    routed = {}
+    for ticker_symbol in ticker_symbols:
+        if negative.retry_at(ticker_symbol) is not None:
+            continue
+        provider, symbol = resolve_provider(ticker_symbol)
+        routed.setdefault(provider.name, {}).setdefault(symbol, []).append(ticker_symbol)
+
+    quotes = {}
+    for provider_name, symbol_map in routed.items():
+        provider_quotes = load_quotes(provider_name, tuple(sorted(symbol_map)))
+        for symbol, quote in provider_quotes.items():
+            for ticker_symbol in symbol_map.get(symbol, []):
+                quotes[ticker_symbol] = quote
+    return quotes
+
+def get_ticker_quotes(ticker_symbols, refresh_ahead=None, wait=True):
+    """티커 심볼들의 최신 시세 (TICKER_DATA_TTL 주기의 공유 캐시 사용)
+
+    wait: False면 캐시에 없는 데이터 소스의 시세는 빼고 바로 반환 (화면 렌더링이 시세 요청을 기다리지 않도록)
+    """
+    return _collect_quotes(
+        ticker_symbols,
+        lambda provider_name, symbols: get_cached_provider_quotes(provider_name, symbols, refresh_ahead, wait)
+    )
+
+def get_live_quotes(ticker_symbols):
+    """티커 심볼들의 최신 시세 (실시간 모드, LIVE_QUOTE_TTL 주기로 새로 요청)"""
+    return _collect_quotes(ticker_symbols, get_provider_quotes)
+
+def apply_quote(ticker_data, quote):
+    """히스토리 결과에 최신 시세 반영 (현재가/등락율과 마지막 봉만 바꾸고 나머지는 그대로)
+
+    시세 봉 날짜가 마지막 봉과 같으면 마지막 봉 종가를 바꾸고, 더 최근이면 새 봉으로 추가
+    """
+    history = ticker_data['history']
+    if history.empty or quote is None:
+        return ticker_data
+
+    as_of = pd.Timestamp(quote['as_of']).normalize()
+    last_bar = history.index[-1]
+    moving_averages = ticker_data.get('moving_averages')
+    if as_of == last_bar:
+        history = history.copy()
+        history.iloc[-1] = quote['price']
+        prev_close = history.iloc[-2] if len(history) >= 2 else quote['prev_close']
+    elif as_of > last_bar:
+        history = pd.concat([history, pd.Series([quote['price']], index=[as_of], name=history.name)])
+        if moving_averages is not None:
+            # 새 봉의 이동평균은 다음 히스토리 갱신 때 계산되므로 직전 값을 이어서 표시
+            moving_averages = pd.concat([moving_averages, moving_averages.iloc[[-1]].set_axis([as_of])])
+        prev_close = quote['prev_close']
+    else:
+        return ticker_data
+
+    change_pct = (quote['price'] - prev_close) / prev_close * 100 if prev_close else 0
+    return {
+        **ticker_data,
+        'current': quote['price'],
+        'change_pct': change_pct,
+        'history': history,
+        'moving_averages': moving_averages,
+        'quote_as_of': time.time()
+    }
+
+# 거래 시간 기반 캐시 워머 (서버 프로세스 안의 백그라운드 스레드)
+# 구글 시트 관심 종목을 읽어, 시장이 열려 있는 심볼은 캐시가 만료되기 전에 미리 갱신하고
+# 장이 끝나면 마지막 봉을 확정하도록 히스토리를 한 번 더 받으며, 휴장 중인 시장은 건드리지 않음
+CACHE_WARMER_ENABLED = os.environ.get('MACRO_CACHE_WARMER', '1') != '0'  # 벤치마크 등에서는 0으로 끔
+CACHE_WARM_TICK = 15  # 스케줄 확인 주기 (초)
+CACHE_WARM_AHEAD = 0.8  # 캐시 유지 시간의 이 비율이 지나면 만료 전에 미리 갱신
+CACHE_WARM_IDLE_SECONDS = 10 * 60  # 이 시간 동안 접속한 세션이 없으면 시트/데이터 소스 요청을 멈추고 쉼
+
+# 시장: (시간대, 개장 (시, 분), 마감 (시, 분)) - 공휴일은 고려하지 않음
+# 개장이 마감보다 늦은 시장은 전날 저녁에 열려 다음 날 마감 (일요일 저녁 ~ 금요일)
+# 예: CME 선물은 평일 16:00~17:00(시카고)만 쉬고, 외환은 일요일 17:00 ~ 금요일 17:00(뉴욕) 연속 거래
+MARKET_HOURS = {
+    'KRX': ('Asia/Seoul', (9, 0), (15, 30)),
+    'TSE': ('Asia/Tokyo', (9, 0), (15, 30)),
+    'SSE': ('Asia/Shanghai', (9, 30), (15, 0)),
+    'NYSE': ('America/New_York', (9, 30), (16, 0)),
+    'CME': ('America/Chicago', (17, 0), (16, 0)),
+    'FX': ('America/New_York', (17, 0), (17, 0)),
+    'CRYPTO': None  # 연중무휴
+}
+
+# 한국 국채 금리 코드 (FDR/트레이딩뷰의 KR10Y, KR3Y, KR1YT=RR 등) - KRE, KRBN 같은 미국 ETF와 구분
+KR_RATE_SYMBOL = re.compile(r'KR\d+[YM]')
+
+# 심볼 -> 시장 (앞에서부터 접미사/접두사가 맞는 첫 규칙, 없으면 NYSE)
+MARKET_SYMBOL_RULES = [
+    ('CRYPTO', ('-USD', '-USDT', '-KRW'), ('BINANCE:', 'UPBIT:', 'BITHUMB:', 'COINBASE:', 'BITSTAMP:')),
+    ('FX', ('=X', '.NYB'), ('FX:', 'FX_IDC:', 'OANDA:', 'FOREXCOM:')),
+    ('CME', ('=F',), ('CME:', 'CME_MINI:', 'COMEX:', 'NYMEX:', 'CBOT:')),
+    ('KRX', ('.KS', '.KQ'), ('^KS', '^KQ', 'KRX:')),
+    ('TSE', ('.T',), ('^N225', 'TSE:')),
+    ('SSE', ('.SS', '.SZ'), ('SSE:', 'SZSE:')),
+]
+
+def market_of(ticker_symbol):
+    """심볼이 거래되는 시장 (트레이딩뷰 심볼은 거래소 접두사, 그다음 콜론 뒤 심볼로 판단)"""
+    symbol = ticker_symbol.upper()
+    if KR_RATE_SYMBOL.match(symbol):
+        return 'KRX'
+    for market, suffixes, prefixes in MARKET_SYMBOL_RULES:
+        if symbol.endswith(suffixes) or symbol.startswith(prefixes):
+            return market
+    if ':' in symbol:
+        exchange, code = symbol.split(':', 1)
+        # TVC 지수/금리는 한국물이 아니면 거의 24시간 호가가 나오므로 외환과 같이 취급
+        if KR_RATE_SYMBOL.match(code):
+            return 'KRX'
+        return 'FX' if exchange == 'TVC' else 'NYSE'
+    if symbol.isdigit() and len(symbol) == 6:
+        return 'KRX'
+    return 'NYSE'
+
+def is_market_open(market, now=None):
+    """시장이 지금 열려 있는지 여부 (now: timezone-aware datetime, 기본값 현재 시각)"""
+    hours = MARKET_HOURS[market]
+    if hours is None:
+        return True
+    tz_name, open_at, close_at = hours
+    local = (now or datetime.now(pytz.utc)).astimezone(pytz.timezone(tz_name))
+    weekday = local.weekday()  # 월=0 ... 일=6
+    hm = (local.hour, local.minute)
+    if open_at < close_at:
+        return weekday < 5 and open_at <= hm < close_at
+    # 전날 저녁 개장(일~목) 또는 당일 마감 전(월~금)
+    return (weekday < 5 and hm < close_at) or (weekday in (6, 0, 1, 2, 3) and hm >= open_at)
 
-def _period_to_interval(period):
-    """period 문자열을 TradingView Interval로 변환"""
-    if not TV_AVAILABLE:
-        return None
-    
-    if period == "1mo":
-        return Interval.in_daily
-    elif period == "6mo":
-        return Interval.in_daily
-    elif period == "1y":
-        return Interval.in_daily
-    elif period == "2y":
-        return Interval.in_daily
-    elif period == "5y":
-        return Interval.in_daily
-    elif period == "max":
-        return Interval.in_daily
-    else:
-        return Interval.in_daily  # 기본값: 일봉
+def load_warm_watchlist():
+    """캐시 워머가 갱신할 관심 종목 ({category: {ticker_name: ticker_symbol}})
 
-@st.cache_data(ttl=3600)  # 1시간 캐시 (티커 목록은 자주 변경되지 않음)
-def search_tickers(query, source):
-    """티커 검색 함수"""
-    query_lower = query.lower()
-    results = []
-    
-    if source == "yfinance":
-        # 주요 yfinance 티커 목록 (키워드 기반)
-        ticker_list = [
-            # 주식 지수
-            ("코스피", "^KS11", "KOSPI 종합주가지수"),
-            ("코스닥", "^KQ11", "KOSDAQ 종합주가지수"),
-            ("S&P500", "^GSPC", "S&P 500 지수"),
-            ("나스닥", "^IXIC", "NASDAQ 종합지수"),
-            ("다우", "^DJI", "다우 존스 산업평균지수"),
-            ("니케이", "^N225", "닛케이 225 지수"),
-            ("상해종합", "000001.SS", "상하이 종합 지수"),
-            ("CSI300", "000300.SS", "CSI 300 지수"),
-            ("항셍", "^HSI", "항셍 지수"),
-            
-            # 환율
-            ("원달러", "KRW=X", "원/달러 환율"),
-            ("원위안", "CNYKRW=X", "원/위안 환율"),
-            ("원엔", "JPYKRW=X", "원/엔 환율"),
-            ("달러인덱스", "DX-Y.NYB", "달러 인덱스"),
-            ("유로달러", "EURUSD=X", "유로/달러 환율"),
-            ("엔달러", "JPY=X", "엔/달러 환율"),
-            
-            # 원자재
-            ("유가", "CL=F", "WTI 원유 선물"),
-            ("원유", "CL=F", "WTI 원유 선물"),
-            ("브렌트", "BZ=F", "브렌트 원유 선물"),
-            ("금", "GC=F", "금 선물"),
-            ("은", "SI=F", "은 선물"),
-            ("구리", "HG=F", "구리 선물"),
-            ("팔라듐", "PA=F", "팔라듐 선물"),
-            ("백금", "PL=F", "백금 선물"),
-            ("천연가스", "NG=F", "천연가스 선물"),
-            ("가솔린", "RB=F", "가솔린 선물"),
-            ("난방유", "HO=F", "난방유 선물"),
-            ("밀", "ZW=F", "밀 선물"),
-            ("옥수수", "ZC=F", "옥수수 선물"),
-            ("대두", "ZS=F", "대두 선물"),
-            ("원당", "SB=F", "원당 선물"),
-            ("코코아", "CC=F", "코코아 선물"),
-            ("커피", "KC=F", "커피 선물"),
-            ("면화", "CT=F", "면화 선물"),
-            ("원목", "LBS=F", "원목 선물"),
-            
-            # 채권
-            ("미국10년물", "^TNX", "미국 10년 국채금리"),
-            ("미국30년물", "^TYX", "미국 30년 국채금리"),
-            ("미국2년물", "^IRX", "미국 2년 국채금리"),
-            
-            # 주요 주식 (삼성, 애플 등)
-            ("삼성전자", "005930.KS", "삼성전자 (KOSPI)"),
-            ("SK하이닉스", "000660.KS", "SK하이닉스 (KOSPI)"),
-            ("NAVER", "035420.KS", "NAVER (KOSPI)"),
-            ("카카오", "035720.KS", "카카오 (KOSPI)"),
-            ("애플", "AAPL", "Apple Inc."),
-            ("마이크로소프트", "MSFT", "Microsoft Corporation"),
-            ("구글", "GOOGL", "Alphabet Inc."),
-            ("아마존", "AMZN", "Amazon.com Inc."),
-            ("테슬라", "TSLA", "Tesla Inc."),
-            ("엔비디아", "NVDA", "NVIDIA Corporation"),
-            ("메타", "META", "Meta Platforms Inc."),
-        ]
-        
-        for name, symbol, desc in ticker_list:
-            if query_lower in name.lower() or query_lower in desc.lower() or query_lower in symbol.lower():
-                results.append({
-                    'name': name,
-                    'symbol': symbol,
-                    'description': desc,
-                    'source': 'yfinance'
-                })
-    
-    elif source == "FinanceDataReader (한국)":
+    구글 시트 설정 캐시를 사용하고, 시트를 쓸 수 없으면 기본 관심 종목 사용
+    """
+    gsheets_client = get_gsheets_client()
+    if gsheets_client is not None:
         try:
-            # 한국 주식 목록 가져오기
-            stock_list = fdr.StockListing('KRX')
-            
-            # 검색어로 필터링
-            if not stock_list.empty:
-                # 종목명 또는 코드로 검색
-                mask = (
-                    stock_list['Name'].str.contains(query, case=False, na=False) |
-                    stock_list['Symbol'].str.contains(query, case=False, na=False) |
-                    stock_list['Sector'].str.contains(query, case=False, na=False)
-                )
-                filtered = stock_list[mask].head(50)  # 최대 50개
-                
-                for _, row in filtered.iterrows():
-                    sector = row.get('Sector', 'N/A')
-                    market = row.get('Market', 'N/A')
-                    results.append({
-                        'name': f"{row['Name']} ({sector})",
-                        'symbol': row['Symbol'],
-                        'description': f"시장: {market}",
-                        'source': 'FinanceDataReader'
-                    })
+            config = get_watchlist_config_cache().get(gsheets_client)
+            if config is not None:
+                return config['market_data']
         except Exception as e:
-            print(f"[FDR Search Error] {str(e)}")
-            # 에러는 조용히 처리 (UI에서 처리)
-    
-    elif source == "TradingView":
-        # TradingView는 직접 검색 API가 없으므로 가이드 제공
-        tradingview_guides = [
-            ("한국 10년 국채", "TVC:KR10Y", "TradingView 한국 10년 국채"),
-            ("한국 3년 국채", "TVC:KR3Y", "TradingView 한국 3년 국채"),
-            ("한국 30년 국채", "TVC:KR30Y", "TradingView 한국 30년 국채"),
-            ("WTI 원유", "TVC:USOIL", "TradingView WTI 원유"),
-            ("브렌트 원유", "TVC:UKOIL", "TradingView 브렌트 원유"),
-            ("금", "TVC:GOLD", "TradingView 금"),
-            ("은", "TVC:SILVER", "TradingView 은"),
-            ("구리", "TVC:COPPER", "TradingView 구리"),
-            ("S&P500", "SPX:SPX", "TradingView S&P500"),
-            ("나스닥", "NASDAQ:NDX", "TradingView 나스닥"),
-            ("다우", "DJI:DJI", "TradingView 다우존스"),
-        ]
-        
-        for name, symbol, desc in tradingview_guides:
-            if query_lower in name.lower() or query_lower in desc.lower() or query_lower in symbol.lower():
-                results.append({
-                    'name': name,
-                    'symbol': symbol,
-                    'description': desc,
-                    'source': 'TradingView'
-                })
-    
-    return results
+            print(f"[Cache Warmer] 관심 종목 읽기 실패, 기본 관심 종목 사용: {str(e)}")
+    return get_default_data()
 
-def generate_ticker_search_prompt(search_query, data_source):
-    """티커 검색을 위한 AI 프롬프트 생성"""
-    if data_source == "yfinance":
-        prompt = f"""다음 검색어에 해당하는 yfinance 티커 심볼을 찾아주세요: "{search_query}"
+class _CacheWarmer:
+    """시장별 거래 시간에 맞춰 히스토리/시세 캐시를 미리 채우는 백그라운드 스레드"""
 
-요구사항:
-1. 검색어와 관련된 모든 주요 티커 심볼을 찾아주세요
-2. 각 티커에 대해 다음 형식으로 제공해주세요:
-   - 티커 이름 (한글)
-   - 티커 심볼 (yfinance 형식)
-   - 설명 (간단히)
+    def __init__(self, tick=CACHE_WARM_TICK):
+        self.tick = tick
+        self._lock = threading.Lock()
+        self._open_markets = None  # 직전 확인 때 열려 있던 시장 (None이면 아직 한 번도 안 돌았음)
+        self._status = {}  # market -> {'open', 'symbols', 'warmed_at'}
+        self._last_seen = time.time()  # 마지막으로 세션이 앱을 실행한 시각 (워머는 첫 세션이 시작함)
+        self._thread = threading.Thread(target=self._run, name="cache-warmer", daemon=True)
 
-예시:
-- 유가 또는 원유 검색 시:
-  • WTI 원유 선물: CL=F
-  • 브렌트 원유 선물: BZ=F
-  
-- 금 검색 시:
-  • 금 선물: GC=F
+    def start(self):
+        self._thread.start()
+        return self
 
-중요: 티커 심볼만 정확하게 제공해주세요. yfinance에서 사용 가능한 형식이어야 합니다."""
-    
-    elif data_source == "FinanceDataReader (한국)":
-        prompt = f"""다음 검색어에 해당하는 한국 주식/채권 티커 심볼을 찾아주세요: "{search_query}"
+    def touch(self):
+        """세션이 앱을 실행할 때마다 호출 (접속한 세션이 있는 동안만 캐시를 데움)"""
+        self._last_seen = time.time()
 
-요구사항:
-1. 검색어와 관련된 모든 한국 주식/채권 티커를 찾아주세요
-2. FinanceDataReader에서 사용 가능한 형식이어야 합니다
-3. 각 티커에 대해 다음 형식으로 제공해주세요:
-   - 티커 이름 (종목명)
-   - 티커 심볼 (6자리 종목코드 또는 KR10Y, KR3Y 같은 국채 코드)
-   - 설명 (간단히)
+    def is_idle(self):
+        """CACHE_WARM_IDLE_SECONDS 동안 접속한 세션이 없었는지 여부"""
+        return time.time() - self._last_seen > CACHE_WARM_IDLE_SECONDS
 
-예시:
-- 삼성 검색 시:
-  • 삼성전자: 005930
-  • 삼성SDI: 006400
-  
-- 국채 검색 시:
-  • 한국 10년 국채: KR10Y
-  • 한국 3년 국채: KR3Y
+    def _run(self):
+        while True:
+            try:
+                if self.is_idle():
+                    # 쉬는 동안 놓친 장 마감은 다시 깨어난 첫 실행에서 전체를 채우며 반영
+                    self._open_markets = None
+                else:
+                    self.warm_once()
+            except Exception as e:
+                print(f"[Cache Warmer Error] {str(e)}")
+            time.sleep(self.tick)
 
-중요: 티커 심볼만 정확하게 제공해주세요. FinanceDataReader에서 사용 가능한 형식이어야 합니다."""
-    
-    elif data_source == "TradingView":
-        prompt = f"""다음 검색어에 해당하는 TradingView 티커 심볼을 찾아주세요: "{search_query}"
+    def warm_once(self, now=None):
+        """관심 종목 중 열려 있거나 방금 닫힌 시장의 심볼만 갱신
 
-요구사항:
-1. TradingView에서 사용 가능한 심볼을 찾아주세요
-2. TradingView 심볼 형식: EXCHANGE:SYMBOL (예: TVC:KR10Y, SPX:SPX)
-3. 각 티커에 대해 다음 형식으로 제공해주세요:
-   - 티커 이름 (한글)
-   - 티커 심볼 (EXCHANGE:SYMBOL 형식)
-   - 설명 (간단히)
+        첫 실행에서는 서버 시작 직후 첫 사용자가 기다리지 않도록 모든 심볼을 채움
+        """
+        watchlist = load_warm_watchlist()
+        symbols_by_market = {}
+        for tickers in watchlist.values():
+            for ticker_symbol in tickers.values():
+                symbols_by_market.setdefault(market_of(ticker_symbol), set()).add(ticker_symbol)
 
-예시:
-- 한국 국채 검색 시:
-  • 한국 10년 국채: TVC:KR10Y
-  • 한국 3년 국채: TVC:KR3Y
-  
-- 원유 검색 시:
-  • WTI 원유: TVC:USOIL
-  • 브렌트 원유: TVC:UKOIL
+        open_markets = {market for market in symbols_by_market if is_market_open(market, now)}
+        first_run = self._open_markets is None
+        # 직전에는 열려 있었는데 지금 닫힌 시장 = 방금 장 마감 (마지막 봉 확정을 위해 강제 갱신)
+        closed_now = set() if first_run else (self._open_markets & set(symbols_by_market)) - open_markets
+        self._open_markets = open_markets
 
-중요: 
-- 티커 심볼은 반드시 EXCHANGE:SYMBOL 형식이어야 합니다
-- TradingView에서 실제로 사용 가능한 심볼이어야 합니다
-- 거래소 코드와 심볼을 정확하게 구분해서 제공해주세요"""
-    
-    return prompt
+        active_markets = set(symbols_by_market) if first_run else open_markets | closed_now
+        active = set().union(*(symbols_by_market[market] for market in active_markets))
+        closing = set().union(*(symbols_by_market[market] for market in closed_now))
 
-@st.cache_data(ttl=60)  # 60초마다 캐시 갱신
-def get_ticker_data(ticker_symbol, period="1y", cache_key=None):
-    """티커 데이터를 가져오는 함수 (기간별 히스토리 포함)
-    
-    우선순위:
-    1. 콜론(:)이 있으면 트레이딩뷰 사용 (예: TVC:KR10Y)
-    2. 한국 국채 티커(KR10Y, KR3Y, KR30Y 등)는 FinanceDataReader 사용
-    3. 그 외는 yfinance 사용
-    """
-    # 트레이딩뷰 티커 확인 (콜론이 있는 경우)
-    original_symbol = ticker_symbol  # 원본 심볼 보관
-    if ':' in ticker_symbol:
-        if tv is not None:
-            try:
-                # exchange와 symbol 분리
-                parts = ticker_symbol.split(':', 1)
-                if len(parts) != 2:
-                    raise ValueError(f"TradingView: 잘못된 심볼 형식 - {ticker_symbol}")
-                
-                exchange = parts[0]
-                symbol = parts[1]
-                
-                # 기간에 맞는 시작일 계산
-                start_date, end_date = _period_to_dates(period)
-                interval = _period_to_interval(period)
-                
-                if interval is None:
-                    raise ValueError("TradingView: Interval을 사용할 수 없습니다")
-                
-                # 트레이딩뷰에서 데이터 가져오기
-                df = tv.get_hist(
-                    symbol=symbol,
-                    exchange=exchange,
-                    interval=interval,
-                    n_bars=10000  # 충분히 많은 데이터 가져오기
-                )
-                
-                if df is None or df.empty:
-                    raise ValueError(f"TradingView: {ticker_symbol}에 대한 데이터가 없습니다")
-                
-                # 데이터 포맷 표준화
-                # 트레이딩뷰는 보통 datetime 인덱스를 사용
-                if not isinstance(df.index, pd.DatetimeIndex):
-                    df.index = pd.to_datetime(df.index)
-                
-                # Close 컬럼 확인 및 변환
-                if 'close' in df.columns:
-                    df['Close'] = df['close']
-                elif 'Close' not in df.columns:
-                    # 숫자 컬럼 찾기
-                    numeric_cols = df.select_dtypes(include=[float, int]).columns
-                    if len(numeric_cols) > 0:
-                        df['Close'] = df[numeric_cols[0]]
-                    else:
-                        raise ValueError(f"TradingView: {ticker_symbol}에 Close 컬럼이 없습니다")
-                
-                # 기간 필터링 (시작일 이후만)
-                start_dt = pd.to_datetime(start_date)
-                df = df[df.index >= start_dt]
-                
-                if df.empty:
-                    raise ValueError(f"TradingView: {ticker_symbol}에 필터링 후 데이터가 없습니다")
-                
-                # Close 컬럼만 추출하고 정렬
-                hist = df[['Close']].copy()
-                hist = hist.sort_index()
-                
-                # 현재가와 전일가 계산
-                if len(hist) >= 2:
-                    current_price = hist['Close'].iloc[-1]
-                    prev_price = hist['Close'].iloc[-2]
-                elif len(hist) == 1:
-                    current_price = hist['Close'].iloc[-1]
-                    prev_price = current_price
-                else:
-                    current_price = 0
-                    prev_price = 0
-                
-                change_pct = ((current_price - prev_price) / prev_price) * 100 if prev_price != 0 else 0
-                
-                return {
-                    'current': current_price,
-                    'change_pct': change_pct,
-                    'history': hist['Close']
+        if active:
+            if closing:
+                expire_stored_history([resolve_provider(ticker_symbol)[1] for ticker_symbol in closing])
+            self._warm_history(watchlist, active, closing)
+            self._warm_quotes(watchlist, active, closing)
+
+        warmed_at = time.time()
+        with self._lock:
+            for market, symbols in symbols_by_market.items():
+                previous = self._status.get(market, {})
+                self._status[market] = {
+                    'open': market in open_markets,
+                    'symbols': len(symbols),
+                    'warmed_at': warmed_at if market in active_markets else previous.get('warmed_at')
                 }
-            except Exception as e:
-                # TradingView 실패 시 로그 출력
-                print(f"[TradingView Error] {ticker_symbol}: {str(e)}")
-                # fallback: 콜론 뒤 부분만 추출하여 재시도
-                parts = ticker_symbol.split(':', 1)
-                if len(parts) == 2 and parts[1].startswith('KR'):
-                    ticker_symbol = parts[1]  # KR10Y로 변경하여 FDR 사용
-                    print(f"[Fallback] TradingView 실패, FDR로 재시도: {ticker_symbol}")
-        else:
-            # tv가 None이면 콜론 뒤 부분만 추출하여 재시도
-            parts = ticker_symbol.split(':', 1)
-            if len(parts) == 2 and parts[1].startswith('KR'):
-                ticker_symbol = parts[1]  # KR10Y로 변경하여 FDR 사용
-                print(f"[Fallback] TradingView 미사용, FDR로 시도: {ticker_symbol}")
-    
-    # 한국 국채 티커 확인 (KR로 시작하고 숫자로 끝나는 패턴)
-    is_korean_bond = ticker_symbol.startswith('KR') and len(ticker_symbol) >= 3
-    
-    if is_korean_bond:
-        # FinanceDataReader 사용
-        try:
-            start_date, end_date = _period_to_dates(period)
-            
-            # FinanceDataReader로 데이터 가져오기
-            df = fdr.DataReader(ticker_symbol, start_date, end_date)
-            
-            if df.empty:
-                raise ValueError(f"FDR: {ticker_symbol}에 대한 데이터가 없습니다")
-            
-            # 데이터 포맷 표준화 (yfinance 형식과 동일하게)
-            # FDR은 보통 Date를 인덱스로 사용하거나 별도 컬럼으로 가짐
-            if 'Date' in df.columns:
-                df.set_index('Date', inplace=True)
-            
-            # 인덱스가 DatetimeIndex가 아니면 변환
-            if not isinstance(df.index, pd.DatetimeIndex):
-                df.index = pd.to_datetime(df.index)
-            
-            # Close 컬럼 확인 (없으면 첫 번째 숫자 컬럼 사용)
-            if 'Close' not in df.columns:
-                # 숫자 컬럼 찾기
-                numeric_cols = df.select_dtypes(include=[float, int]).columns
-                if len(numeric_cols) > 0:
-                    df['Close'] = df[numeric_cols[0]]
-                else:
-                    raise ValueError(f"FDR: {ticker_symbol}에 Close 컬럼이 없습니다")
-            
-            # Close 컬럼만 추출하고 정렬
-            hist = df[['Close']].copy()
-            hist = hist.sort_index()
-            
-            # 현재가와 전일가 계산
-            if len(hist) >= 2:
-                current_price = hist['Close'].iloc[-1]
-                prev_price = hist['Close'].iloc[-2]
-            elif len(hist) == 1:
-                current_price = hist['Close'].iloc[-1]
-                prev_price = current_price
-            else:
-                current_price = 0
-                prev_price = 0
-            
-            change_pct = ((current_price - prev_price) / prev_price) * 100 if prev_price != 0 else 0
-            
-            return {
-                'current': current_price,
-                'change_pct': change_pct,
-                'history': hist['Close']
-            }
-        except Exception as e:
-            # FDR 실패 시 로그 출력
-            print(f"[FDR Error] {ticker_symbol}: {str(e)}")
-            return {
-                'current': 0,
-                'change_pct': 0,
-                'history': pd.Series()
-            }
-    else:
-        # yfinance 사용 (기존 로직)
-        try:
-            ticker = yf.Ticker(ticker_symbol)
-            
-            # 기간에 맞는 히스토리 데이터 가져오기
-            hist = ticker.history(period=period)
-            
-            if hist.empty:
-                # 데이터가 없는 경우 info에서 가져오기 시도
-                try:
-                    info = ticker.info
-                    current_price = info.get('regularMarketPrice', info.get('previousClose', 0))
-                    prev_price = info.get('previousClose', current_price)
-                    hist = pd.DataFrame({'Close': [prev_price, current_price]}, 
-                                      index=pd.date_range(end=datetime.now(), periods=2, freq='D'))
-                except:
-                    raise ValueError(f"yfinance: {ticker_symbol}에 대한 데이터를 가져올 수 없습니다")
-            
-            # 현재가와 전일가 계산
-            if len(hist) >= 2:
-                current_price = hist['Close'].iloc[-1]
-                prev_price = hist['Close'].iloc[-2]
-            elif len(hist) == 1:
-                current_price = hist['Close'].iloc[-1]
-                prev_price = current_price
-            else:
-                current_price = 0
-                prev_price = 0
-            
-            change_pct = ((current_price - prev_price) / prev_price) * 100 if prev_price != 0 else 0
-            
-            return {
-                'current': current_price,
-                'change_pct': change_pct,
-                'history': hist['Close']
-            }
-        except Exception as e:
-            # yfinance 실패 시 로그 출력
-            print(f"[yfinance Error] {ticker_symbol}: {str(e)}")
-            return {
-                'current': 0,
-                'change_pct': 0,
-                'history': pd.Series()
-            }
 
-def create_sparkline_chart(history_data, change_pct, ticker_name):
-    """Sparkline 스타일의 영역 차트 생성"""
+    def _warm_history(self, watchlist, active, closing):
+        """히스토리 캐시 갱신 (배치 키는 세션과 같게 관심 종목 전체로 구성)"""
+        all_symbols = [ticker_symbol for tickers in watchlist.values() for ticker_symbol in tickers.values()]
+        batched = set()
+        for provider_name, symbols in _batch_groups(all_symbols).items():
+            if active.intersection(symbols):
+                refresh_ahead = 0 if closing.intersection(symbols) else CACHE_WARM_AHEAD
+                batched.update(get_batch_histories(provider_name, symbols, refresh_ahead))
+        # 배치가 아니거나 배치에서 빠진 심볼은 세션처럼 개별 경로로
+        for ticker_symbol in active - batched:
+            get_ticker_history(ticker_symbol, 0 if ticker_symbol in closing else CACHE_WARM_AHEAD)
+
+    def _warm_quotes(self, watchlist, active, closing):
+        """시세 캐시 갱신 (렌더링과 같은 카테고리 단위 키)"""
+        for tickers in watchlist.values():
+            symbols = list(tickers.values())
+            if active.intersection(symbols):
+                get_ticker_quotes(symbols, 0 if closing.intersection(symbols) else CACHE_WARM_AHEAD)
+
+    def status(self):
+        """디버깅 패널용 시장별 상태"""
+        with self._lock:
+            return {market: dict(status) for market, status in self._status.items()}
+
+@st.cache_resource
+def get_cache_warmer():
+    """서버 프로세스당 하나인 캐시 워머 (처음 호출될 때 시작, 꺼져 있으면 None)"""
+    if not CACHE_WARMER_ENABLED:
+        return None
+    return _CacheWarmer().start()
+
+# Sparkline 다운샘플링 (카드 폭 1픽셀당 점 1개면 모양이 그대로 유지됨)
+SPARKLINE_CARD_WIDTH_PX = 420  # wide 레이아웃 3열 기준 카드 폭
+SPARKLINE_POINTS_PER_PX = 1
+SPARKLINE_MAX_POINTS = SPARKLINE_CARD_WIDTH_PX * SPARKLINE_POINTS_PER_PX
+
+def _lttb_indices(x, y, threshold):
+    """Largest-Triangle-Three-Buckets로 남길 점의 인덱스 계산
+
+    x, y: float 배열 (x는 오름차순), threshold: 남길 점 개수 (첫/마지막 점 포함)
+    """
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    # 첫/마지막 점을 제외한 나머지를 (threshold - 2)개 버킷으로 나눔
+    every = (n - 2) / (threshold - 2)
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0] = 0
+    a = 0
+
+    for i in range(threshold - 2):
+        # 다음 버킷의 평균점
+        avg_start = int(np.floor((i + 1) * every)) + 1
+        avg_end = min(int(np.floor((i + 2) * every)) + 1, n)
+        avg_end = max(avg_end, avg_start + 1)
+        avg_x = x[avg_start:avg_end].mean()
+        avg_y = y[avg_start:avg_end].mean()
+
+        # 현재 버킷에서 (이전 선택점, 다음 버킷 평균점)과 만드는 삼각형이 가장 큰 점 선택
+        range_start = int(np.floor(i * every)) + 1
+        range_end = int(np.floor((i + 1) * every)) + 1
+        areas = np.abs(
+            (x[a] - avg_x) * (y[range_start:range_end] - y[a])
+            - (x[a] - x[range_start:range_end]) * (avg_y - y[a])
+        )
+        a = range_start + int(np.argmax(areas))
+        indices[i + 1] = a
+
+    indices[-1] = n - 1
+    return indices
+
+def _downsample_series(series, max_points):
+    """모양을 유지하면서 시계열을 max_points개 이하로 줄이기 (LTTB)"""
+    if max_points is None or len(series) <= max_points:
+        return series
+    x = series.index.asi8.astype(np.float64)
+    y = series.to_numpy(dtype=np.float64)
+    return series.iloc[_lttb_indices(x, y, max_points)]
+
+def _build_sparkline_parts(history_data, change_pct, ticker_name, max_points=SPARKLINE_MAX_POINTS,
+                           moving_averages=None):
+    """Sparkline 구성 요소 계산 (단일 차트와 카테고리 그리드 차트에서 공용)
+
+    종가와 이동평균선은 max_points개 이하로 다운샘플링
+    moving_averages: 저장소에서 미리 계산된 이동평균 (없으면 보이는 구간으로 직접 계산)
+    반환값: (트레이스 목록, Y축 범위 또는 None, x축 설정)
+    """
     # x축 설정 초기화
     xaxis_config = dict(
         showgrid=False,
         showticklabels=False,
         zeroline=False
     )
+    traces = []
+    y_range = None
     
     if history_data.empty or len(history_data) == 0:
-        # 빈 차트 반환
-        fig = go.Figure()
-        fig.add_trace(go.Scatter(x=[], y=[], mode='lines'))
+        # 빈 차트
+        traces.append(go.Scatter(x=[], y=[], mode='lines'))
     else:
         # 등락에 따른 색상 결정 (상승=빨강, 하락=파랑)
         line_color = '#ef4444' if change_pct >= 0 else '#3b82f6'
@@ -879,9 +3070,15 @@ def create_sparkline_chart(history_data, change_pct, ticker_name):
         else:
             dates = pd.date_range(end=datetime.now(), periods=len(history_data), freq='D')
         
-        # 이동평균선 계산 (20주 = 100일, 80주 = 400일)
-        ma20 = history_data.rolling(window=100).mean()  # 20주 이평선
-        ma80 = history_data.rolling(window=400).mean()  # 80주 이평선
+        history_data = pd.Series(history_data.values, index=dates)
+        
+        # 이동평균선 (20주 = 100일, 80주 = 400일) - 저장소 값이 있으면 그대로 사용
+        if moving_averages is not None and len(moving_averages) == len(history_data):
+            ma20 = pd.Series(moving_averages['ma100'].values, index=dates)  # 20주 이평선
+            ma80 = pd.Series(moving_averages['ma400'].values, index=dates)  # 80주 이평선
+        else:
+            ma20 = history_data.rolling(window=MA_WINDOWS['ma100']).mean()  # 20주 이평선
+            ma80 = history_data.rolling(window=MA_WINDOWS['ma400']).mean()  # 80주 이평선
         
         # Y축 범위 계산 (최솟값, 최댓값) - 이동평균선 포함
         all_values = pd.concat([history_data, ma20, ma80]).dropna()
@@ -891,15 +3088,17 @@ def create_sparkline_chart(history_data, change_pct, ticker_name):
         
         # 전체 폭의 5% 여유 추가 (상단과 하단 각각 2.5%)
         padding = value_range * 0.025 if value_range > 0 else abs(min_value) * 0.025 if min_value != 0 else 1
-        y_min = min_value - padding
-        y_max = max_value + padding
+        y_range = [min_value - padding, max_value + padding]
         
-        fig = go.Figure()
+        # 카드 폭에 맞게 다운샘플링 (Y축 범위는 원본 기준으로 이미 계산됨)
+        close_points = _downsample_series(history_data, max_points)
+        ma20_points = _downsample_series(ma20.dropna(), max_points)
+        ma80_points = _downsample_series(ma80.dropna(), max_points)
         
         # 영역 차트 추가
-        fig.add_trace(go.Scatter(
-            x=dates,
-            y=history_data.values,
+        traces.append(go.Scatter(
+            x=close_points.index,
+            y=close_points.values,
             fill='tozeroy',
             mode='lines',
             line=dict(color=line_color, width=2),
@@ -910,10 +3109,10 @@ def create_sparkline_chart(history_data, change_pct, ticker_name):
         ))
         
         # 20주 이평선 추가 (주황색)
-        if not ma20.isna().all():
-            fig.add_trace(go.Scatter(
-                x=dates,
-                y=ma20.values,
+        if not ma20_points.empty:
+            traces.append(go.Scatter(
+                x=ma20_points.index,
+                y=ma20_points.values,
                 mode='lines',
                 line=dict(color='#ff8c00', width=1.5),
                 hovertemplate='20주 이평: %{y:.2f}<extra></extra>',
@@ -922,10 +3121,10 @@ def create_sparkline_chart(history_data, change_pct, ticker_name):
             ))
         
         # 80주 이평선 추가 (초록색)
-        if not ma80.isna().all():
-            fig.add_trace(go.Scatter(
-                x=dates,
-                y=ma80.values,
+        if not ma80_points.empty:
+            traces.append(go.Scatter(
+                x=ma80_points.index,
+                y=ma80_points.values,
                 mode='lines',
                 line=dict(color='#22c55e', width=1.5),
                 hovertemplate='80주 이평: %{y:.2f}<extra></extra>',
@@ -933,9 +3132,6 @@ def create_sparkline_chart(history_data, change_pct, ticker_name):
                 name='80주 이평'
             ))
         
-        # Y축 범위 설정
-        fig.update_yaxes(range=[y_min, y_max])
-        
         # 연도 틱 위치 계산 (데이터 범위에서 연도별로)
         try:
             # 데이터의 첫 번째와 마지막 연도 추출
@@ -994,6 +3190,22 @@ def create_sparkline_chart(history_data, change_pct, ticker_name):
                 tickangle=0
             )
     
+    return traces, y_range, xaxis_config
+
+def create_sparkline_chart(history_data, change_pct, ticker_name, max_points=SPARKLINE_MAX_POINTS,
+                           moving_averages=None):
+    """Sparkline 스타일의 영역 차트 생성"""
+    traces, y_range, xaxis_config = _build_sparkline_parts(history_data, change_pct, ticker_name, max_points,
+                                                           moving_averages)
+    
+    fig = go.Figure()
+    for trace in traces:
+        fig.add_trace(trace)
+    
+    # Y축 범위 설정
+    if y_range is not None:
+        fig.update_yaxes(range=y_range)
+    
     # Sparkline 스타일: 최소한의 축 정보 (x축에 연도만 표시)
     fig.update_layout(
         height=120,
@@ -1011,19 +3223,138 @@ def create_sparkline_chart(history_data, change_pct, ticker_name):
     
     return fig
 
-def render_ticker_card(name, symbol, ticker_data):
-    """개별 티커 카드 렌더링"""
+SPARKLINE_FIGURE_CACHE_SIZE = 2000  # 카드 수 x 조회 기간 조합을 넉넉히 담는 크기
+
+@st.cache_resource(max_entries=SPARKLINE_FIGURE_CACHE_SIZE, show_spinner=False)
+def _cached_sparkline_figure(symbol, period, last_bar, last_close, change_pct, ticker_name, _history,
+                             _moving_averages=None):
+    """완성된 Sparkline figure를 (심볼, 기간, 마지막 봉 시각, 마지막 종가)로 캐시 (세션 간 공유)"""
+    return create_sparkline_chart(_history, change_pct, ticker_name, moving_averages=_moving_averages)
+
+def get_sparkline_figure(symbol, period, last_bar, last_close, change_pct, ticker_name, _history,
+                         _moving_averages=None):
+    """캐시된 Sparkline figure의 사본 반환
+
+    키가 같으면 이동평균/다운샘플링/연도 틱 계산 없이 재사용하고,
+    figure는 변경 가능한 객체라 세션끼리 같은 객체를 나눠 쓰지 않도록 사본을 돌려줌
+    """
+    return go.Figure(_cached_sparkline_figure(symbol, period, last_bar, last_close, change_pct, ticker_name,
+                                              _history, _moving_averages))
+
+GRID_NUM_COLUMNS = 3
+GRID_ROW_HEIGHT_PX = 120     # 서브플롯 하나의 차트 높이 (개별 카드 차트와 동일)
+GRID_ROW_GAP_PX = 70         # 행 사이 간격 (이름/가격 주석과 연도 틱이 들어갈 자리)
+GRID_FIGURE_CACHE_SIZE = 200
+
+def _format_price(current_value):
+    """가격 포맷팅 (소수점 자리수 조정)"""
+    if abs(current_value) < 1:
+        return f"{current_value:.4f}"
+    elif abs(current_value) < 100:
+        return f"{current_value:.2f}"
+    return f"{current_value:,.2f}"
+
+def create_category_grid_figure(entries, num_columns=GRID_NUM_COLUMNS):
+    """카테고리 하나의 티커들을 서브플롯 그리드 figure 하나로 생성 (컴팩트 그리드 모드)
+
+    entries: [(티커 이름, ticker_data)] 표시 순서대로
+    티커 이름/현재가/등락율은 각 서브플롯 위 주석으로 표시
+    """
+    num_rows = max(1, -(-len(entries) // num_columns))
+    height = num_rows * GRID_ROW_HEIGHT_PX + num_rows * GRID_ROW_GAP_PX
+    vertical_spacing = GRID_ROW_GAP_PX / height if num_rows > 1 else 0
+    
+    fig = plotly_subplots.make_subplots(
+        rows=num_rows, cols=num_columns,
+        horizontal_spacing=0.04, vertical_spacing=vertical_spacing
+    )
+    
+    for idx, (name, ticker_data) in enumerate(entries):
+        row, col = idx // num_columns + 1, idx % num_columns + 1
+        axis_suffix = '' if idx == 0 else str(idx + 1)
+        history = ticker_data['history']
+        change_value = ticker_data['change_pct']
+        
+        traces, y_range, xaxis_config = _build_sparkline_parts(
+            history, change_value, name, moving_averages=ticker_data.get('moving_averages')
+        )
+        for trace in traces:
+            fig.add_trace(trace, row=row, col=col)
+        fig.update_xaxes(row=row, col=col, **xaxis_config)
+        fig.update_yaxes(row=row, col=col, showgrid=False, showticklabels=False, zeroline=False,
+                         **({'range': y_range} if y_range is not None else {}))
+        
+        # 서브플롯 위 주석: 왼쪽에 이름, 오른쪽에 현재가와 등락율
+        title = f"<b>{name}</b>" + (" 🔄" if ticker_data.get('refreshing') else "")
+        change_color = '#ef4444' if change_value >= 0 else '#3b82f6'
+        annotation_ref = dict(xref=f"x{axis_suffix} domain", yref=f"y{axis_suffix} domain",
+                              y=1.02, yanchor='bottom', showarrow=False)
+        fig.add_annotation(text=title, x=0, xanchor='left', font=dict(size=14), **annotation_ref)
+        if history.empty:
+            no_data_text = "데이터 없음"
+            if ticker_data.get('retry_at') is not None:
+                no_data_text += f" · {_format_retry_time(ticker_data['retry_at'])} 재시도"
+            fig.add_annotation(text=no_data_text, x=0.5, y=0.5, xanchor='center', yanchor='middle',
+                               xref=f"x{axis_suffix} domain", yref=f"y{axis_suffix} domain",
+                               showarrow=False, font=dict(size=12, color='#888'))
+        else:
+            fig.add_annotation(
+                text=(f"<b>{_format_price(ticker_data['current'])}</b>  "
+                      f"<span style='color:{change_color}'>{change_value:+.2f}%</span>"),
+                x=1, xanchor='right', font=dict(size=13), **annotation_ref
+            )
+    
+    # 빈 칸의 축은 숨김
+    for idx in range(len(entries), num_rows * num_columns):
+        row, col = idx // num_columns + 1, idx % num_columns + 1
+        fig.update_xaxes(row=row, col=col, visible=False)
+        fig.update_yaxes(row=row, col=col, visible=False)
+    
+    fig.update_layout(
+        height=height,
+        margin=dict(l=0, r=0, t=30, b=25),
+        showlegend=False,
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        hovermode='x unified'
+    )
+    return fig
+
+def _format_retry_time(retry_at):
+    """음성 캐시 재시도 시각을 KST HH:MM으로 표시"""
+    return datetime.fromtimestamp(retry_at, pytz.timezone('Asia/Seoul')).strftime('%H:%M')
+
+@st.cache_resource(max_entries=GRID_FIGURE_CACHE_SIZE, show_spinner=False)
+def _cached_category_grid_figure(category, period, signature, _entries):
+    """카테고리 그리드 figure를 (카테고리, 기간, 티커별 마지막 봉/종가 서명)으로 캐시"""
+    return create_category_grid_figure(_entries)
+
+def get_category_grid_figure(category, period, signature, _entries):
+    """캐시된 카테고리 그리드 figure의 사본 반환 (세션끼리 같은 객체를 나눠 쓰지 않도록)"""
+    return go.Figure(_cached_category_grid_figure(category, period, signature, _entries))
+
+def render_category_grid(category, entries, period):
+    """카테고리 하나를 그리드 figure 하나로 렌더링 (카드별 차트 대신 차트 1개)"""
+    signature = tuple(
+        (name, ticker_data['history'].index[-1] if not ticker_data['history'].empty else None,
+         float(ticker_data['current']), float(ticker_data['change_pct']),
+         bool(ticker_data.get('refreshing')), ticker_data.get('retry_at'))
+        for name, ticker_data in entries
+    )
+    fig = get_category_grid_figure(category, period, signature, entries)
+    st.plotly_chart(fig, width='stretch', config={'displayModeBar': False}, key=f"grid-{category}")
+
+def render_ticker_card(category, name, symbol, ticker_data, period):
+    """개별 티커 카드 렌더링
+
+    차트 위젯 키는 (카테고리, 이름)으로 만들어 같은 심볼이 여러 카테고리에 있어도 요소 ID가 겹치지 않게 함
+    """
     # 숫자 포맷팅
     current_value = ticker_data['current']
     change_value = ticker_data['change_pct']
     
     # 가격 포맷팅 (소수점 자리수 조정)
-    if abs(current_value) < 1:
-        current_str = f"{current_value:.4f}"
-    elif abs(current_value) < 100:
-        current_str = f"{current_value:.2f}"
-    else:
-        current_str = f"{current_value:,.2f}"
+    current_str = _format_price(current_value)
     
     # 등락율 포맷팅
     change_str = f"{change_value:+.2f}%"
@@ -1032,7 +3363,11 @@ def render_ticker_card(name, symbol, ticker_data):
     with st.container():
         # 지표 이름
         st.markdown(f"### {name}")
-        
+
+        # 만료된 데이터를 보여주는 동안 백그라운드 갱신 중임을 표시
+        if ticker_data.get('refreshing'):
+            st.caption("🔄 갱신 중...")
+
         # 현재가와 등락율 표시
         col_price, col_change = st.columns([2, 1])
         with col_price:
@@ -1045,29 +3380,86 @@ def render_ticker_card(name, symbol, ticker_data):
                 st.markdown(f'<span style="color: #3b82f6;">{change_str}</span>', unsafe_allow_html=True)
         
         # Sparkline 차트
-        if not ticker_data['history'].empty:
-            fig = create_sparkline_chart(ticker_data['history'], change_value, name)
-            st.plotly_chart(fig, width='stretch', config={'displayModeBar': False})
+        history = ticker_data['history']
+        if not history.empty:
+            fig = get_sparkline_figure(
+                symbol, period, history.index[-1], float(history.iloc[-1]),
+                float(change_value), name, history, ticker_data.get('moving_averages')
+            )
+            st.plotly_chart(fig, width='stretch', config={'displayModeBar': False}, key=f"card-{category}-{name}")
+        elif ticker_data.get('retry_at') is not None:
+            st.info(f"데이터 없음 · {_format_retry_time(ticker_data['retry_at'])} 재시도")
         else:
             st.info("데이터 없음")
 
+def render_category_section(category, ticker_list, tickers, category_data, period, live=False):
+    """카테고리 하나의 카드(또는 컴팩트 그리드) 렌더링
+
+    히스토리 결과에 최신 시세를 합쳐서 그림 (시세 캐시가 비어 있으면 기다리지 않고 히스토리 값으로 그림)
+    live가 True면 시세 캐시 대신 실시간 시세 사용 (fragment 재실행마다 시세만 새로 요청)
+    """
+    symbols = [tickers[name] for name in ticker_list if category_data.get(name)]
+    quotes = get_live_quotes(symbols) if live else get_ticker_quotes(symbols, wait=False)
+    category_data = {
+        name: apply_quote(ticker_data, quotes.get(tickers[name])) if ticker_data else ticker_data
+        for name, ticker_data in category_data.items()
+    }
+    if live:
+        kst = pytz.timezone('Asia/Seoul')
+        st.caption(f"⚡ {datetime.now(kst).strftime('%H:%M:%S')} 시세 기준 ({len(quotes)}/{len(ticker_list)}개)")
+
+    # 컴팩트 그리드 모드: 카테고리 전체를 figure 하나로 표시
+    if st.session_state.get('compact_grid'):
+        entries = [(name, category_data[name]) for name in ticker_list if category_data.get(name)]
+        if entries:
+            render_category_grid(category, entries, period)
+        return
+
+    # 3열 그리드 레이아웃
+    num_columns = GRID_NUM_COLUMNS
+    for i in range(0, len(ticker_list), num_columns):
+        cols = st.columns(num_columns)
+
+        for j, col in enumerate(cols):
+            idx = i + j
+            if idx < len(ticker_list):
+                ticker_name = ticker_list[idx]
+                ticker_data = category_data.get(ticker_name)
+                if ticker_data:
+                    with col:
+                        render_ticker_card(category, ticker_name, tickers[ticker_name], ticker_data, period)
+
+def render_save_status(polling=False):
+    """이 세션의 관심 종목 저장 상태 표시 (저장 안 된 변경 / 재시도 중 / 다른 세션에 덮임 / 저장 완료)
+
+    polling: 저장 대기 중이라 주기적으로 다시 그리는 중인지 여부
+    run_every는 전체 실행 때 정해지므로, 저장이 끝나면 앱을 한 번 다시 실행해 주기 실행을 멈춤
+    """
+    status = get_watchlist_save_queue().status(_current_session_id())
+    if polling and not status['pending']:
+        st.rerun(scope="app")
+    if status['pending'] and status['last_error']:
+        st.warning(f"⚠️ 저장 실패, {status['due_in']:.0f}초 후 재시도 ({status['attempts']}회 실패): {status['last_error']}")
+    elif status['pending']:
+        st.caption("💾 저장되지 않은 변경 사항이 있습니다 (잠시 후 자동 저장)")
+    elif status['superseded']:
+        st.warning("⚠️ 다른 세션에서 나중에 저장한 내용이 이 세션의 변경 사항을 덮어썼습니다 (마지막 저장이 적용됨). 새로고침하면 현재 시트 내용을 불러옵니다.")
+    elif status['saved_at'] is not None:
+        saved_at = datetime.fromtimestamp(status['saved_at'], pytz.timezone('Asia/Seoul')).strftime('%H:%M:%S')
+        st.caption(f"✅ 모든 변경 사항 저장됨 ({saved_at})")
+
 # 사이드바 관리 기능
 def render_sidebar():
     """사이드바에 카테고리/티커 관리 UI 렌더링"""
     with st.sidebar:
         st.header("⚙️ 설정")
         
+        # 관심 종목 저장 상태 (저장 대기 중이면 2초마다 이 부분만 다시 그림)
+        save_status = get_watchlist_save_queue().status(_current_session_id())
+        st.fragment(run_every=2 if save_status['pending'] else None)(render_save_status)(save_status['pending'])
+        
         # 조회 기간 설정
-        period_options = {
-            "1개월": "1mo",
-            "6개월": "6mo",
-            "1년": "1y",
-            "2년": "2y",
-            "5년": "5y",
-            "10년": "10y",
-            "15년": "15y",
-            "20년": "20y"
-        }
+        period_options = PERIOD_OPTIONS
         
         # 기본값 설정 (첫 실행 시 5년)
         if 'selected_period' not in st.session_state:
@@ -1084,6 +3476,28 @@ def render_sidebar():
         )
         st.session_state.selected_period = period_options[selected_period_label]
         
+        # 컴팩트 그리드: 카테고리마다 Plotly 차트 하나로 그려 브라우저 렌더링 부담을 줄임
+        st.toggle(
+            "🧩 컴팩트 그리드 모드",
+            key='compact_grid',
+            help="카테고리별로 차트 하나에 모든 티커를 그립니다. 티커가 많을 때 화면이 더 빨리 그려집니다."
+        )
+
+        # 실시간 모드: 카테고리별로 시세만 주기적으로 받아 가격/등락율과 마지막 봉을 갱신 (페이지 전체는 다시 실행하지 않음)
+        st.toggle(
+            "⚡ 실시간 모드",
+            key='live_mode',
+            help="선택한 주기마다 최신 시세만 받아 카드의 가격과 차트 마지막 점을 갱신합니다."
+        )
+        if st.session_state.get('live_mode'):
+            st.selectbox(
+                "갱신 주기",
+                options=LIVE_REFRESH_OPTIONS,
+                index=1,
+                format_func=lambda seconds: f"{seconds}초",
+                key='live_interval'
+            )
+        
         st.markdown("---")
         
         # 카테고리 관리 섹션
@@ -1102,7 +3516,7 @@ def render_sidebar():
                         # 티커 순서 초기화
                         if new_category not in st.session_state.ticker_order:
                             st.session_state.ticker_order[new_category] = []
-                        save_data()
+                        queue_save()
                         st.rerun()
                     else:
                         st.warning("이미 존재하는 카테고리입니다.")
@@ -1128,7 +3542,7 @@ def render_sidebar():
                             del st.session_state.ticker_order[category_to_delete]
                         # 캐시 클리어
                         st.cache_data.clear()
-                        save_data()
+                        queue_save()
                         st.rerun()
             else:
                 st.info("삭제할 카테고리가 없습니다.")
@@ -1161,7 +3575,7 @@ def render_sidebar():
                         if selected_category not in st.session_state.ticker_order:
                             st.session_state.ticker_order[selected_category] = []
                         st.session_state.ticker_order[selected_category].append(ticker_name)
-                        save_data()
+                        queue_save()
                         st.rerun()
                     else:
                         st.warning("이미 존재하는 티커 이름입니다.")
@@ -1193,7 +3607,7 @@ def render_sidebar():
                                                 st.session_state.ticker_order[category].remove(ticker_name)
                                         # 캐시 클리어 (선택적)
                                         st.cache_data.clear()
-                                        save_data()
+                                        queue_save()
                                         st.rerun()
             else:
                 st.info("삭제할 티커가 없습니다.")
@@ -1245,7 +3659,7 @@ def render_sidebar():
                         idx = current_category_order.index(category_to_move_up)
                         current_category_order[idx], current_category_order[idx - 1] = current_category_order[idx - 1], current_category_order[idx]
                         st.session_state.category_order = current_category_order
-                        save_data()
+                        queue_save()
                         st.rerun()
                 
                 with col_down:
@@ -1258,7 +3672,7 @@ def render_sidebar():
                         idx = current_category_order.index(category_to_move_down)
                         current_category_order[idx], current_category_order[idx + 1] = current_category_order[idx + 1], current_category_order[idx]
                         st.session_state.category_order = current_category_order
-                        save_data()
+                        queue_save()
                         st.rerun()
             else:
                 st.info("순서를 변경할 카테고리가 없습니다.")
@@ -1305,7 +3719,7 @@ def render_sidebar():
                                 idx = current_order.index(ticker_to_move_up)
                                 current_order[idx], current_order[idx - 1] = current_order[idx - 1], current_order[idx]
                                 st.session_state.ticker_order[selected_category_for_order] = current_order
-                                save_data()
+                                queue_save()
                                 st.rerun()
                         
                         with col_down:
@@ -1318,7 +3732,7 @@ def render_sidebar():
                                 idx = current_order.index(ticker_to_move_down)
                                 current_order[idx], current_order[idx + 1] = current_order[idx + 1], current_order[idx]
                                 st.session_state.ticker_order[selected_category_for_order] = current_order
-                                save_data()
+                                queue_save()
                                 st.rerun()
                     else:
                         st.info("이 카테고리에 티커가 없습니다.")
@@ -1330,62 +3744,133 @@ def render_sidebar():
         # 디버깅 정보 섹션
         st.header("🔍 디버깅 정보")
         with st.expander("📊 데이터 소스 상태"):
+            # 상태 표시만으로 무거운 모듈 import나 클라이언트 생성이 일어나지 않도록 설치 여부만 확인
+            timings = get_lazy_load_timings()
+            tv_installed = any(importlib.util.find_spec(name) is not None for name in ('tvdatafeed', 'tvDatafeed'))
             st.write("**트레이딩뷰 상태:**")
-            st.write(f"- TV_AVAILABLE: `{TV_AVAILABLE}`")
-            st.write(f"- tv 객체: `{'초기화됨 ✅' if tv is not None else 'None ❌'}`")
+            st.write(f"- tvdatafeed 설치: `{tv_installed}`")
+            st.write(f"- tv 객체: `{'초기화됨 ✅' if 'TvDatafeed()' in timings else '아직 생성 안 됨 (첫 조회 시 생성)'}`")
             
-            # 트레이딩뷰 테스트 버튼
+            # 트레이딩뷰 테스트 버튼 (누르면 클라이언트 생성)
             if st.button("🔬 트레이딩뷰 테스트", key="test_tradingview_btn"):
-                if tv is not None and TV_AVAILABLE:
+                tv = get_tv_client()
+                if tv is not None:
                     try:
-                        interval_val = Interval.in_daily if hasattr(Interval, 'in_daily') and Interval.in_daily is not None else None
-                        if interval_val is None:
-                            st.warning("⚠️ Interval.in_daily를 사용할 수 없습니다")
+                        test_df = tv.get_hist(
+                            symbol='KR10Y',
+                            exchange='TVC',
+                            interval=get_tvdatafeed().Interval.in_daily,
+                            n_bars=10
+                        )
+                        if test_df is not None and not test_df.empty:
+                            st.success(f"✅ 트레이딩뷰 작동 중! (데이터 {len(test_df)}행)")
+                            st.dataframe(test_df.head())
+                            st.write(f"**컬럼명:** {list(test_df.columns)}")
+                            st.write(f"**인덱스 타입:** {type(test_df.index)}")
                         else:
-                            test_df = tv.get_hist(
-                                symbol='KR10Y',
-                                exchange='TVC',
-                                interval=interval_val,
-                                n_bars=10
-                            )
-                            if test_df is not None and not test_df.empty:
-                                st.success(f"✅ 트레이딩뷰 작동 중! (데이터 {len(test_df)}행)")
-                                st.dataframe(test_df.head())
-                                st.write(f"**컬럼명:** {list(test_df.columns)}")
-                                st.write(f"**인덱스 타입:** {type(test_df.index)}")
-                            else:
-                                st.warning("⚠️ 데이터가 비어있습니다")
+                            st.warning("⚠️ 데이터가 비어있습니다")
                     except Exception as e:
                         st.error(f"❌ 오류: {str(e)}")
                         import traceback
                         st.code(traceback.format_exc())
                 else:
                     st.error("❌ tv 객체가 초기화되지 않았습니다")
-                    if not TV_AVAILABLE:
+                    if get_tvdatafeed() is None:
                         st.info("💡 tvdatafeed 모듈을 설치해야 합니다: `pip install git+https://github.com/rongardF/tvdatafeed.git`")
             
             st.write("---")
             st.write("**FinanceDataReader 상태:**")
-            try:
-                import FinanceDataReader as fdr
-                st.write("✅ FDR 사용 가능")
-            except ImportError:
+            if importlib.util.find_spec('FinanceDataReader') is not None:
+                st.write("✅ FDR 사용 가능" + (" (로드됨)" if 'FinanceDataReader' in sys.modules else ""))
+            else:
                 st.write("❌ FDR을 찾을 수 없습니다")
             
             st.write("**yfinance 상태:**")
-            try:
-                import yfinance as yf
-                st.write("✅ yfinance 사용 가능")
-            except ImportError:
+            if importlib.util.find_spec('yfinance') is not None:
+                st.write("✅ yfinance 사용 가능" + (" (로드됨)" if 'yfinance' in sys.modules else ""))
+            else:
                 st.write("❌ yfinance를 찾을 수 없습니다")
             
             st.write("---")
             st.write("**구글 시트 연결:**")
-            if gsheets_client is not None:
+            if get_gsheets_client() is not None:
                 st.write("✅ 연결됨")
             else:
                 st.write("❌ 연결 안 됨 (서비스 계정 설정 필요)")
 
+        with st.expander("🚀 지연 로딩"):
+            st.caption("무거운 모듈과 외부 클라이언트는 처음 사용할 때 로드됩니다 (프로세스당 한 번).")
+            timings = get_lazy_load_timings()
+            if timings:
+                st.dataframe(pd.DataFrame([
+                    {'대상': name, '소요(ms)': round(seconds * 1000, 1)}
+                    for name, seconds in sorted(timings.items(), key=lambda item: -item[1])
+                ]), hide_index=True)
+            else:
+                st.write("아직 로드된 항목이 없습니다.")
+
+        with st.expander("🔥 캐시 워머"):
+            warmer = get_cache_warmer()
+            if warmer is None:
+                st.write("꺼져 있습니다 (MACRO_CACHE_WARMER=0).")
+            elif not warmer.status():
+                st.write("아직 실행 기록이 없습니다.")
+            else:
+                st.caption(f"{CACHE_WARM_TICK}초마다 열려 있는 시장의 심볼을 캐시 만료 전에 미리 갱신합니다 "
+                           f"(접속한 세션이 {CACHE_WARM_IDLE_SECONDS // 60}분 동안 없으면 쉼).")
+                kst = pytz.timezone('Asia/Seoul')
+                st.dataframe(pd.DataFrame([
+                    {
+                        '시장': market,
+                        '상태': '🟢 개장' if status['open'] else '⚪ 휴장',
+                        '심볼': status['symbols'],
+                        '마지막 갱신': (datetime.fromtimestamp(status['warmed_at'], kst).strftime('%H:%M:%S')
+                                    if status['warmed_at'] else '-')
+                    }
+                    for market, status in sorted(warmer.status().items())
+                ]), hide_index=True)
+
+        with st.expander("⏱️ 데이터 소스 성능"):
+            metrics = get_provider_metrics()
+
+            st.write("**데이터 소스별 호출:**")
+            provider_rows = metrics.provider_table()
+            if provider_rows:
+                st.dataframe(pd.DataFrame(provider_rows), hide_index=True)
+            else:
+                st.write("아직 호출 기록이 없습니다.")
+
+            st.write("**서킷 브레이커:**")
+            st.dataframe(pd.DataFrame([
+                {
+                    '데이터 소스': name,
+                    '상태': {'closed': '✅ 정상', 'open': '⛔ 차단', 'half_open': '🧪 시험 중'}[status['state']],
+                    '연속 실패': status['failures'],
+                    '재시도까지(초)': round(status['retry_in']),
+                    '마지막 오류': status['last_error'] or ''
+                }
+                for name, status in ((name, guard.breaker.status()) for name, guard in get_provider_guards().items())
+            ]), hide_index=True)
+
+            st.write("**캐시 적중률:**")
+            cache_rows = metrics.cache_table()
+            if cache_rows:
+                st.dataframe(pd.DataFrame(cache_rows), hide_index=True)
+            else:
+                st.write("아직 캐시 조회 기록이 없습니다.")
+
+            st.write("**누적 지연 상위 심볼:**")
+            symbol_rows = metrics.top_symbols()
+            if symbol_rows:
+                st.dataframe(pd.DataFrame(symbol_rows), hide_index=True)
+            else:
+                st.write("아직 호출 기록이 없습니다.")
+
+            st.caption(f"Prometheus 메트릭 파일: `{METRICS_FILE_PATH}` ({METRICS_WRITE_INTERVAL}초마다 갱신)")
+            if st.button("💾 메트릭 파일 지금 기록", key="write_metrics_btn"):
+                if metrics.write_file(force=True):
+                    st.success("✅ 기록 완료")
+
 # 메인 대시보드
 def render_ticker_search_modal():
     """티커 검색기 모달 UI 렌더링"""
@@ -1467,6 +3952,11 @@ def render_ticker_search_modal():
                 st.rerun()
 
 def main():
+    # 캐시 워머 시작 (서버 프로세스당 한 번) 및 접속 중인 세션이 있음을 알림
+    warmer = get_cache_warmer()
+    if warmer is not None:
+        warmer.touch()
+    
     # 초기 데이터 설정
     init_market_data()
     
@@ -1482,11 +3972,7 @@ def main():
     # 마지막 업데이트 시간
     kst = pytz.timezone('Asia/Seoul')
     update_time = datetime.now(kst).strftime("%Y-%m-%d %H:%M:%S KST")
-    period_label = [k for k, v in {
-        "1개월": "1mo", "6개월": "6mo", "1년": "1y", 
-        "2년": "2y", "5년": "5y", "10년": "10y",
-        "15년": "15y", "20년": "20y"
-    }.items() if v == st.session_state.selected_period][0]
+    period_label = [k for k, v in PERIOD_OPTIONS.items() if v == st.session_state.selected_period][0]
     st.markdown(f'<p class="update-time">마지막 업데이트: {update_time} | 조회 기간: {period_label}</p>', unsafe_allow_html=True)
     
     st.markdown("---")
@@ -1501,15 +3987,11 @@ def main():
             for ticker_name, ticker_symbol in tickers.items():
                 all_ticker_data[(category, ticker_name)] = ticker_symbol
         
-        # 데이터 로딩
-        data = {}
+        # 데이터 로딩 (데이터 소스별로 동시에 요청)
         with st.spinner("데이터를 불러오는 중..."):
-            for (category, ticker_name), ticker_symbol in all_ticker_data.items():
-                data[(category, ticker_name)] = get_ticker_data(ticker_symbol, period=st.session_state.selected_period)
+            data = fetch_all_ticker_data(all_ticker_data, st.session_state.selected_period)
         
         # 카테고리별로 섹션 나누어 표시 (순서대로)
-        num_columns = 3
-        
         # 카테고리 순서에 따라 표시
         category_list = [cat for cat in st.session_state.category_order if cat in st.session_state.market_data]
         # 순서에 없는 카테고리 추가
@@ -1517,6 +3999,9 @@ def main():
             if cat not in category_list:
                 category_list.append(cat)
         
+        # 실시간 모드면 카테고리마다 fragment로 감싸 주기적으로 그 카테고리만 다시 그림
+        live_interval = st.session_state.get('live_interval', LIVE_REFRESH_OPTIONS[1]) if st.session_state.get('live_mode') else None
+        
         for category in category_list:
             tickers = st.session_state.market_data[category]
             if tickers:  # 티커가 있는 카테고리만 표시
@@ -1532,21 +4017,18 @@ def main():
                     if ticker_name not in ticker_list:
                         ticker_list.append(ticker_name)
                 
-                # 3열 그리드 레이아웃
-                for i in range(0, len(ticker_list), num_columns):
-                    cols = st.columns(num_columns)
-                    
-                    for j, col in enumerate(cols):
-                        idx = i + j
-                        if idx < len(ticker_list):
-                            ticker_name = ticker_list[idx]
-                            if ticker_name in tickers:  # 안전성 체크
-                                ticker_data = data.get((category, ticker_name))
-                                if ticker_data:
-                                    with col:
-                                        render_ticker_card(ticker_name, tickers[ticker_name], ticker_data)
+                category_data = {name: data.get((category, name)) for name in ticker_list}
+                if live_interval:
+                    st.fragment(run_every=live_interval)(render_category_section)(
+                        category, ticker_list, tickers, category_data, st.session_state.selected_period, live=True
+                    )
+                else:
+                    render_category_section(category, ticker_list, tickers, category_data, st.session_state.selected_period)
                 
                 st.markdown("---")
 
+    # 계측 결과를 Prometheus 텍스트 파일로 기록 (METRICS_WRITE_INTERVAL마다)
+    get_provider_metrics().write_file()
+
 if __name__ == "__main__":
     main()
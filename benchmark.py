@@ -0,0 +1,272 @@
+"""대시보드 파이프라인 벤치마크 (fetch → normalize → chart → render)
+
+가짜 데이터 소스(MACRO_FAKE_DATA=1)로 네트워크 없이 실행되며, 관심 종목 수와 조회 기간에 따라
+다음 구간의 콜드/웜 캐시 시간을 측정해 JSON 리포트로 저장합니다.
+
+- fetch: fetch_all_ticker_data (데이터 소스 호출 + 표준화 + 저장소 + 기간 슬라이스)
+- chart: create_sparkline_chart (카드 하나당 Plotly figure 생성)
+- rerun: Streamlit AppTest로 main() 전체 재실행
+
+마지막에 관심 종목 500개의 웜 재실행이 히스토리 캐시에서 모두 적중하는지 확인합니다 (미스가 있으면 실패).
+
+사용법:
+    python benchmark.py                              # 기본 매트릭스 (10/100/500개 x 1mo~20y)
+    python benchmark.py --tickers 10,100 --periods 1y,20y --repeat 5
+    python benchmark.py --baseline benchmark_results.json --output new.json   # 이전 결과와 비교
+    MACRO_FAKE_LATENCY_MS=50 python benchmark.py     # 데이터 소스 지연 흉내
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+# app import 전에 가짜 데이터 소스와 격리된 히스토리 저장소 설정
+os.environ.setdefault('MACRO_FAKE_DATA', '1')
+os.environ.setdefault('MACRO_CACHE_WARMER', '0')  # 백그라운드 갱신이 측정에 섞이지 않도록
+os.environ.setdefault('MACRO_FETCH_TIMEOUT', '600')  # 렌더링 시간 제한에 걸려 콜드 측정이 잘리지 않도록
+BENCH_DIR = tempfile.mkdtemp(prefix='macro-bench-')
+os.environ['MACRO_HISTORY_DB'] = os.path.join(BENCH_DIR, 'price_history.sqlite')
+
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+sys.path.insert(0, os.path.dirname(APP_PATH))
+
+# bare mode 경고(ScriptRunContext 없음 등)는 측정과 무관하므로 숨김
+logging.getLogger('streamlit').setLevel(logging.ERROR)
+
+import app  # noqa: E402
+
+DEFAULT_TICKER_COUNTS = [10, 100, 500]
+DEFAULT_PERIODS = list(app.PERIOD_OPTIONS.values())
+TICKERS_PER_CATEGORY = 10
+REGRESSION_THRESHOLD = 0.2  # 기준 대비 20% 이상 느려지면 회귀로 표시
+WARM_HIT_CHECK_TICKERS = 500  # 웜 캐시 적중 확인에 쓰는 관심 종목 수 (히스토리 캐시 상한보다 많게)
+
+def make_watchlist(n_tickers):
+    """n개 합성 티커로 market_data/category_order/ticker_order 구성"""
+    market_data = {}
+    for i in range(n_tickers):
+        category = f"카테고리 {i // TICKERS_PER_CATEGORY + 1:03d}"
+        market_data.setdefault(category, {})[f"티커 {i:04d}"] = f"FAKE:BENCH{i:04d}"
+    category_order = list(market_data.keys())
+    ticker_order = {category: list(tickers.keys()) for category, tickers in market_data.items()}
+    return market_data, category_order, ticker_order
+
+def reset_caches():
+    """콜드 측정을 위해 Streamlit 캐시와 히스토리 저장소 초기화"""
+    st.cache_data.clear()
+    st.cache_resource.clear()
+    if os.path.exists(app.HISTORY_DB_PATH):
+        os.remove(app.HISTORY_DB_PATH)
+    for suffix in ('-wal', '-shm'):
+        if os.path.exists(app.HISTORY_DB_PATH + suffix):
+            os.remove(app.HISTORY_DB_PATH + suffix)
+
+def _timed(fn):
+    """fn 실행 시간(초)과 결과 반환"""
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+def make_ticker_data(n_tickers):
+    """fetch_all_ticker_data 입력 ({(category, ticker_name): ticker_symbol}) 구성"""
+    market_data, _, _ = make_watchlist(n_tickers)
+    return {
+        (category, name): symbol
+        for category, tickers in market_data.items()
+        for name, symbol in tickers.items()
+    }
+
+def bench_fetch(n_tickers, period, repeat):
+    """fetch_all_ticker_data 콜드/웜 시간"""
+    all_ticker_data = make_ticker_data(n_tickers)
+
+    cold = []
+    warm = []
+    for _ in range(repeat):
+        reset_caches()
+        elapsed, _ = _timed(lambda: app.fetch_all_ticker_data(all_ticker_data, period))
+        cold.append(elapsed)
+        elapsed, data = _timed(lambda: app.fetch_all_ticker_data(all_ticker_data, period))
+        warm.append(elapsed)
+    return cold, warm, data
+
+def bench_chart(data, period, repeat):
+    """create_sparkline_chart 카드당 시간 (같은 데이터로 반복 측정)"""
+    samples = []
+    for _ in range(repeat):
+        elapsed, _ = _timed(lambda: [
+            app.create_sparkline_chart(ticker_data['history'], ticker_data['change_pct'], name,
+                                       moving_averages=ticker_data.get('moving_averages'))
+            for (_, name), ticker_data in data.items()
+        ])
+        samples.append(elapsed / max(len(data), 1))
+    return samples
+
+def bench_rerun(n_tickers, period, repeat):
+    """AppTest로 main() 전체 실행 콜드/웜 시간"""
+    market_data, category_order, ticker_order = make_watchlist(n_tickers)
+
+    cold = []
+    warm = []
+    for _ in range(repeat):
+        reset_caches()
+        at = AppTest.from_file(APP_PATH, default_timeout=600)
+        at.session_state['market_data'] = market_data
+        at.session_state['category_order'] = category_order
+        at.session_state['ticker_order'] = ticker_order
+        at.session_state['selected_period'] = period
+
+        elapsed, _ = _timed(at.run)
+        if at.exception:
+            raise RuntimeError(f"AppTest 실행 오류: {at.exception[0].value}")
+        cold.append(elapsed)
+
+        elapsed, _ = _timed(at.run)
+        warm.append(elapsed)
+    return cold, warm
+
+def _history_cache_misses():
+    """히스토리 캐시(심볼별 'ticker' 키) 미스 누적 횟수"""
+    for row in app.get_provider_metrics().cache_table():
+        if row['캐시'] == 'ticker':
+            return row['미스']
+    return 0
+
+def check_warm_hits(n_tickers=WARM_HIT_CHECK_TICKERS, period='1y'):
+    """콜드 실행 직후 웜 재실행이 히스토리 캐시에서 모두 적중하는지 확인
+
+    반환값: 웜 재실행의 미스 수 (0이어야 함, 캐시 상한이 관심 종목보다 작으면 매번 서로 밀어냄)
+    """
+    all_ticker_data = make_ticker_data(n_tickers)
+    reset_caches()
+    app.fetch_all_ticker_data(all_ticker_data, period)
+    before = _history_cache_misses()
+    app.fetch_all_ticker_data(all_ticker_data, period)
+    return _history_cache_misses() - before
+
+def _record(results, stage, n_tickers, period, cache, samples):
+    """측정값을 리포트 항목으로 추가"""
+    results.append({
+        'stage': stage,
+        'tickers': n_tickers,
+        'period': period,
+        'cache': cache,
+        'median_s': statistics.median(samples),
+        'min_s': min(samples),
+        'samples': len(samples)
+    })
+
+def run_benchmarks(ticker_counts, periods, repeat, stages):
+    """전체 매트릭스 실행"""
+    results = []
+    for n_tickers in ticker_counts:
+        for period in periods:
+            label = f"{n_tickers:>4}개 / {period:>4}"
+            if 'fetch' in stages or 'chart' in stages:
+                cold, warm, data = bench_fetch(n_tickers, period, repeat)
+                if 'fetch' in stages:
+                    _record(results, 'fetch', n_tickers, period, 'cold', cold)
+                    _record(results, 'fetch', n_tickers, period, 'warm', warm)
+                if 'chart' in stages:
+                    _record(results, 'chart_per_card', n_tickers, period, 'warm', bench_chart(data, period, repeat))
+            if 'rerun' in stages:
+                cold, warm = bench_rerun(n_tickers, period, repeat)
+                _record(results, 'rerun', n_tickers, period, 'cold', cold)
+                _record(results, 'rerun', n_tickers, period, 'warm', warm)
+            print(f"[Bench] {label} 완료", file=sys.stderr)
+    return results
+
+def _result_key(entry):
+    return (entry['stage'], entry['tickers'], entry['period'], entry['cache'])
+
+def print_report(results, baseline=None):
+    """결과 표 출력 (기준 결과가 있으면 비율과 회귀 여부 포함)
+
+    반환값: 회귀 항목 수
+    """
+    baseline_map = {_result_key(entry): entry for entry in (baseline or [])}
+    regressions = 0
+
+    header = f"{'stage':<16}{'tickers':>8}{'period':>8}{'cache':>7}{'median(ms)':>13}{'min(ms)':>11}"
+    if baseline_map:
+        header += f"{'base(ms)':>11}{'ratio':>8}"
+    print(header)
+    print('-' * len(header))
+
+    for entry in results:
+        line = (f"{entry['stage']:<16}{entry['tickers']:>8}{entry['period']:>8}{entry['cache']:>7}"
+                f"{entry['median_s'] * 1000:>13.2f}{entry['min_s'] * 1000:>11.2f}")
+        base = baseline_map.get(_result_key(entry))
+        if base is not None and base['median_s'] > 0:
+            ratio = entry['median_s'] / base['median_s']
+            line += f"{base['median_s'] * 1000:>11.2f}{ratio:>8.2f}"
+            if ratio > 1 + REGRESSION_THRESHOLD:
+                line += "  ⚠️ 회귀"
+                regressions += 1
+        print(line)
+
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="대시보드 파이프라인 벤치마크")
+    parser.add_argument('--tickers', default=','.join(str(n) for n in DEFAULT_TICKER_COUNTS),
+                        help="관심 종목 수 목록 (쉼표 구분)")
+    parser.add_argument('--periods', default=','.join(DEFAULT_PERIODS),
+                        help="조회 기간 목록 (쉼표 구분, 예: 1mo,1y,20y)")
+    parser.add_argument('--stages', default='fetch,chart,rerun',
+                        help="측정 구간 (fetch, chart, rerun 중 쉼표 구분)")
+    parser.add_argument('--repeat', type=int, default=3, help="구간별 반복 횟수")
+    parser.add_argument('--output', default='benchmark_results.json', help="결과 JSON 경로")
+    parser.add_argument('--baseline', default=None, help="비교할 이전 결과 JSON 경로")
+    args = parser.parse_args()
+
+    ticker_counts = [int(n) for n in args.tickers.split(',') if n]
+    periods = [p for p in args.periods.split(',') if p]
+    stages = {s for s in args.stages.split(',') if s}
+
+    try:
+        results = run_benchmarks(ticker_counts, periods, args.repeat, stages)
+        warm_misses = check_warm_hits()
+    finally:
+        shutil.rmtree(BENCH_DIR, ignore_errors=True)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+
+    regressions = print_report(results, baseline)
+
+    report = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'fake_latency_ms': os.environ.get('MACRO_FAKE_LATENCY_MS', '0'),
+        'repeat': args.repeat,
+        'results': results
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n결과 저장: {args.output}")
+
+    print(f"웜 캐시 확인 ({WARM_HIT_CHECK_TICKERS}개): 히스토리 캐시 미스 {warm_misses}개")
+
+    if warm_misses:
+        print(f"⚠️ 웜 재실행에서 히스토리 캐시 미스 {warm_misses}개 (캐시 상한이 관심 종목 수보다 작음)")
+    if regressions:
+        print(f"⚠️ 기준 대비 {int(REGRESSION_THRESHOLD * 100)}% 이상 느려진 항목: {regressions}개")
+    if warm_misses or regressions:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()